@@ -2,6 +2,8 @@ from PyQt6.QtWidgets import *
 from PyQt6.QtGui import *
 from PyQt6.QtCore import *
 from modules.planejamento.utilidades_planejamento import DatabaseManager, carregar_dados_pregao
+from modules.dispensa_eletronica.connection_manager import get_connection_manager
+from modules.dispensa_eletronica.reference_data import OMRegistry, importar_controle_om
 from diretorios import *
 from datetime import datetime
 import sqlite3
@@ -14,6 +16,7 @@ class AddItemDialog(QDialog):
         self.setWindowTitle("Adicionar Item")
         self.setFixedSize(900, 250)
         self.database_manager = DatabaseManager(self.database_path)
+        self.connection_manager = get_connection_manager(self.database_path)
         self.layout = QVBoxLayout(self)
         self.setup_ui()
         self.load_sigla_om()
@@ -99,16 +102,15 @@ class AddItemDialog(QDialog):
     def check_id_exists(self):
         id_processo = f"{self.tipo_cb.currentText()} {self.numero_le.text()}/{self.ano_le.text()}"
         query = f"SELECT COUNT(*) FROM controle_dispensas WHERE id_processo = ?"
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        cursor.execute(query, (id_processo,))
-        exists = cursor.fetchone()[0] > 0
-        conn.close()
+        with self.connection_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, (id_processo,))
+            exists = cursor.fetchone()[0] > 0
         return exists
 
     def load_next_numero(self):
         try:
-            with sqlite3.connect(self.database_path) as conn:
+            with self.connection_manager.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute("SELECT MAX(numero) FROM controle_dispensas")
                 max_number = cursor.fetchone()[0]
@@ -152,32 +154,27 @@ class AddItemDialog(QDialog):
         return data
 
     def import_uasg_to_db(self, filepath):
-        # Ler os dados do arquivo Excel
+        # Ler os dados do arquivo Excel e gravar apenas as diferenças na controle_om
         df = pd.read_excel(filepath, usecols=['uasg', 'orgao_responsavel', 'sigla_om'])
-        
-        # Conectar ao banco de dados e criar a tabela se não existir
-        with sqlite3.connect(self.database_path) as conn:
-            df.to_sql('controle_om', conn, if_exists='replace', index=False)  # Use 'replace' para substituir ou 'append' para adicionar
+        importar_controle_om(self.connection_manager, df)
 
     def load_sigla_om(self):
         try:
-            with sqlite3.connect(self.database_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT DISTINCT sigla_om, orgao_responsavel, uasg FROM controle_om ORDER BY sigla_om")
-                self.om_details = {}
-                self.sigla_om_cb.clear()
-                ceimbra_found = False  # Variável para verificar se CeIMBra está presente
-                default_index = 0  # Índice padrão se CeIMBra não for encontrado
-
-                for index, row in enumerate(cursor.fetchall()):
-                    sigla, orgao, uasg = row
-                    self.sigla_om_cb.addItem(sigla)
-                    self.om_details[sigla] = {"orgao_responsavel": orgao, "uasg": uasg}
-                    if sigla == "CeIMBra":
-                        ceimbra_found = True
-                        default_index = index  # Atualiza o índice para CeIMBra se encontrado
-
-                if ceimbra_found:
-                    self.sigla_om_cb.setCurrentIndex(default_index)  # Define CeIMBra como valor padrão
+            # Lista de OMs vem do cache em memória; o banco só é lido quando a controle_om muda
+            registry = OMRegistry.instance(self.connection_manager)
+            self.om_details = {}
+            self.sigla_om_cb.clear()
+            ceimbra_found = False  # Variável para verificar se CeIMBra está presente
+            default_index = 0  # Índice padrão se CeIMBra não for encontrado
+
+            for index, sigla in enumerate(registry.siglas()):
+                self.sigla_om_cb.addItem(sigla)
+                self.om_details[sigla] = registry.por_sigla(sigla)
+                if sigla == "CeIMBra":
+                    ceimbra_found = True
+                    default_index = index  # Atualiza o índice para CeIMBra se encontrado
+
+            if ceimbra_found:
+                self.sigla_om_cb.setCurrentIndex(default_index)  # Define CeIMBra como valor padrão
         except Exception as e:
             print(f"Erro ao carregar siglas de OM: {e}")
\ No newline at end of file
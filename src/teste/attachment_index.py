@@ -0,0 +1,304 @@
+import os
+import threading
+from pathlib import Path
+
+import fitz
+from PyQt6.QtCore import *
+
+from modules.dispensa_eletronica.document_context import SUBPASTAS_ANEXOS, id_da_pasta_processo
+
+TABELA_ANEXOS = "indice_anexos"
+
+
+def garantir_tabela_anexos(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABELA_ANEXOS} (
+            pasta TEXT PRIMARY KEY,
+            id_processo TEXT,
+            slot TEXT,
+            pasta_mtime_ns INTEGER,
+            arquivo TEXT,
+            tamanho INTEGER,
+            mtime_ns INTEGER,
+            paginas INTEGER
+        )
+    """)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {TABELA_ANEXOS}_processo ON {TABELA_ANEXOS}(id_processo, slot)")
+
+
+# Último PDF de uma pasta de anexo. arquivo é None quando a pasta existe mas não tem PDF
+class AnexoIndexado:
+    def __init__(self, pasta, id_processo, slot, pasta_mtime_ns, arquivo=None, tamanho=None, mtime_ns=None, paginas=None):
+        self.pasta = pasta
+        self.id_processo = id_processo
+        self.slot = slot
+        self.pasta_mtime_ns = pasta_mtime_ns
+        self.arquivo = Path(arquivo) if arquivo else None
+        self.tamanho = tamanho
+        self.mtime_ns = mtime_ns
+        self.paginas = paginas
+
+    def linha(self):
+        return (self.pasta, self.id_processo, self.slot, self.pasta_mtime_ns,
+                str(self.arquivo) if self.arquivo else None, self.tamanho, self.mtime_ns, self.paginas)
+
+
+def slot_da_pasta(pasta):
+    # Subpasta de anexo (ex.: '2. CP e anexos/TR/Pesquisa de Preços') em que a pasta termina, se houver
+    caminho = Path(pasta).as_posix()
+    for slot in SUBPASTAS_ANEXOS:
+        if caminho.endswith('/' + slot):
+            return slot
+    return None
+
+
+def contar_paginas(caminho):
+    try:
+        with fitz.open(caminho) as documento:
+            return documento.page_count
+    except Exception as e:
+        print(f"Erro ao contar páginas de {caminho}: {e}")
+        return None
+
+
+def ler_pasta_anexo(pasta, anterior=None, contar=True):
+    # Uma passada de os.scandir: PDF mais recente por mtime. O número de páginas só é lido (fitz) se o
+    # arquivo mudou em relação à entrada anterior (e contar=True)
+    mais_recente = None
+    with os.scandir(pasta) as entradas:
+        for entrada in entradas:
+            if entrada.is_file() and entrada.name.lower().endswith('.pdf'):
+                info = entrada.stat()
+                if mais_recente is None or info.st_mtime > mais_recente[1].st_mtime:
+                    mais_recente = (entrada.path, info)
+    pasta_mtime_ns = os.stat(pasta).st_mtime_ns
+    id_processo = anterior.id_processo if anterior is not None else None
+    if id_processo is None:
+        slot = slot_da_pasta(pasta)
+        if slot is not None:
+            id_processo = id_da_pasta_processo(Path(pasta).parents[len(Path(slot).parts) - 1].name)
+    else:
+        slot = anterior.slot
+    if mais_recente is None:
+        return AnexoIndexado(pasta, id_processo, slot, pasta_mtime_ns)
+    caminho, info = mais_recente
+    if (anterior is not None and anterior.arquivo == Path(caminho)
+            and (anterior.tamanho, anterior.mtime_ns) == (info.st_size, info.st_mtime_ns)):
+        paginas = anterior.paginas
+    else:
+        paginas = contar_paginas(caminho) if contar else None
+    return AnexoIndexado(pasta, id_processo, slot, pasta_mtime_ns, caminho, info.st_size, info.st_mtime_ns, paginas)
+
+
+def entrada_atual(entrada):
+    # A entrada gravada vale se a pasta não mudou (arquivos criados, apagados, renomeados) e o PDF
+    # indexado continua com o mesmo tamanho e mtime (sobrescrito no lugar)
+    if os.stat(entrada.pasta).st_mtime_ns != entrada.pasta_mtime_ns:
+        return False
+    if entrada.arquivo is None:
+        return True
+    try:
+        info = os.stat(entrada.arquivo)
+    except FileNotFoundError:
+        return False
+    return (info.st_size, info.st_mtime_ns) == (entrada.tamanho, entrada.mtime_ns)
+
+
+# Índice das pastas de anexos: pasta -> último PDF (tamanho, mtime, páginas), em memória e na tabela
+# indice_anexos. Na primeira consulta de uma pasta na sessão, a entrada gravada é conferida com um stat
+# da pasta e do PDF; depois disso a pasta fica sob um QFileSystemWatcher e as consultas não tocam no
+# disco. reconstruir() percorre pasta_base inteira com os.scandir (ex.: primeira execução).
+class AttachmentIndex(QObject):
+    anexoAlterado = pyqtSignal(str)
+    # (pastas/arquivos a vigiar, a deixar de vigiar): o QFileSystemWatcher só pode ser usado na thread
+    # do índice, então outras threads pedem a alteração por este sinal (conexão enfileirada)
+    _vigiar = pyqtSignal(list, list)
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, connection_manager, parent=None):
+        super().__init__(parent)
+        self.connection_manager = connection_manager
+        self._lock = threading.RLock()
+        self._entradas = {}
+        self._verificadas = set()
+        # Caminhos aceitos pelo watcher e os que ele recusou (compartilhamento de rede, limite do inotify):
+        # pastas com algum caminho recusado continuam sendo conferidas com stat a cada consulta
+        self._vigiados = set()
+        self._nao_vigiaveis = set()
+        self._reconstruindo = set()
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._pasta_alterada)
+        # O aviso da pasta não cobre um PDF sobrescrito no lugar: o PDF indexado também é vigiado
+        self._watcher.fileChanged.connect(lambda arquivo: self._pasta_alterada(str(Path(arquivo).parent)))
+        self._vigiar.connect(self._atualizar_vigia)
+        with self.connection_manager.connection() as conn:
+            garantir_tabela_anexos(conn)
+            for linha in conn.execute(f"SELECT * FROM {TABELA_ANEXOS}"):
+                self._entradas[linha[0]] = AnexoIndexado(*linha)
+
+    @classmethod
+    def instance(cls, connection_manager):
+        key = str(connection_manager.database_path)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(connection_manager)
+            return cls._instances[key]
+
+    def _gravar(self, entradas):
+        with self.connection_manager.connection() as conn:
+            conn.executemany(f"INSERT OR REPLACE INTO {TABELA_ANEXOS} VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             [entrada.linha() for entrada in entradas])
+
+    def _remover(self, pasta):
+        with self._lock:
+            self._entradas.pop(pasta, None)
+            self._verificadas.discard(pasta)
+        with self.connection_manager.connection() as conn:
+            conn.execute(f"DELETE FROM {TABELA_ANEXOS} WHERE pasta = ?", (pasta,))
+
+    @pyqtSlot(list, list)
+    def _atualizar_vigia(self, adicionar, remover):
+        caminhos_remover = [caminho for caminho in remover if caminho in self._vigiados]
+        if caminhos_remover:
+            self._watcher.removePaths(caminhos_remover)
+            self._vigiados.difference_update(caminhos_remover)
+        caminhos_adicionar = [caminho for caminho in adicionar if caminho]
+        # addPaths devolve os caminhos que não passou a vigiar (inclusive os já vigiados, por isso são filtrados)
+        novos = [caminho for caminho in caminhos_adicionar if caminho not in self._vigiados]
+        recusados = set(self._watcher.addPaths(novos)) if novos else set()
+        self._vigiados.update(caminho for caminho in novos if caminho not in recusados)
+        # A pasta só conta como vigiada quando o watcher aceitou a pasta e o PDF indexado
+        with self._lock:
+            self._nao_vigiaveis.update(recusados)
+            for caminho in caminhos_adicionar:
+                pasta = caminho if caminho in self._entradas else str(Path(caminho).parent)
+                entrada = self._entradas.get(pasta)
+                if entrada is None:
+                    continue
+                if pasta in self._vigiados and (entrada.arquivo is None or str(entrada.arquivo) in self._vigiados):
+                    self._verificadas.add(pasta)
+                else:
+                    self._verificadas.discard(pasta)
+
+    def _indexar(self, pasta):
+        with self._lock:
+            anterior = self._entradas.get(pasta)
+        entrada = ler_pasta_anexo(pasta, anterior)
+        with self._lock:
+            self._entradas[pasta] = entrada
+            vigiada = pasta in self._verificadas
+        self._gravar([entrada])
+        if vigiada and anterior is not None and anterior.arquivo != entrada.arquivo:
+            self._vigiar.emit([str(entrada.arquivo) if entrada.arquivo else None],
+                              [str(anterior.arquivo) if anterior.arquivo else None])
+        return entrada
+
+    def obter(self, pasta):
+        # AnexoIndexado da pasta, ou None se a pasta não existe
+        pasta = str(Path(pasta))
+        with self._lock:
+            if pasta in self._verificadas:
+                return self._entradas.get(pasta)
+            entrada = self._entradas.get(pasta)
+        try:
+            if entrada is None or not entrada_atual(entrada):
+                entrada = self._indexar(pasta)
+        except (FileNotFoundError, NotADirectoryError):
+            self._remover(pasta)
+            return None
+        # Chamado de outra thread, o pedido é entregue quando o laço de eventos do índice o processar;
+        # até lá as consultas continuam conferindo a entrada com stat. Caminhos já recusados pelo watcher
+        # não são pedidos de novo
+        arquivo = str(entrada.arquivo) if entrada.arquivo else None
+        with self._lock:
+            recusado = pasta in self._nao_vigiaveis or arquivo in self._nao_vigiaveis
+        if not recusado:
+            self._vigiar.emit([pasta, arquivo], [])
+        return entrada
+
+    def ultimo_pdf(self, pasta):
+        entrada = self.obter(pasta)
+        return entrada.arquivo if entrada is not None else None
+
+    def anexos_do_processo(self, id_processo):
+        # slot -> AnexoIndexado, consulta indexada por id_processo
+        with self.connection_manager.connection() as conn:
+            linhas = conn.execute(f"SELECT * FROM {TABELA_ANEXOS} WHERE id_processo = ?", (id_processo,)).fetchall()
+        return {linha[2]: AnexoIndexado(*linha) for linha in linhas}
+
+    def _pasta_alterada(self, pasta):
+        try:
+            self._indexar(pasta)
+        except (FileNotFoundError, NotADirectoryError):
+            with self._lock:
+                entrada = self._entradas.get(pasta)
+            self._vigiar.emit([], [pasta, str(entrada.arquivo) if entrada is not None and entrada.arquivo else None])
+            self._remover(pasta)
+        self.anexoAlterado.emit(pasta)
+
+    def iniciar_reconstrucao(self, pasta_base):
+        # Primeira vez com esta pasta_base: monta o índice em segundo plano. Nas seguintes, as entradas
+        # gravadas são conferidas pasta a pasta, sob demanda
+        prefixo = str(Path(pasta_base))
+        with self._lock:
+            if prefixo in self._reconstruindo or any(pasta.startswith(prefixo) for pasta in self._entradas):
+                return
+            self._reconstruindo.add(prefixo)
+        threading.Thread(target=self._reconstruir_em_segundo_plano, args=(pasta_base,), daemon=True).start()
+
+    def _reconstruir_em_segundo_plano(self, pasta_base):
+        try:
+            total = self.reconstruir(pasta_base)
+            print(f"Índice de anexos: {total} pastas em {pasta_base}")
+        except OSError as e:
+            print(f"Erro ao indexar anexos em {pasta_base}: {e}")
+        finally:
+            self.connection_manager.release_thread()
+
+    def reconstruir(self, pasta_base):
+        # Uma passada de os.scandir por pasta_base e pelas pastas de anexo de cada processo. Pode rodar
+        # fora da thread da interface; as pastas passam a ser vigiadas na primeira consulta
+        entradas = []
+        with os.scandir(pasta_base) as processos:
+            for processo in processos:
+                if not processo.is_dir():
+                    continue
+                for slot in SUBPASTAS_ANEXOS:
+                    pasta = str(Path(processo.path) / slot)
+                    with self._lock:
+                        anterior = self._entradas.get(pasta)
+                    try:
+                        entrada = ler_pasta_anexo(pasta, anterior)
+                    except (FileNotFoundError, NotADirectoryError):
+                        continue
+                    entrada.id_processo = id_da_pasta_processo(processo.name)
+                    entrada.slot = slot
+                    entradas.append(entrada)
+        with self._lock:
+            for entrada in entradas:
+                self._entradas[entrada.pasta] = entrada
+        self._gravar(entradas)
+        return len(entradas)
+
+
+# Consulta de anexos sem gravar nada nem vigiar pastas (ex.: processos da geração em lote, que leem o
+# banco somente leitura): usa as entradas recebidas enquanto continuarem atuais e lê a pasta nos demais casos
+class IndiceAnexosSomenteLeitura:
+    def __init__(self, entradas=()):
+        self._entradas = {entrada.pasta: entrada for entrada in entradas}
+
+    def ultimo_pdf(self, pasta):
+        pasta = str(Path(pasta))
+        entrada = self._entradas.get(pasta)
+        try:
+            if entrada is None or not entrada_atual(entrada):
+                entrada = self._entradas[pasta] = ler_pasta_anexo(pasta, entrada, contar=False)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return entrada.arquivo
+
+
+def get_attachment_index(connection_manager):
+    return AttachmentIndex.instance(connection_manager)
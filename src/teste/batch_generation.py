@@ -0,0 +1,220 @@
+import argparse
+import json
+import multiprocessing.util
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+from modules.dispensa_eletronica.document_context import (
+    DOCUMENTO_AUTORIZACAO, DOCUMENTO_AVISO, DOCUMENTOS_CP, caminho_documento, criar_pastas_processo,
+    nome_pasta_processo, preparar_contexto
+)
+from modules.dispensa_eletronica.attachment_index import TABELA_ANEXOS
+from modules.dispensa_eletronica.connection_manager import get_connection_manager
+from modules.dispensa_eletronica.process_folders import TABELA_PASTAS, localizar_pasta_por_nome
+
+# Geração em lote, sem interface: autorização, aviso ou o pacote da CP para vários processos de uma vez.
+# Uso (a partir da pasta do aplicativo):
+#   python -m modules.dispensa_eletronica.batch_generation banco.db --tipo cp --ano 2024 --relatorio lote.json
+
+TIPOS_DOCUMENTO = {'autorizacao': DOCUMENTO_AUTORIZACAO, 'aviso': DOCUMENTO_AVISO, 'cp': None}
+
+# Processos gerando documentos em paralelo; cada um tem o próprio conversor com um único LibreOffice
+TAMANHO_POOL_LOTE = min(4, os.cpu_count() or 1)
+
+CONFIG_FILE = 'config.json'
+
+
+def _ms(inicio):
+    return round((time.perf_counter() - inicio) * 1000, 1)
+
+
+def ler_registros(banco, ids=None, situacao=None, ano=None, tabela="controle_dispensas"):
+    # Snapshot somente leitura do ConnectionManager: o lote pode rodar com o aplicativo aberto
+    with get_connection_manager(banco).snapshot() as conn:
+        conn.row_factory = sqlite3.Row
+        condicoes, parametros = [], []
+        if ids:
+            condicoes.append("id_processo IN (SELECT value FROM json_each(?))")
+            parametros.append(json.dumps(ids))
+        if situacao:
+            condicoes.append("situacao = ?")
+            parametros.append(situacao)
+        if ano:
+            condicoes.append("ano = ?")
+            parametros.append(str(ano))
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+        linhas = conn.execute(f"SELECT * FROM {tabela} {where} ORDER BY id_processo", parametros).fetchall()
+        # Pastas já registradas no manifesto (o nome da pasta pode não bater mais com o objeto atual)
+        pastas = {}
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (TABELA_PASTAS,)).fetchone():
+            pastas = dict(conn.execute(f"SELECT id_processo, pasta FROM {TABELA_PASTAS}").fetchall())
+        # Entradas do índice de anexos, conferidas com stat nos processos do lote (que não gravam no banco)
+        anexos = {}
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (TABELA_ANEXOS,)).fetchone():
+            for linha in conn.execute(f"SELECT * FROM {TABELA_ANEXOS}"):
+                anexos.setdefault(linha['id_processo'], []).append(tuple(linha))
+    registros = [dict(linha) for linha in linhas]
+    for registro in registros:
+        registro['pasta_processo'] = pastas.get(registro['id_processo'])
+        registro['anexos'] = anexos.get(registro['id_processo'], [])
+    return registros
+
+
+_conversor = None
+
+
+def _iniciar_worker():
+    global _conversor
+    from modules.dispensa_eletronica.document_converter import criar_conversor
+    _conversor = criar_conversor(tamanho_pool=1)
+    # Finalize roda na saída dos processos do pool (o atexit não roda em processos criados por fork)
+    multiprocessing.util.Finalize(None, _conversor.fechar, exitpriority=10)
+
+
+# Executado nos processos do pool: gera os documentos de um processo e devolve o resultado para o relatório
+def gerar_processo(registro, tipo, pasta_base, templates_dir):
+    from modules.dispensa_eletronica.render_cache import RenderCache, renderizar_com_cache, converter_com_cache
+    inicio = time.perf_counter()
+    id_processo = registro['id_processo']
+    resultado = {'id_processo': id_processo, 'tipo': tipo, 'status': 'ok', 'saidas': [], 'faltando': [], 'erros': []}
+    # As entradas do índice de anexos não fazem parte do contexto (mudariam a chave do cache de render)
+    anexos = registro.pop('anexos', [])
+    try:
+        context = preparar_contexto(registro)
+        pasta_processo = registro.get('pasta_processo')
+        if not pasta_processo or not Path(pasta_processo).is_dir():
+            pasta_processo = (localizar_pasta_por_nome(pasta_base, id_processo)
+                              or Path(pasta_base) / nome_pasta_processo(id_processo, registro['objeto']))
+        pasta_processo = Path(pasta_processo)
+        criar_pastas_processo(pasta_processo)
+        cache = RenderCache(pasta_processo)
+        templates_dir = Path(templates_dir)
+
+        if tipo == 'cp':
+            from modules.dispensa_eletronica.attachment_index import AnexoIndexado, IndiceAnexosSomenteLeitura
+            from modules.dispensa_eletronica.package_builder import ConstrutorPacote
+            partes = []
+            for doc in DOCUMENTOS_CP:
+                if "template" in doc:
+                    parte = {
+                        "template_path": templates_dir / f"template_{doc['template']}.docx",
+                        "save_path": caminho_documento(pasta_processo, id_processo, doc["subfolder"], doc["desc"]),
+                    }
+                else:
+                    parte = {"pasta": pasta_processo / doc["subfolder"]}
+                if "cover" in doc:
+                    parte["cover_path"] = templates_dir / doc["cover"]
+                partes.append(parte)
+            # O paralelismo do lote é entre processos; dentro de cada um as partes são renderizadas em sequência
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                indice = IndiceAnexosSomenteLeitura(AnexoIndexado(*linha) for linha in anexos)
+                pacote = ConstrutorPacote(conversor=_conversor, pool=pool, indice_anexos=indice).construir(
+                    partes, context, pasta_processo / "2. CP e anexos" / "CP_e_anexos.pdf", cache)
+            resultado['saidas'] = [str(pdf["pdf_path"]) for pdf in pacote['pdfs']]
+            if pacote['destino'] is not None:
+                resultado['saidas'].append(str(pacote['destino']))
+            resultado['faltando'] = [str(pasta) for pasta in pacote['faltando']]
+            resultado['erros'] = pacote['erros']
+            resultado['tempos'] = pacote['tempos']
+        else:
+            template, subpasta, descricao = TIPOS_DOCUMENTO[tipo]
+            render = time.perf_counter()
+            docx_path, docx_reaproveitado = renderizar_com_cache(
+                templates_dir / f"template_{template}.docx",
+                caminho_documento(pasta_processo, id_processo, subpasta, descricao), context, cache)
+            renderizacao_ms = _ms(render)
+            conversao = time.perf_counter()
+            pdf_path, pdf_reaproveitado = converter_com_cache(_conversor, docx_path, cache)
+            resultado['saidas'] = [str(docx_path), str(pdf_path)]
+            resultado['reaproveitado'] = {'docx': docx_reaproveitado, 'pdf': pdf_reaproveitado}
+            resultado['tempos'] = {'renderizacao_ms': renderizacao_ms, 'conversao_ms': _ms(conversao)}
+    except Exception as e:
+        resultado['erros'].append(f"{type(e).__name__}: {e}")
+
+    if resultado['erros']:
+        resultado['status'] = 'erro'
+    elif resultado['faltando']:
+        resultado['status'] = 'incompleto'
+    resultado.setdefault('tempos', {})['total_ms'] = _ms(inicio)
+    return resultado
+
+
+def gerar_lote(registros, tipo, pasta_base, templates_dir, processos=TAMANHO_POOL_LOTE):
+    inicio = time.perf_counter()
+    data_inicio = datetime.now().isoformat(timespec='seconds')
+    resultados = []
+    with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_worker) as pool:
+        futuros = [pool.submit(gerar_processo, registro, tipo, str(pasta_base), str(templates_dir)) for registro in registros]
+        for n, futuro in enumerate(as_completed(futuros), start=1):
+            resultado = futuro.result()
+            resultados.append(resultado)
+            print(f"[{n}/{len(futuros)}] {resultado['id_processo']}: {resultado['status']} ({resultado['tempos']['total_ms']} ms)")
+    resultados.sort(key=lambda resultado: resultado['id_processo'])
+    resumo = {}
+    for resultado in resultados:
+        resumo[resultado['status']] = resumo.get(resultado['status'], 0) + 1
+    return {
+        'inicio': data_inicio,
+        'tipo': tipo,
+        'processos': processos,
+        'total_ms': _ms(inicio),
+        'resumo': resumo,
+        'resultados': resultados,
+    }
+
+
+def _pasta_base_configurada():
+    # Mesmo config.json usado por ConsolidarDocumentos
+    if not Path(CONFIG_FILE).exists():
+        return None
+    with open(CONFIG_FILE, 'r') as file:
+        return json.load(file).get('pasta_base')
+
+
+def _templates_configurados():
+    try:
+        from diretorios import TEMPLATE_DISPENSA_DIR
+        return TEMPLATE_DISPENSA_DIR
+    except ImportError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera documentos da Dispensa Eletrônica em lote, sem interface")
+    parser.add_argument("banco", help="Caminho do banco SQLite")
+    parser.add_argument("--tipo", choices=list(TIPOS_DOCUMENTO), required=True)
+    parser.add_argument("--ids", nargs='+', help="id_processo a gerar (ex.: 'DE 15/2024')")
+    parser.add_argument("--situacao", help="Filtra pela situação (ex.: Planejamento)")
+    parser.add_argument("--ano", help="Filtra pelo ano do processo")
+    parser.add_argument("--pasta-base", default=_pasta_base_configurada(), help="Pasta dos processos (padrão: config.json)")
+    parser.add_argument("--templates", default=_templates_configurados(), help="Pasta dos templates (padrão: TEMPLATE_DISPENSA_DIR)")
+    parser.add_argument("--processos", type=int, default=TAMANHO_POOL_LOTE)
+    parser.add_argument("--relatorio", default="relatorio_lote.json", help="Arquivo JSON com saídas e tempos")
+    args = parser.parse_args()
+
+    if not args.pasta_base or not args.templates:
+        parser.error("informe --pasta-base e --templates (não encontrados na configuração do aplicativo)")
+    if not (args.ids or args.situacao or args.ano):
+        parser.error("informe --ids ou um filtro (--situacao, --ano)")
+
+    registros = ler_registros(args.banco, args.ids, args.situacao, args.ano)
+    nao_encontrados = sorted(set(args.ids or []) - {registro['id_processo'] for registro in registros})
+    for id_processo in nao_encontrados:
+        print(f"Processo não encontrado: {id_processo}")
+    print(f"Gerando '{args.tipo}' para {len(registros)} processos com {args.processos} processos em paralelo...")
+
+    relatorio = gerar_lote(registros, args.tipo, args.pasta_base, args.templates, args.processos)
+    relatorio['nao_encontrados'] = nao_encontrados
+    with open(args.relatorio, 'w', encoding='utf-8') as arquivo:
+        json.dump(relatorio, arquivo, ensure_ascii=False, indent=2, default=str)
+    print(f"Concluído em {relatorio['total_ms'] / 1000:.1f}s: {relatorio['resumo']}. Relatório: {args.relatorio}")
+    return 0 if not relatorio['resumo'].get('erro') and not nao_encontrados else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+import argparse
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bulk_upsert import bulk_upsert
+from reference_data import enriquecer_om, ler_controle_om
+
+SCHEMA_CONTROLE_DISPENSAS = """
+    CREATE TABLE IF NOT EXISTS controle_dispensas (
+        id_processo VARCHAR(100) PRIMARY KEY,
+        tipo VARCHAR(100),
+        numero VARCHAR(100),
+        ano VARCHAR(100),
+        situacao TEXT,
+        nup VARCHAR(100),
+        material_servico VARCHAR(30),
+        objeto VARCHAR(100),
+        uasg VARCHAR(10),
+        orgao_responsavel VARCHAR(250),
+        sigla_om VARCHAR(100),
+        setor_responsavel TEXT
+    )
+"""
+
+UPSERT_POR_LINHA = '''
+    INSERT INTO controle_dispensas (
+        id_processo, nup, objeto, uasg, tipo, numero, ano, sigla_om, setor_responsavel,
+        material_servico, orgao_responsavel, situacao
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id_processo) DO UPDATE SET
+        nup=excluded.nup,
+        objeto=excluded.objeto,
+        uasg=excluded.uasg,
+        tipo=excluded.tipo,
+        numero=excluded.numero,
+        ano=excluded.ano,
+        sigla_om=excluded.sigla_om,
+        setor_responsavel=excluded.setor_responsavel,
+        material_servico=excluded.material_servico,
+        orgao_responsavel=excluded.orgao_responsavel,
+        situacao=excluded.situacao;
+'''
+
+
+def gerar_planilha(linhas, ano=2024):
+    numeros = range(1, linhas + 1)
+    return pd.DataFrame({
+        'id_processo': [f"DE {n}/{ano}" for n in numeros],
+        'nup': [f"62055.{n:06d}/{ano}-00" for n in numeros],
+        'objeto': [f"Objeto {n}" for n in numeros],
+        'uasg': [str(787000 + n % 50) for n in numeros],
+        'tipo': 'Dispensa Eletrônica',
+        'numero': [str(n) for n in numeros],
+        'ano': str(ano),
+        'sigla_om': [f"OM{n % 50}" for n in numeros],
+        'setor_responsavel': '',
+        'material_servico': 'Material',
+        'orgao_responsavel': [f"Organização Militar {n % 50}" for n in numeros],
+        'situacao': 'Planejamento',
+    })
+
+
+def upsert_por_linha(conn, data):
+    # Reproduz o laço original de DispensaEletronicaWidget.save_to_database
+    cursor = conn.cursor()
+    for _, row in data.iterrows():
+        cursor.execute(UPSERT_POR_LINHA, (
+            row['id_processo'], row['nup'], row['objeto'], row['uasg'],
+            row.get('tipo', ''), row.get('numero', ''), row.get('ano', ''),
+            row.get('sigla_om', ''), row.get('setor_responsavel', ''),
+            row.get('material_servico', ''), row.get('orgao_responsavel', ''),
+            row['situacao']
+        ))
+    conn.commit()
+
+
+def cronometrar(funcao, *args):
+    inicio = time.perf_counter()
+    funcao(*args)
+    return time.perf_counter() - inicio
+
+
+def bench_upsert(linhas):
+    df = gerar_planilha(linhas)
+    # Segunda importação: 10% das linhas alteradas, o restante idêntico
+    df_reimportado = df.copy()
+    alteradas = df_reimportado.sample(frac=0.1, random_state=1).index
+    df_reimportado.loc[alteradas, 'objeto'] = df_reimportado.loc[alteradas, 'objeto'] + " (revisado)"
+
+    with tempfile.TemporaryDirectory() as pasta:
+        resultados = {}
+        for nome, funcao in (("por linha", upsert_por_linha), ("em lote", bulk_upsert)):
+            conn = sqlite3.connect(Path(pasta) / f"{nome.replace(' ', '_')}.db")
+            conn.execute(SCHEMA_CONTROLE_DISPENSAS)
+            conn.commit()
+            carga = cronometrar(funcao, conn, df.copy())
+            reimportacao = cronometrar(funcao, conn, df_reimportado.copy())
+            conn.close()
+            resultados[nome] = (carga, reimportacao)
+
+    print(f"Upsert de {linhas} linhas (carga inicial / reimportação com 10% alteradas):")
+    for nome, (carga, reimportacao) in resultados.items():
+        print(f"  {nome:>10}: {carga:8.3f}s / {reimportacao:8.3f}s")
+    base, lote = resultados["por linha"], resultados["em lote"]
+    print(f"  ganho: {base[0] / lote[0]:.1f}x / {base[1] / lote[1]:.1f}x")
+
+
+def enriquecer_por_lambda(df, conn):
+    # Reproduz o salvar_detalhes_uasg_sigla_nome original: consulta a controle_om e faz dois map com lambda
+    cursor = conn.cursor()
+    cursor.execute("SELECT uasg, sigla_om, orgao_responsavel FROM controle_om")
+    om_details = {row[0]: {'sigla_om': row[1], 'orgao_responsavel': row[2]} for row in cursor.fetchall()}
+    df['sigla_om'] = df['uasg'].map(lambda x: om_details.get(x, {}).get('sigla_om', ''))
+    df['orgao_responsavel'] = df['uasg'].map(lambda x: om_details.get(x, {}).get('orgao_responsavel', ''))
+
+
+def bench_enriquecimento(linhas, oms=500):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE controle_om (uasg TEXT, sigla_om TEXT, orgao_responsavel TEXT)")
+    conn.executemany("INSERT INTO controle_om VALUES (?, ?, ?)",
+                     [(str(787000 + n), f"OM{n}", f"Organização Militar {n}") for n in range(oms)])
+    df = gerar_planilha(linhas)[['id_processo', 'uasg']]
+    # 5% das UASGs sem cadastro, para exercitar o caminho de não encontradas
+    df.loc[df.sample(frac=0.05, random_state=1).index, 'uasg'] = '999999'
+
+    por_lambda = cronometrar(enriquecer_por_lambda, df.copy(), conn)
+    # Primeira importação: lê e tipa a controle_om; as seguintes usam o cache
+    inicio = time.perf_counter()
+    om = ler_controle_om(conn)
+    leitura = time.perf_counter() - inicio
+    hash_join = cronometrar(enriquecer_om, df.copy(), om)
+    conn.close()
+
+    print(f"Enriquecimento de OM em {linhas} linhas ({oms} OMs cadastradas):")
+    print(f"  {'lambda':>10}: {por_lambda:8.3f}s")
+    print(f"  {'hash join':>10}: {hash_join:8.3f}s (+ {leitura:.3f}s na primeira leitura da controle_om)")
+    print(f"  ganho: {por_lambda / hash_join:.1f}x")
+
+
+def gerar_pdf(caminho, paginas, titulo, imagem=None):
+    import fitz
+    documento = fitz.open()
+    for n in range(paginas):
+        pagina = documento.new_page()
+        pagina.insert_text((72, 72), f"{titulo} - página {n + 1}", fontsize=14)
+        pagina.insert_textbox(fitz.Rect(72, 100, 520, 760), "Texto do documento. " * 120, fontsize=10)
+        if imagem is not None:
+            pagina.insert_image(fitz.Rect(250, 20, 340, 110), stream=imagem)
+    documento.save(str(caminho), deflate=True)
+    documento.close()
+
+
+def juntar_com_pdfmerger(partes, destino):
+    # Reproduz o concatenar_e_abrir_pdfs original (PyPDF2.PdfMerger)
+    from PyPDF2 import PdfMerger
+    merger = PdfMerger()
+    for parte in partes:
+        if "cover_path" in parte:
+            merger.append(str(parte["cover_path"]))
+        merger.append(str(parte["pdf_path"]))
+    merger.write(str(destino))
+    merger.close()
+
+
+def bench_juncao(paginas=200, partes_pacote=9):
+    import fitz
+    from pdf_merge import concatenar_pdfs, _capas
+
+    with tempfile.TemporaryDirectory() as pasta:
+        pasta = Path(pasta)
+        # Brasão repetido em todas as capas: o garbage=4 grava a imagem uma única vez
+        pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 256, 256), False)
+        pixmap.set_rect(pixmap.irect, (30, 60, 120))
+        imagem = pixmap.tobytes("png")
+        paginas_por_parte = max((paginas - partes_pacote) // partes_pacote, 1)
+        partes = []
+        for n in range(partes_pacote):
+            capa, documento = pasta / f"capa_{n}.pdf", pasta / f"parte_{n}.pdf"
+            gerar_pdf(capa, 1, f"Capa {n}", imagem)
+            gerar_pdf(documento, paginas_por_parte, f"Parte {n}")
+            partes.append({"pdf_path": documento, "cover_path": capa})
+        total_paginas = partes_pacote * (paginas_por_parte + 1)
+
+        pdfmerger = cronometrar(juntar_com_pdfmerger, partes, pasta / "pdfmerger.pdf")
+        _capas.limpar()
+        primeira = cronometrar(concatenar_pdfs, partes, pasta / "pymupdf.pdf")
+        # Execuções seguintes: capas já abertas no cache
+        seguintes = min(cronometrar(concatenar_pdfs, partes, pasta / "pymupdf.pdf") for _ in range(3))
+        tamanho_pdfmerger = (pasta / "pdfmerger.pdf").stat().st_size
+        tamanho_pymupdf = (pasta / "pymupdf.pdf").stat().st_size
+        _capas.limpar()
+
+    print(f"Junção de um pacote de {total_paginas} páginas ({partes_pacote} partes com capa):")
+    print(f"  {'PdfMerger':>10}: {pdfmerger:8.3f}s  {tamanho_pdfmerger / 1024:8.0f} KiB")
+    print(f"  {'PyMuPDF':>10}: {primeira:8.3f}s  {tamanho_pymupdf / 1024:8.0f} KiB (primeira junção)")
+    print(f"  {'':>10}  {seguintes:8.3f}s (capas em cache)")
+    print(f"  ganho: {pdfmerger / primeira:.1f}x / {pdfmerger / seguintes:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do módulo Dispensa Eletrônica")
+    parser.add_argument("--linhas", type=int, default=20000)
+    parser.add_argument("--paginas", type=int, default=200)
+    args = parser.parse_args()
+    bench_upsert(args.linhas)
+    bench_enriquecimento(args.linhas * 10)
+    bench_juncao(args.paginas)
+
+
+if __name__ == "__main__":
+    main()
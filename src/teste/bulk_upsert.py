@@ -0,0 +1,75 @@
+import logging
+
+import pandas as pd
+
+COLUNAS_UPSERT = [
+    'id_processo', 'nup', 'objeto', 'uasg', 'tipo', 'numero', 'ano', 'sigla_om', 'setor_responsavel',
+    'material_servico', 'orgao_responsavel', 'situacao'
+]
+
+TABELA_STAGING = "staging_controle_dispensas"
+
+
+def preparar_linhas(df, colunas=COLUNAS_UPSERT):
+    # Garante todas as colunas, troca NaN por None e mantém a última ocorrência de cada chave (primeira coluna)
+    df = df.reindex(columns=colunas, fill_value='')
+    df = df.drop_duplicates(subset=colunas[0], keep='last')
+    df = df.astype(object).where(pd.notna(df), None)
+    return list(df.itertuples(index=False, name=None))
+
+
+# Insere/atualiza o DataFrame em uma única transação, ignorando linhas inalteradas.
+# Retorna os id_processo inseridos e atualizados e a contagem de inalterados.
+def bulk_upsert(conn, df, tabela="controle_dispensas", colunas=COLUNAS_UPSERT):
+    linhas = preparar_linhas(df, colunas)
+    chave = colunas[0]
+    lista_colunas = ', '.join(colunas)
+    demais_colunas = [col for col in colunas if col != chave]
+    diferente = ' OR '.join(f"{tabela}.{col} IS NOT excluded.{col}" for col in demais_colunas)
+    diferente_staging = ' OR '.join(f"t.{col} IS NOT s.{col}" for col in demais_colunas)
+
+    # Só confirma (ou desfaz) a transação que ela mesma abriu; dentro da transação de quem chamou,
+    # o commit fica com o chamador
+    cursor = conn.cursor()
+    propria = not conn.in_transaction
+    try:
+        if propria:
+            cursor.execute("BEGIN")
+        # A tabela temporária herda a afinidade das colunas de destino, assim a comparação é feita com os mesmos tipos
+        cursor.execute(f"DROP TABLE IF EXISTS temp.{TABELA_STAGING}")
+        cursor.execute(f"CREATE TEMP TABLE {TABELA_STAGING} AS SELECT {lista_colunas} FROM {tabela} WHERE 0")
+        placeholders = ', '.join('?' for _ in colunas)
+        cursor.executemany(f"INSERT INTO temp.{TABELA_STAGING} ({lista_colunas}) VALUES ({placeholders})", linhas)
+
+        cursor.execute(f"""
+            SELECT s.{chave}, t.{chave} IS NULL FROM temp.{TABELA_STAGING} s
+            LEFT JOIN {tabela} t ON t.{chave} = s.{chave}
+            WHERE t.{chave} IS NULL OR {diferente_staging}
+        """)
+        inseridos, atualizados = [], []
+        for id_processo, novo in cursor.fetchall():
+            (inseridos if novo else atualizados).append(id_processo)
+
+        cursor.execute(f"""
+            INSERT INTO {tabela} ({lista_colunas})
+            SELECT {lista_colunas} FROM temp.{TABELA_STAGING} WHERE true
+            ON CONFLICT({chave}) DO UPDATE SET
+                {', '.join(f'{col}=excluded.{col}' for col in demais_colunas)}
+            WHERE {diferente}
+        """)
+        cursor.execute(f"DROP TABLE temp.{TABELA_STAGING}")
+        if propria:
+            conn.commit()
+    except Exception:
+        if propria:
+            conn.rollback()
+        raise
+
+    resultado = {
+        'inseridos': inseridos,
+        'atualizados': atualizados,
+        'inalterados': len(linhas) - len(inseridos) - len(atualizados),
+    }
+    logging.info("Upsert em lote: %d inseridos, %d atualizados, %d inalterados",
+                 len(inseridos), len(atualizados), resultado['inalterados'])
+    return resultado
@@ -5,17 +5,21 @@ from pathlib import Path
 from diretorios import *
 from database.utils.treeview_utils import load_images, create_button
 from modules.planejamento.utilidades_planejamento import DatabaseManager, carregar_dados_pregao, carregar_dados_dispensa
-from modules.dispensa_eletronica.utilidades_dispensa_eletronica import ExportThread
+from modules.dispensa_eletronica.utilidades_dispensa_eletronica import ExportThread, ImportThread
 from modules.dispensa_eletronica.sql_model import SqlModel, CustomTableView
 from modules.dispensa_eletronica.add_item import AddItemDialog
+from modules.dispensa_eletronica.bulk_upsert import bulk_upsert
+from modules.dispensa_eletronica.connection_manager import get_connection_manager
+from modules.dispensa_eletronica.search_index import search_ids
+from modules.dispensa_eletronica.lazy_table_model import ALTERACAO_INSERCAO, ALTERACAO_ATUALIZACAO, ALTERACAO_EXCLUSAO
 import pandas as pd
 import os
-import subprocess
 import logging
 import sqlite3
 
 class DispensaEletronicaWidget(QMainWindow):
-    dataUpdated = pyqtSignal()
+    # {id_processo: tipo de alteração}; dicionário vazio pede recarga completa
+    dataUpdated = pyqtSignal(dict)
 
     def __init__(self, icons_dir, parent=None):
         super().__init__(parent)
@@ -26,6 +30,9 @@ class DispensaEletronicaWidget(QMainWindow):
         self.ui_manager = UIManager(self, self.icons_dir, self.config_manager, self.model)
         self.setup_ui()
         self.export_thread = None
+        # Por padrão a exportação leva a tabela inteira; a caixa "Exportar só a visão atual" restringe às
+        # colunas visíveis e às linhas filtradas pela busca, na ordem da tabela
+        self.exportar_apenas_visiveis = False
         self.output_path = os.path.join(os.getcwd(), "controle_dispensa_eletronica.xlsx")
         self.dataUpdated.connect(self.refresh_model)
 
@@ -33,10 +40,14 @@ class DispensaEletronicaWidget(QMainWindow):
         self.config_manager = ConfigManager(BASE_DIR / "config.json")
         self.database_path = Path(load_config("CONTROLE_DADOS", str(CONTROLE_DADOS)))
         self.database_manager = DatabaseManager(self.database_path)
+        self.connection_manager = get_connection_manager(self.database_path)
         self.event_manager = EventManager()
 
-    def refresh_model(self):
-        self.model.select()
+    def refresh_model(self, changes=None):
+        if changes:
+            self.model.apply_changes(changes)
+        else:
+            self.model.select()
 
     def setup_ui(self):
         self.setCentralWidget(self.ui_manager.main_widget)
@@ -92,95 +103,131 @@ class DispensaEletronicaWidget(QMainWindow):
             QMessageBox.warning(self, "Nenhuma Seleção", "Por favor, selecione uma linha para excluir.")
 
     def salvar_tabela(self):
-        self.export_thread = ExportThread(self.model, self.output_path)
+        filepath, _ = QFileDialog.getSaveFileName(self, "Exportar tabela", self.output_path, "Excel (*.xlsx);;CSV (*.csv);;Parquet (*.parquet);;Arrow IPC (*.arrow)")
+        if not filepath:
+            return
+        self.output_path = filepath
+        colunas, cabecalhos, chaves = None, None, None
+        if self.exportar_apenas_visiveis:
+            colunas, cabecalhos = self.ui_manager.visible_columns()
+            chaves = self.model.key_filter()
+
+        self.export_thread = ExportThread(self.connection_manager, self.output_path, colunas, cabecalhos, chaves)
+        self.export_progress = QProgressDialog("Exportando dados...", "Cancelar", 0, 0, self)
+        self.export_progress.setWindowTitle("Exportação de Dados")
+        self.export_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.export_progress.setMinimumDuration(500)
+        self.export_progress.canceled.connect(self.export_thread.requestInterruption)
+        self.export_thread.progress.connect(self.update_export_progress)
         self.export_thread.finished.connect(self.handle_export_finished)
         self.export_thread.start()
 
+    def update_export_progress(self, gravadas, total):
+        self.export_progress.setMaximum(total)
+        self.export_progress.setValue(gravadas)
+
     def handle_export_finished(self, message):
+        self.export_progress.reset()
+        if message.startswith('Cancelled'):
+            return
         if 'successfully' in message:
-            Dialogs.info(self, "Exportação de Dados", "Dados exportados com sucesso!")
-            subprocess.run(f'start excel.exe "{self.output_path}"', shell=True, check=True)
+            caminho = Path(self.output_path)
+            if caminho.suffix.lower() in ('.xlsx', '.csv'):
+                Dialogs.info(self, "Exportação de Dados", "Dados exportados com sucesso!")
+                os.startfile(caminho)
+            else:
+                # Parquet/Arrow não abrem no Excel: mostra onde o arquivo foi gravado e abre a pasta
+                Dialogs.info(self, "Exportação de Dados", f"Dados exportados com sucesso em:\n{caminho}")
+                os.startfile(caminho.parent)
         else:
             Dialogs.warning(self, "Exportação de Dados", message)
 
     def carregar_tabela(self):
-        filepath, _ = QFileDialog.getOpenFileName(self, "Abrir arquivo de tabela", "", "Tabelas (*.xlsx *.xls *.ods)")
-        if filepath:
-            try:
-                df = pd.read_excel(filepath)
-                self.validate_and_process_data(df)
-                df['situacao'] = 'Planejamento'
-                self.save_to_database(df)
-                Dialogs.info(self, "Carregamento concluído", "Dados carregados com sucesso.")
-            except Exception as e:
-                Dialogs.warning(self, "Erro ao carregar", str(e))
-
-    def validate_and_process_data(self, df):
-        required_columns = ['ID Processo', 'NUP', 'Objeto', 'UASG']
-        if not all(col in df.columns for col in required_columns):
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            raise ValueError(f"Faltando: {', '.join(missing_columns)}")
-        df.rename(columns={'ID Processo': 'id_processo', 'NUP': 'nup', 'Objeto': 'objeto', 'UASG': 'uasg'}, inplace=True)
-        self.desmembramento_id_processo(df)
-        self.salvar_detalhes_uasg_sigla_nome(df)
-
-    def desmembramento_id_processo(self, df):
-        df[['tipo', 'numero', 'ano']] = df['id_processo'].str.extract(r'(\D+)(\d+)/(\d+)')
-        df['tipo'] = df['tipo'].map({'DE ': 'Dispensa Eletrônica'}).fillna('Tipo Desconhecido')
-
-    def salvar_detalhes_uasg_sigla_nome(self, df):
-        with sqlite3.connect(self.database_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT uasg, sigla_om, orgao_responsavel FROM controle_om")
-            om_details = {row[0]: {'sigla_om': row[1], 'orgao_responsavel': row[2]} for row in cursor.fetchall()}
-        df['sigla_om'] = df['uasg'].map(lambda x: om_details.get(x, {}).get('sigla_om', ''))
-        df['orgao_responsavel'] = df['uasg'].map(lambda x: om_details.get(x, {}).get('orgao_responsavel', ''))
-                
+        filepath, _ = QFileDialog.getOpenFileName(self, "Abrir arquivo de tabela", "", "Tabelas (*.xlsx *.xls *.ods *.csv)")
+        if not filepath:
+            return
+        self.import_thread = ImportThread(self.connection_manager, filepath)
+        self.import_progress = QProgressDialog("Importando dados...", "Cancelar", 0, 0, self)
+        self.import_progress.setWindowTitle("Carregamento de Dados")
+        self.import_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.import_progress.setMinimumDuration(500)
+        self.import_progress.canceled.connect(self.import_thread.requestInterruption)
+        self.import_thread.progress.connect(self.update_import_progress)
+        self.import_thread.finished.connect(self.handle_import_finished)
+        self.import_thread.start()
+
+    def update_import_progress(self, lidas, total):
+        self.import_progress.setMaximum(total)
+        self.import_progress.setValue(lidas)
+
+    def handle_import_finished(self, message):
+        self.import_progress.reset()
+        resultado = self.import_thread.resultado
+        changes = dict.fromkeys(resultado['inseridos'], ALTERACAO_INSERCAO)
+        changes.update(dict.fromkeys(resultado['atualizados'], ALTERACAO_ATUALIZACAO))
+        if changes:
+            self.dataUpdated.emit(changes)
+        resumo = (
+            f"Inseridos: {len(resultado['inseridos'])}\n"
+            f"Atualizados: {len(resultado['atualizados'])}\n"
+            f"Inalterados: {resultado['inalterados']}"
+        )
+        if resultado['uasg_sem_om']:
+            resumo += f"\nUASGs sem OM cadastrada: {', '.join(resultado['uasg_sem_om'])}"
+        if 'successfully' in message:
+            Dialogs.info(self, "Carregamento concluído", f"Dados carregados com sucesso.\n{resumo}")
+        elif message.startswith('Cancelled'):
+            Dialogs.info(self, "Carregamento interrompido", f"{message}\nOs blocos já gravados foram mantidos.\n{resumo}")
+        else:
+            Dialogs.warning(self, "Erro ao carregar", f"{message}\n{resumo}")
+
     def save_to_database(self, data, delete=False):
-        with self.database_manager as conn:
+        resultado = None
+        changes = {}
+        with self.connection_manager.connection() as conn:
             cursor = conn.cursor()
             if delete:
                 cursor.execute("DELETE FROM controle_dispensas WHERE id_processo = ?", (data['id_processo'],))
+                changes[data['id_processo']] = ALTERACAO_EXCLUSAO
             else:
                 situacao = 'Planejamento'
-                upsert_sql = '''
-                INSERT INTO controle_dispensas (
-                    id_processo, nup, objeto, uasg, tipo, numero, ano, sigla_om, setor_responsavel, 
-                    material_servico, orgao_responsavel, situacao
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(id_processo) DO UPDATE SET
-                    nup=excluded.nup,
-                    objeto=excluded.objeto,
-                    uasg=excluded.uasg,
-                    tipo=excluded.tipo,
-                    numero=excluded.numero,
-                    ano=excluded.ano,
-                    sigla_om=excluded.sigla_om,
-                    setor_responsavel=excluded.setor_responsavel,
-                    material_servico=excluded.material_servico,
-                    orgao_responsavel=excluded.orgao_responsavel,
-                    situacao=excluded.situacao;
-                '''
                 if isinstance(data, pd.DataFrame):
                     data['situacao'] = situacao
-                    for _, row in data.iterrows():
-                        cursor.execute(upsert_sql, (
-                            row['id_processo'], row['nup'], row['objeto'], row['uasg'],
-                            row.get('tipo', ''), row.get('numero', ''), row.get('ano', ''),
-                            row.get('sigla_om', ''), row.get('setor_responsavel', ''), 
-                            row.get('material_servico', ''), row.get('orgao_responsavel', ''),
-                            row['situacao']
-                        ))
+                    # Importações grandes vão em lote: uma transação, sem reescrever linhas inalteradas
+                    resultado = bulk_upsert(conn, data)
+                    changes.update(dict.fromkeys(resultado['inseridos'], ALTERACAO_INSERCAO))
+                    changes.update(dict.fromkeys(resultado['atualizados'], ALTERACAO_ATUALIZACAO))
                 else:
+                    upsert_sql = '''
+                    INSERT INTO controle_dispensas (
+                        id_processo, nup, objeto, uasg, tipo, numero, ano, sigla_om, setor_responsavel, 
+                        material_servico, orgao_responsavel, situacao
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(id_processo) DO UPDATE SET
+                        nup=excluded.nup,
+                        objeto=excluded.objeto,
+                        uasg=excluded.uasg,
+                        tipo=excluded.tipo,
+                        numero=excluded.numero,
+                        ano=excluded.ano,
+                        sigla_om=excluded.sigla_om,
+                        setor_responsavel=excluded.setor_responsavel,
+                        material_servico=excluded.material_servico,
+                        orgao_responsavel=excluded.orgao_responsavel,
+                        situacao=excluded.situacao;
+                    '''
                     data['situacao'] = situacao
+                    existe = cursor.execute("SELECT 1 FROM controle_dispensas WHERE id_processo = ?", (data['id_processo'],)).fetchone()
+                    changes[data['id_processo']] = ALTERACAO_ATUALIZACAO if existe else ALTERACAO_INSERCAO
                     cursor.execute(upsert_sql, (
                         data['id_processo'], data['nup'], data['objeto'], data['uasg'],
                         data['tipo'], data['numero'], data['ano'],
                         data['sigla_om'], data.get('setor_responsavel', ''), 
                         data['material_servico'], data['orgao_responsavel'], data['situacao']
                     ))
-            conn.commit()
-        self.dataUpdated.emit()
+        if changes:
+            self.dataUpdated.emit(changes)
+        return resultado
 
 class UIManager:
     def __init__(self, parent, icons, config_manager, model):
@@ -220,16 +267,36 @@ class UIManager:
         """)
         self.main_layout.addWidget(self.search_bar)
 
-        def handle_text_change(text):
-            regex = QRegularExpression(text, QRegularExpression.PatternOption.CaseInsensitiveOption)
-            self.parent.proxy_model.setFilterRegularExpression(regex)
-
-        self.search_bar.textChanged.connect(handle_text_change)
+        # A busca é feita no índice FTS5 após uma pausa na digitação, não a cada tecla
+        self.search_timer = QTimer(self.parent)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(250)
+        self.search_timer.timeout.connect(self.executar_busca)
+        self.search_bar.textChanged.connect(self.search_timer.start)
         self.main_layout.addWidget(self.search_bar)
 
+    def executar_busca(self):
+        texto = self.search_bar.text().strip()
+        if not texto:
+            self.model.set_key_filter(None)
+            return
+        try:
+            with self.parent.connection_manager.connection() as conn:
+                ids = search_ids(conn, texto)
+            self.model.set_key_filter(ids)
+            # O modelo entrega os resultados na ordem do bm25; o proxy volta à ordem da origem para não
+            # reordená-los (ordenar por uma coluna depois da busca descarta o ranking)
+            self.parent.proxy_model.sort(-1)
+        except Exception as e:
+            logging.warning("Erro na busca: %s", e)
+
     def setup_buttons_layout(self):
         self.buttons_layout = QHBoxLayout()
         self.button_manager.add_buttons_to_layout(self.buttons_layout)
+        self.exportar_visao_checkbox = QCheckBox("Exportar só a visão atual")
+        self.exportar_visao_checkbox.setToolTip("Salva apenas as colunas visíveis e as linhas encontradas pela busca (Excel/CSV)")
+        self.exportar_visao_checkbox.toggled.connect(lambda marcado: setattr(self.parent, 'exportar_apenas_visiveis', marcado))
+        self.buttons_layout.addWidget(self.exportar_visao_checkbox)
         self.main_layout.addLayout(self.buttons_layout)
 
     def setup_table_view(self):
@@ -251,8 +318,6 @@ class UIManager:
     def configure_table_model(self):
         self.parent.proxy_model = QSortFilterProxyModel(self.parent)
         self.parent.proxy_model.setSourceModel(self.model)
-        self.parent.proxy_model.setFilterCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
-        self.parent.proxy_model.setFilterKeyColumn(-1)
         self.parent.proxy_model.setSortRole(Qt.ItemDataRole.UserRole)
         self.table_view.setModel(self.parent.proxy_model)
 
@@ -361,6 +426,18 @@ class UIManager:
         for i, col in enumerate(new_order):
             self.table_view.horizontalHeader().moveSection(self.table_view.horizontalHeader().visualIndex(col), i)
 
+    def visible_columns(self):
+        # Colunas visíveis na ordem em que aparecem na tabela: (nomes no banco, títulos)
+        header = self.table_view.horizontalHeader()
+        colunas, cabecalhos = [], []
+        for visual in range(header.count()):
+            logical = header.logicalIndex(visual)
+            if header.isSectionHidden(logical):
+                continue
+            colunas.append(self.model.columnName(logical))
+            cabecalhos.append(self.model.headerData(logical, Qt.Orientation.Horizontal))
+        return colunas, cabecalhos
+
     def hide_unwanted_columns(self):
         visible_columns = {0, 5, 7, 15, 17, 4, 10}
         for column in range(self.model.columnCount()):
@@ -0,0 +1,167 @@
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Colunas lidas pelo front-end em Rust (DispensaEletronicaData::load_or_create); vão primeiro no arquivo
+COLUNAS_RUST = ['numero', 'ano', 'id_processo', 'nup', 'objeto']
+
+# Campos de baixa cardinalidade: dicionário no Parquet e DictionaryArray no Arrow IPC.
+# As COLUNAS_RUST ficam de fora para continuarem Utf8 em qualquer formato
+COLUNAS_DICIONARIO = [
+    'tipo', 'situacao', 'material_servico', 'uasg', 'orgao_responsavel', 'sigla_om',
+    'setor_responsavel', 'operador', 'criterio_julgamento', 'com_disputa', 'pesquisa_preco',
+]
+
+# Linhas por row group (Parquet) / record batch (Arrow)
+TAMANHO_LOTE_COLUNAR = 65536
+
+
+def tipo_arrow(tipo_declarado):
+    # Mesma regra de afinidade do SQLite; tudo que não é numérico vira Utf8, como no lado Rust
+    tipo = (tipo_declarado or '').upper()
+    if 'INT' in tipo:
+        return pa.int64()
+    if any(nome in tipo for nome in ('REAL', 'FLOA', 'DOUB')):
+        return pa.float64()
+    return pa.string()
+
+
+def expressao_coluna(coluna, tipo):
+    # Valores vazios gravados em colunas numéricas viram nulos em vez de quebrar a conversão
+    if pa.types.is_int64(tipo):
+        return f"CAST(NULLIF({coluna}, '') AS INTEGER)"
+    if pa.types.is_float64(tipo):
+        return f"CAST(NULLIF({coluna}, '') AS REAL)"
+    return f"CAST({coluna} AS TEXT)"
+
+
+def ler_esquema(conn, tabela="controle_dispensas", colunas=None):
+    declaradas = {row[1]: row[2] for row in conn.execute(f"PRAGMA table_info({tabela})")}
+    if colunas is None:
+        colunas = [col for col in COLUNAS_RUST if col in declaradas]
+        colunas += [col for col in declaradas if col not in colunas]
+    return [(col, tipo_arrow(declaradas.get(col))) for col in colunas]
+
+
+def ler_dicionarios(conn, tabela, esquema):
+    # Um único dicionário por coluna para o arquivo todo: os lotes compartilham os mesmos índices,
+    # então o Arrow IPC não precisa de substituição de dicionário entre record batches
+    dicionarios = {}
+    for col, tipo in esquema:
+        if col in COLUNAS_DICIONARIO and pa.types.is_string(tipo):
+            valores = [row[0] for row in conn.execute(
+                f"SELECT DISTINCT CAST({col} AS TEXT) FROM {tabela} WHERE {col} IS NOT NULL ORDER BY 1")]
+            dicionarios[col] = (pa.array(valores, pa.string()), {valor: i for i, valor in enumerate(valores)})
+    return dicionarios
+
+
+def schema_arrow(esquema, dicionarios=None):
+    dicionarios = dicionarios or {}
+    return pa.schema([
+        pa.field(col, pa.dictionary(pa.int32(), pa.string()) if col in dicionarios else tipo)
+        for col, tipo in esquema
+    ])
+
+
+def consultar_colunar(conn, tabela, esquema, chave="id_processo"):
+    lista_colunas = ', '.join(expressao_coluna(col, tipo) for col, tipo in esquema)
+    return conn.execute(f"SELECT {lista_colunas} FROM {tabela} ORDER BY {chave}")
+
+
+def ler_em_lotes(cursor, tamanho_lote=TAMANHO_LOTE_COLUNAR):
+    while True:
+        linhas = cursor.fetchmany(tamanho_lote)
+        if not linhas:
+            return
+        yield linhas
+
+
+def montar_lote(linhas, esquema, dicionarios=None):
+    # Transpõe as linhas do SQLite em colunas e monta um RecordBatch
+    dicionarios = dicionarios or {}
+    colunas = list(zip(*linhas))
+    arrays = []
+    for (col, tipo), valores in zip(esquema, colunas):
+        if col in dicionarios:
+            dicionario, indices = dicionarios[col]
+            posicoes = pa.array([indices.get(valor) for valor in valores], pa.int32())
+            arrays.append(pa.DictionaryArray.from_arrays(posicoes, dicionario))
+        else:
+            arrays.append(pa.array(valores, tipo))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema_arrow(esquema, dicionarios))
+
+
+def _concluir(temporario, destino, cancelado):
+    # Troca atômica: quem estiver lendo o arquivo (ex.: o app em Rust) nunca vê uma escrita pela metade
+    if cancelado and cancelado():
+        temporario.unlink(missing_ok=True)
+        return False
+    os.replace(temporario, destino)
+    return True
+
+
+def escrever_parquet(destino, esquema, lotes, progresso=None, cancelado=None):
+    destino = Path(destino)
+    temporario = destino.with_name(destino.name + ".tmp")
+    colunas_dicionario = [col for col, tipo in esquema if col in COLUNAS_DICIONARIO and pa.types.is_string(tipo)]
+    gravadas = 0
+    # Colunas Utf8 comuns no arquivo; a codificação em dicionário é só física, o polars lê como Utf8
+    with pq.ParquetWriter(temporario, schema_arrow(esquema), compression='zstd', use_dictionary=colunas_dicionario) as writer:
+        for linhas in lotes:
+            writer.write_batch(montar_lote(linhas, esquema))
+            gravadas += len(linhas)
+            if progresso:
+                progresso(gravadas)
+    return gravadas if _concluir(temporario, destino, cancelado) else None
+
+
+def escrever_arrow(destino, esquema, lotes, dicionarios, progresso=None, cancelado=None):
+    destino = Path(destino)
+    temporario = destino.with_name(destino.name + ".tmp")
+    gravadas = 0
+    with pa.OSFile(str(temporario), 'wb') as arquivo:
+        with pa.ipc.new_file(arquivo, schema_arrow(esquema, dicionarios)) as writer:
+            for linhas in lotes:
+                writer.write_batch(montar_lote(linhas, esquema, dicionarios))
+                gravadas += len(linhas)
+                if progresso:
+                    progresso(gravadas)
+    return gravadas if _concluir(temporario, destino, cancelado) else None
+
+
+# Exporta a tabela para Parquet e/ou Arrow IPC a partir de um único snapshot do banco
+def exportar_colunar(connection_manager, destinos, tabela="controle_dispensas", tamanho_lote=TAMANHO_LOTE_COLUNAR):
+    resultado = {}
+    with connection_manager.snapshot() as conn:
+        esquema = ler_esquema(conn, tabela)
+        for destino in destinos:
+            inicio = time.perf_counter()
+            lotes = ler_em_lotes(consultar_colunar(conn, tabela, esquema), tamanho_lote)
+            if Path(destino).suffix.lower() == '.parquet':
+                linhas = escrever_parquet(destino, esquema, lotes)
+            else:
+                linhas = escrever_arrow(destino, esquema, lotes, ler_dicionarios(conn, tabela, esquema))
+            resultado[str(destino)] = linhas
+            print(f"{destino}: {linhas} linhas em {time.perf_counter() - inicio:.3f}s")
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta controle_dispensas para Parquet/Arrow IPC")
+    parser.add_argument("banco", help="Caminho do banco SQLite")
+    parser.add_argument("destinos", nargs='+', help="Arquivos .parquet e/ou .arrow (ex.: src/database/dispensa_eletronica.parquet)")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE_COLUNAR)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from connection_manager import get_connection_manager
+    exportar_colunar(get_connection_manager(args.banco), args.destinos, tamanho_lote=args.lote)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,14 @@ from PyQt6.QtWidgets import *
 from PyQt6.QtGui import *
 from PyQt6.QtCore import *
 from diretorios import *
+from modules.dispensa_eletronica.connection_manager import get_connection_manager
+from modules.dispensa_eletronica.reference_data import invalidar_agentes, texto_agente
+from modules.dispensa_eletronica.reference_sync import importar_agentes, exportar_agentes
 import sqlite3
 from pathlib import Path
 import pandas as pd
 import os
+import logging
 
 class ConfiguracoesDispensaDialog(QDialog):
     config_updated = pyqtSignal()
@@ -14,11 +18,16 @@ class ConfiguracoesDispensaDialog(QDialog):
         super().__init__(parent)
         self.parent = parent
         self.database_path = parent.database_path if parent else None
+        self.connection_manager = get_connection_manager(self.database_path) if self.database_path else None
         self.setWindowTitle("Alterar Agentes Responsáveis")
         self.setStyleSheet("background-color: #050f41; color: white;")
         self.setFixedSize(1100, 600)
         self.layout = QVBoxLayout(self)
 
+        # Os combos de agentes leem do cache; qualquer alteração confirmada aqui o invalida primeiro
+        if self.connection_manager:
+            self.config_updated.connect(lambda: invalidar_agentes(self.connection_manager))
+
         header_widget = self.update_title_label_config()
         self.layout.addWidget(header_widget)
         self.initialize_ui()
@@ -54,7 +63,7 @@ class ConfiguracoesDispensaDialog(QDialog):
         self.table_view = QTableView()
         self.table_view.setFont(QFont('Arial', 12))  # Aumenta o tamanho da fonte geral para 12
         self.table_view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
-        self.table_view.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.table_view.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
         
         # Definindo o estilo da linha selecionada
         self.table_view.setStyleSheet("""
@@ -91,38 +100,45 @@ class ConfiguracoesDispensaDialog(QDialog):
         if event.type() == QEvent.Type.KeyPress and event.key() == Qt.Key.Key_Delete:
             print("Tecla 'Delete' pressionada")
             self.excluirAgente()
+        elif event.type() == QEvent.Type.KeyPress and event.matches(QKeySequence.StandardKey.Paste):
+            self.colarAgentes()
+            return True
         return super().eventFilter(source, event)
 
+    def done(self, result):
+        # Salvar grava as edições pendentes; Cancelar/Esc descarta as que o timer ainda não gravou.
+        # Se a gravação falhar, o erro é exibido e o diálogo continua aberto com as edições
+        if hasattr(self, 'table_model'):
+            if result == QDialog.DialogCode.Rejected:
+                self.table_model.descartar()
+            else:
+                try:
+                    gravado = self.table_model.flush()
+                except Exception as e:
+                    QMessageBox.critical(self, "Erro", f"Erro ao gravar os agentes responsáveis: {e}")
+                    return
+                if not gravado:
+                    return
+        super().done(result)
+
+    def colarAgentes(self):
+        texto = QApplication.clipboard().text()
+        if not texto or not hasattr(self, 'table_model'):
+            return
+        valores = [linha.split('\t') for linha in texto.rstrip('\n').split('\n')]
+        index = self.table_view.currentIndex()
+        row = index.row() if index.isValid() else self.table_model.rowCount()
+        column = index.column() if index.isValid() else 0
+        self.table_model.pasteValues(row, column, valores)
+
     def gerarTabela(self):
         try:
-            # Conectar ao banco de dados
-            with sqlite3.connect(self.database_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT nome, posto, funcao FROM controle_agentes_responsaveis")
-                data = cursor.fetchall()
-            
-            # Converter os dados para um DataFrame do pandas
-            df = pd.DataFrame(data, columns=["Nome", "Posto", "Função"])
-            
+            if hasattr(self, 'table_model'):
+                self.table_model.flush()
             # Definir o caminho para salvar a planilha Excel
             excel_path = Path("controle_agentes_responsaveis.xlsx")
-            
-            # Salvar o DataFrame como um arquivo Excel usando pandas
-            df.to_excel(excel_path, index=False)
-            
-            # Ajustar o tamanho das colunas usando openpyxl
-            from openpyxl import load_workbook
-            wb = load_workbook(excel_path)
-            ws = wb.active
-
-            # Ajustar o tamanho das colunas
-            column_widths = {"A": 45, "B": 30, "C": 35}
-            for col, width in column_widths.items():
-                ws.column_dimensions[col].width = width
-
-            # Salvar as alterações no arquivo Excel
-            wb.save(excel_path)
-            
+            exportar_agentes(self.connection_manager, excel_path)
+
             # Abrir o arquivo Excel criado
             os.startfile(excel_path)
         except Exception as e:
@@ -130,6 +146,8 @@ class ConfiguracoesDispensaDialog(QDialog):
 
     def importarTabela(self):
         try:
+            if hasattr(self, 'table_model'):
+                self.table_model.flush()
             # Abrir o diálogo para selecionar o arquivo Excel
             file_dialog = QFileDialog()
             file_dialog.setFileMode(QFileDialog.FileMode.ExistingFile)
@@ -137,55 +155,42 @@ class ConfiguracoesDispensaDialog(QDialog):
             if file_dialog.exec():
                 file_path = file_dialog.selectedFiles()[0]
 
-                # Ler o arquivo Excel usando pandas
-                df = pd.read_excel(file_path)
-
-                # Verificar se as colunas necessárias estão presentes
-                required_columns = ["Nome", "Posto", "Função"]
-                if not all(column in df.columns for column in required_columns):
-                    raise Exception("O arquivo Excel deve conter as colunas: Nome, Posto, Função")
-
-                # Conectar ao banco de dados
-                with sqlite3.connect(self.database_path) as conn:
-                    cursor = conn.cursor()
-                    
-                    # Deletar os valores existentes
-                    cursor.execute("DELETE FROM controle_agentes_responsaveis")
-                    
-                    # Inserir os novos valores
-                    for _, row in df.iterrows():
-                        cursor.execute("INSERT INTO controle_agentes_responsaveis (nome, posto, funcao) VALUES (?, ?, ?)",
-                                    (row["Nome"], row["Posto"], row["Função"]))
-                    
-                    conn.commit()
+                # Carrega a planilha em uma tabela sombra e troca pela atual em uma única transação
+                tempos = importar_agentes(self.connection_manager, file_path)
+                invalidar_agentes(self.connection_manager)
 
                 # Recarregar a tabela na interface
                 self.carregarAgentesResponsaveis()
-                QMessageBox.information(self, "Sucesso", "Tabela importada com sucesso!")
+                QMessageBox.information(self, "Sucesso", (
+                    f"Tabela importada com sucesso!\n{tempos['linhas']} agentes "
+                    f"(leitura {tempos['leitura_ms']} ms, gravação {tempos['total_ms']} ms)"
+                ))
         except Exception as e:
             QMessageBox.critical(self, "Erro", f"Erro ao importar a tabela: {e}")
 
     def save_and_emit(self):
         print("Salvando configurações e emitindo sinal...")
         self.accept()
-        self.config_updated.emit()
+        if self.result() == QDialog.DialogCode.Accepted:
+            self.config_updated.emit()
 
     def carregarAgentesResponsaveis(self):
         try:
+            if hasattr(self, 'table_model'):
+                self.table_model.flush()
             print("Tentando conectar ao banco de dados...")
-            with sqlite3.connect(self.database_path) as conn:
+            with self.connection_manager.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='controle_agentes_responsaveis'")
                 if cursor.fetchone() is None:
                     raise Exception("A tabela 'controle_agentes_responsaveis' não existe no banco de dados. Configure os Ordenadores de Despesa no Módulo 'Configurações'.")
 
-                sql_query_agentes_responsaveis = "SELECT nome, posto, funcao FROM controle_agentes_responsaveis"
+                sql_query_agentes_responsaveis = "SELECT rowid, nome, posto, funcao FROM controle_agentes_responsaveis"
                 cursor.execute(sql_query_agentes_responsaveis)
                 agentes_responsaveis = cursor.fetchall()
                 
                 if agentes_responsaveis:
-                    agentes_responsaveis = [list(row) for row in agentes_responsaveis]  # Converte tuplas em listas
-                    self.table_model = AgentesResponsaveisTableModel(agentes_responsaveis, self.database_path)
+                    self.table_model = AgentesResponsaveisTableModel(agentes_responsaveis, self.database_path, self)
                     self.table_view.setModel(self.table_model)
                     self.table_view.setItemDelegateForColumn(1, ComboBoxDelegate([
                         "Capitão de Mar e Guerra (IM)", "Capitão de Fragata (IM)", "Capitão de Corveta (IM)", 
@@ -212,7 +217,8 @@ class ConfiguracoesDispensaDialog(QDialog):
         selected_indexes = self.table_view.selectionModel().selectedRows()
         print(f"Índices selecionados: {selected_indexes}")  # Print para verificar os índices selecionados
         if selected_indexes:
-            for index in sorted(selected_indexes, reverse=True):
+            # De baixo para cima para não deslocar as linhas seguintes; a gravação fica para o próximo flush
+            for index in sorted(selected_indexes, key=lambda index: index.row(), reverse=True):
                 print(f"Excluindo linha: {index.row()}")  # Print para verificar a linha sendo excluída
                 self.table_model.removeRow(index.row())
         else:
@@ -279,17 +285,36 @@ class ComboBoxDelegate(QStyledItemDelegate):
     def updateEditorGeometry(self, editor, option, index):
         editor.setGeometry(option.rect)
 
+# Intervalo sem edições após o qual as alterações pendentes são gravadas no banco
+INTERVALO_GRAVACAO_MS = 2000
+
+COLUNAS_AGENTES = ['nome', 'posto', 'funcao']
+
+
+# As edições ficam em memória e são gravadas em lote (uma transação) pelo timer ou ao fechar o diálogo.
+# Cada linha é identificada pelo rowid do banco; linhas novas usam uma chave provisória negativa até
+# serem gravadas.
 class AgentesResponsaveisTableModel(QAbstractTableModel):
-    def __init__(self, data, database_path):
-        super().__init__()
-        self._data = data
+    def __init__(self, data, database_path, parent=None):
+        super().__init__(parent)
+        self._chaves = [row[0] for row in data]
+        self._data = [list(row[1:]) for row in data]
         self._headers = ["Nome", "Posto", "Função"]
         self.database_path = database_path
-
-    def rowCount(self, index):
+        self.connection_manager = get_connection_manager(database_path)
+        self._proxima_chave_nova = -1
+        self._inseridos = set()
+        self._atualizados = set()
+        self._excluidos = set()
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(INTERVALO_GRAVACAO_MS)
+        self._timer.timeout.connect(self.flush)
+
+    def rowCount(self, index=QModelIndex()):
         return len(self._data)
 
-    def columnCount(self, index):
+    def columnCount(self, index=QModelIndex()):
         return len(self._headers)
 
     def data(self, index, role):
@@ -306,7 +331,7 @@ class AgentesResponsaveisTableModel(QAbstractTableModel):
     def setData(self, index, value, role):
         if role == Qt.ItemDataRole.EditRole:
             self._data[index.row()][index.column()] = value
-            self.updateDatabase(index.row(), index.column(), value)
+            self._marcar_atualizado(index.row())
             self.dataChanged.emit(index, index, (Qt.ItemDataRole.EditRole,))
             return True
         return False
@@ -314,39 +339,119 @@ class AgentesResponsaveisTableModel(QAbstractTableModel):
     def flags(self, index):
         return Qt.ItemFlag.ItemIsSelectable | Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsEditable
 
-    def updateDatabase(self, row, column, value):
-        try:
-            with sqlite3.connect(self.database_path) as conn:
-                cursor = conn.cursor()
-                headers = ['nome', 'posto', 'funcao']
-                query = f"UPDATE controle_agentes_responsaveis SET {headers[column]} = ? WHERE rowid = ?"
-                cursor.execute(query, (value, row + 1))  # rowid é 1-indexado
-                conn.commit()
-        except Exception as e:
-            QMessageBox.critical(None, "Erro", f"Erro ao atualizar o banco de dados: {e}")
+    def has_pending_changes(self):
+        return bool(self._inseridos or self._atualizados or self._excluidos)
+
+    def _agendar(self):
+        self._timer.start()
+
+    def _marcar_atualizado(self, row):
+        chave = self._chaves[row]
+        if chave not in self._inseridos:
+            self._atualizados.add(chave)
+        self._agendar()
 
     def addRow(self):
-        self.beginInsertRows(QModelIndex(), self.rowCount(None), self.rowCount(None))
-        self._data.append(["", "", ""])  # Adiciona uma linha vazia
+        self.insertAgentes([["", "", ""]])
+
+    def insertAgentes(self, linhas):
+        inicio = self.rowCount()
+        self.beginInsertRows(QModelIndex(), inicio, inicio + len(linhas) - 1)
+        for linha in linhas:
+            chave = self._proxima_chave_nova
+            self._proxima_chave_nova -= 1
+            self._chaves.append(chave)
+            self._data.append(list(linha))
+            self._inseridos.add(chave)
         self.endInsertRows()
-
-        try:
-            with sqlite3.connect(self.database_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("INSERT INTO controle_agentes_responsaveis (nome, posto, funcao) VALUES (?, ?, ?)", ("", "", ""))
-                conn.commit()
-        except Exception as e:
-            QMessageBox.critical(None, "Erro", f"Erro ao adicionar ao banco de dados: {e}")
+        self._agendar()
 
     def removeRow(self, row, parent=QModelIndex()):
-        self.beginRemoveRows(QModelIndex(), row, row)
-        self._data.pop(row)
+        return self.removeRows(row, 1, parent)
+
+    def removeRows(self, row, count, parent=QModelIndex()):
+        self.beginRemoveRows(QModelIndex(), row, row + count - 1)
+        for chave in self._chaves[row:row + count]:
+            if chave in self._inseridos:
+                self._inseridos.discard(chave)
+            else:
+                self._atualizados.discard(chave)
+                self._excluidos.add(chave)
+        del self._chaves[row:row + count]
+        del self._data[row:row + count]
         self.endRemoveRows()
-
+        self._agendar()
+        return True
+
+    def pasteValues(self, row, column, valores):
+        # Cola uma grade de valores (ex.: copiada do Excel) a partir da célula indicada, criando linhas se preciso
+        faltantes = row + len(valores) - self.rowCount()
+        if faltantes > 0:
+            self.insertAgentes([["", "", ""] for _ in range(faltantes)])
+        for i, linha in enumerate(valores):
+            for j, valor in enumerate(linha[:self.columnCount() - column]):
+                self._data[row + i][column + j] = valor
+            self._marcar_atualizado(row + i)
+        ultima_coluna = min(column + max(len(linha) for linha in valores), self.columnCount()) - 1
+        self.dataChanged.emit(self.index(row, column), self.index(row + len(valores) - 1, ultima_coluna), (Qt.ItemDataRole.EditRole,))
+
+    def descartar(self):
+        # Esquece as edições ainda não gravadas (o diálogo está sendo cancelado)
+        self._timer.stop()
+        self._inseridos.clear()
+        self._atualizados.clear()
+        self._excluidos.clear()
+
+    def flush(self):
+        self._timer.stop()
+        if not self.has_pending_changes():
+            return True
+        linhas = {chave: self._data[i] for i, chave in enumerate(self._chaves)}
+        novos = [chave for chave in self._chaves if chave in self._inseridos]
         try:
-            with sqlite3.connect(self.database_path) as conn:
+            with self.connection_manager.connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute("DELETE FROM controle_agentes_responsaveis WHERE rowid = ?", (row + 1,))
-                conn.commit()
+                cursor.executemany("DELETE FROM controle_agentes_responsaveis WHERE rowid = ?",
+                                   [(chave,) for chave in self._excluidos])
+                cursor.executemany("UPDATE controle_agentes_responsaveis SET nome = ?, posto = ?, funcao = ? WHERE rowid = ?",
+                                   [(*linhas[chave], chave) for chave in self._atualizados])
+                chaves_gravadas = {}
+                for chave in novos:
+                    cursor.execute("INSERT INTO controle_agentes_responsaveis (nome, posto, funcao) VALUES (?, ?, ?)", linhas[chave])
+                    chaves_gravadas[chave] = cursor.lastrowid
         except Exception as e:
-            QMessageBox.critical(None, "Erro", f"Erro ao remover do banco de dados: {e}")
\ No newline at end of file
+            QMessageBox.critical(None, "Erro", f"Erro ao gravar no banco de dados: {e}")
+            return False
+        self._chaves = [chaves_gravadas.get(chave, chave) for chave in self._chaves]
+        logging.info("Agentes gravados: %d inseridos, %d atualizados, %d excluídos",
+                     len(novos), len(self._atualizados), len(self._excluidos))
+        self._inseridos.clear()
+        self._atualizados.clear()
+        self._excluidos.clear()
+        invalidar_agentes(self.connection_manager)
+        return True
+
+
+# Modelo leve para os combos de agentes: a lista inteira é trocada de uma vez, sem addItem por item
+class AgentesListModel(QAbstractListModel):
+    def __init__(self, agentes=None, parent=None):
+        super().__init__(parent)
+        self._agentes = agentes or []
+
+    def set_agentes(self, agentes):
+        self.beginResetModel()
+        self._agentes = agentes
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._agentes)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        agente = self._agentes[index.row()]
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            return texto_agente(agente)
+        if role == Qt.ItemDataRole.UserRole:
+            return agente
+        return None
@@ -0,0 +1,230 @@
+from PyQt6.QtSql import QSqlDatabase, QSqlQuery
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import quote
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+PRAGMAS = [
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -32000",
+    "PRAGMA busy_timeout = 5000",
+]
+
+# WAL e mmap dependem de memória compartilhada e travas que não funcionam em compartilhamentos de rede
+# (SMB/NFS): nesses caminhos o banco continua no journal DELETE, sem mmap
+PRAGMAS_DISCO_LOCAL = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA mmap_size = 268435456",
+]
+
+PRAGMAS_REDE = [
+    "PRAGMA journal_mode = DELETE",
+    "PRAGMA synchronous = FULL",
+    "PRAGMA mmap_size = 0",
+]
+
+# Força (1) ou desativa (0) o WAL independentemente da detecção do tipo de disco
+VARIAVEL_WAL = "DISPENSA_SQLITE_WAL"
+
+SISTEMAS_ARQUIVOS_REDE = {'nfs', 'nfs4', 'cifs', 'smbfs', 'smb3', 'afs', 'ncpfs', 'fuse.sshfs', '9p'}
+
+
+def caminho_em_rede(caminho):
+    caminho = Path(caminho).resolve()
+    if str(caminho).startswith('\\\\'):
+        return True
+    if sys.platform == 'win32':
+        import ctypes
+        # GetDriveTypeW: 4 = DRIVE_REMOTE (unidade mapeada)
+        return ctypes.windll.kernel32.GetDriveTypeW(caminho.anchor) == 4
+    try:
+        with open('/proc/mounts') as mounts:
+            pontos = [linha.split()[1:3] for linha in mounts]
+    except OSError:
+        return False
+    # Ponto de montagem mais longo que contém o caminho
+    melhor, tipo = '', None
+    for ponto, fs in pontos:
+        ponto = ponto.replace('\\040', ' ')
+        if (str(caminho) == ponto or str(caminho).startswith(ponto.rstrip('/') + '/')) and len(ponto) > len(melhor):
+            melhor, tipo = ponto, fs
+    return tipo in SISTEMAS_ARQUIVOS_REDE
+
+
+def uri_somente_leitura(caminho):
+    # URI "file:" montada à mão: Path.as_uri() transforma \\servidor\share em file://servidor/share, e o SQLite
+    # recusa URIs com autoridade diferente de localhost. O caminho absoluto vai com barras normais e sem
+    # autoridade (UNC: file:////servidor/share/..., Windows: file:/C:/...), com %, ? e # escapados
+    absoluto = os.path.abspath(caminho).replace('\\', '/')
+    if absoluto.startswith('//'):
+        absoluto = '//' + absoluto
+    elif not absoluto.startswith('/'):
+        absoluto = '/' + absoluto
+    return f"file:{quote(absoluto, safe='/:')}?mode=ro"
+
+
+def usar_wal(database_path):
+    forcado = os.environ.get(VARIAVEL_WAL)
+    if forcado in ('0', '1'):
+        return forcado == '1'
+    return not caminho_em_rede(database_path)
+
+# Tamanho do cache de instruções preparadas mantido pelo sqlite3 em cada conexão
+CACHED_STATEMENTS = 256
+
+
+# Conexões SQLite de longa duração, uma por thread, compartilhadas por todo o processo
+class ConnectionManager:
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, database_path):
+        self.database_path = Path(database_path)
+        self.wal = usar_wal(self.database_path)
+        self.pragmas = PRAGMAS + (PRAGMAS_DISCO_LOCAL if self.wal else PRAGMAS_REDE)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = {}
+        self._qt_connections = set()
+        self.stats = {
+            'conexoes_abertas': 0,
+            'reutilizacoes': 0,
+            'consultas': 0,
+            'tempo_total_ms': 0.0,
+            'tempo_conexao_ms': 0.0,
+        }
+
+    @classmethod
+    def instance(cls, database_path):
+        key = str(Path(database_path).resolve())
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(database_path)
+            return cls._instances[key]
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def _open(self):
+        inicio = time.perf_counter()
+        conn = sqlite3.connect(self.database_path, cached_statements=CACHED_STATEMENTS, check_same_thread=False)
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        self._count('conexoes_abertas')
+        self._count('tempo_conexao_ms', (time.perf_counter() - inicio) * 1000)
+        with self._lock:
+            self._connections[threading.get_ident()] = conn
+        return conn
+
+    def get_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._open()
+        else:
+            self._count('reutilizacoes')
+        return conn
+
+    @contextmanager
+    def connection(self, imediata=False):
+        # Mesma semântica de "with sqlite3.connect(...) as conn": commit no sucesso, rollback no erro,
+        # mas a conexão continua aberta para a próxima chamada. A conexão é a mesma para toda a thread,
+        # então só o bloco mais externo faz commit/rollback. Ele abre a transação com BEGIN logo na
+        # entrada (imediata=True: BEGIN IMMEDIATE, já com o lock de escrita), assim os blocos aninhados
+        # sempre criam o SAVEPOINT dentro dela e desfazem apenas o próprio trabalho, sem confirmar a
+        # transação de quem os chamou
+        conn = self.get_connection()
+        nivel = getattr(self._local, 'nivel', 0)
+        savepoint = f"conexao_nivel_{nivel}" if nivel else None
+        if savepoint:
+            conn.execute(f"SAVEPOINT {savepoint}")
+        elif not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE" if imediata else "BEGIN")
+        self._local.nivel = nivel + 1
+        inicio = time.perf_counter()
+        try:
+            yield conn
+            if not savepoint:
+                conn.commit()
+            elif conn.in_transaction:
+                conn.execute(f"RELEASE {savepoint}")
+        except Exception:
+            if not savepoint:
+                conn.rollback()
+            elif conn.in_transaction:
+                conn.execute(f"ROLLBACK TO {savepoint}")
+                conn.execute(f"RELEASE {savepoint}")
+            raise
+        finally:
+            self._local.nivel = nivel
+            self._count('consultas')
+            self._count('tempo_total_ms', (time.perf_counter() - inicio) * 1000)
+
+    def execute(self, sql, params=()):
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    @contextmanager
+    def snapshot(self):
+        # Conexão própria, somente leitura, com uma transação aberta: no modo WAL todas as consultas
+        # dentro do bloco enxergam o mesmo estado do banco, mesmo que a interface grave em paralelo.
+        # No journal DELETE (banco em rede) a leitura mantém o lock compartilhado e as gravações
+        # esperam o fim do bloco (até o busy_timeout)
+        inicio = time.perf_counter()
+        conn = sqlite3.connect(uri_somente_leitura(self.database_path), uri=True, cached_statements=CACHED_STATEMENTS)
+        self._count('conexoes_abertas')
+        self._count('tempo_conexao_ms', (time.perf_counter() - inicio) * 1000)
+        try:
+            conn.execute("PRAGMA busy_timeout = 5000")
+            conn.execute("BEGIN")
+            yield conn
+        finally:
+            conn.rollback()
+            conn.close()
+
+    def release_thread(self):
+        # Fecha a conexão da thread atual (usar ao final de threads de trabalho)
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+            with self._lock:
+                self._connections.pop(threading.get_ident(), None)
+
+    def qt_database(self):
+        # Conexão QSqlDatabase nomeada por thread, aberta uma única vez e reaproveitada
+        name = f"{self.database_path.stem}_{threading.get_ident()}"
+        if QSqlDatabase.contains(name):
+            db = QSqlDatabase.database(name, open=False)
+            if db.isOpen():
+                self._count('reutilizacoes')
+                return db
+        else:
+            db = QSqlDatabase.addDatabase('QSQLITE', name)
+            db.setDatabaseName(str(self.database_path))
+        inicio = time.perf_counter()
+        if db.open():
+            query = QSqlQuery(db)
+            for pragma in self.pragmas:
+                query.exec(pragma)
+            self._qt_connections.add(name)
+            self._count('conexoes_abertas')
+            self._count('tempo_conexao_ms', (time.perf_counter() - inicio) * 1000)
+        return db
+
+    def report(self):
+        with self._lock:
+            stats = dict(self.stats)
+        total = stats['conexoes_abertas'] + stats['reutilizacoes']
+        stats['taxa_reutilizacao'] = stats['reutilizacoes'] / total if total else 0.0
+        stats['latencia_media_ms'] = stats['tempo_total_ms'] / stats['consultas'] if stats['consultas'] else 0.0
+        return stats
+
+
+def get_connection_manager(database_path):
+    return ConnectionManager.instance(database_path)
@@ -0,0 +1,177 @@
+import re
+from datetime import datetime
+
+from num2words import num2words
+
+# Documentos gerados a partir dos templates: (template, subpasta, descrição do arquivo)
+DOCUMENTO_AUTORIZACAO = ("autorizacao_dispensa", "1. Autorizacao", "Autorizacao para abertura de Processo Administrativo")
+DOCUMENTO_AVISO = ("aviso_dispensa", "3. Aviso", "Aviso de Dispensa")
+
+# Partes da Comunicação Padronizada, na ordem do PDF final. Entradas sem template são anexos: o último
+# PDF salvo pelo usuário na subpasta
+DOCUMENTOS_CP = [
+    {"template": "cp", "subfolder": "2. CP e anexos", "desc": "Comunicacao Padronizada"},
+    {"template": "dfd", "subfolder": "2. CP e anexos/DFD", "desc": "Documento de Formalizacao de Demanda", "cover": "dfd.pdf"},
+    {"subfolder": "2. CP e anexos/DFD/Anexo A - Relatorio Safin", "cover": "anexo-a-dfd.pdf"},
+    {"subfolder": "2. CP e anexos/DFD/Anexo B - Especificações e Quantidade", "cover": "anexo-b-dfd.pdf"},
+    {"template": "tr", "subfolder": "2. CP e anexos/TR", "desc": "Termo de Referencia", "cover": "tr.pdf"},
+    {"subfolder": "2. CP e anexos/TR/Pesquisa de Preços", "cover": "anexo-tr.pdf"},
+    {"template": "dec_adeq", "subfolder": "2. CP e anexos/Declaracao de Adequação Orçamentária", "desc": "Declaracao de Adequação Orçamentária", "cover": "dec_adeq.pdf"},
+    {"subfolder": "2. CP e anexos/Declaracao de Adequação Orçamentária/Relatório do PDM-Catser", "cover": "anexo-dec-adeq.pdf"},
+    {"template": "justificativas", "subfolder": "2. CP e anexos/Justificativas Relevantes", "desc": "Justificativas Relevantes", "cover": "justificativas.pdf"},
+]
+
+# Pastas de anexos (PDFs salvos pelo usuário) de cada processo
+SUBPASTAS_ANEXOS = [doc["subfolder"] for doc in DOCUMENTOS_CP if "template" not in doc]
+
+SUBPASTAS_PROCESSO = [
+    '1. Autorizacao',
+    '2. CP e anexos',
+    '3. Aviso',
+    '2. CP e anexos/DFD',
+    '2. CP e anexos/DFD/Anexo A - Relatorio Safin',
+    '2. CP e anexos/DFD/Anexo B - Especificações e Quantidade',
+    '2. CP e anexos/TR',
+    '2. CP e anexos/TR/Pesquisa de Preços',
+    '2. CP e anexos/Declaracao de Adequação Orçamentária',
+    '2. CP e anexos/Declaracao de Adequação Orçamentária/Relatório do PDM-Catser',
+    '2. CP e anexos/Justificativas Relevantes',
+]
+
+
+def nome_pasta_processo(id_processo, objeto):
+    # "/" não pode fazer parte do nome da pasta, nem no id_processo nem no objeto
+    return f"{id_processo.replace('/', '-')} - {objeto.replace('/', '-')}"
+
+
+def id_da_pasta_processo(nome):
+    # "DE 15-2024 - Objeto" -> "DE 15/2024" (inverso de nome_pasta_processo)
+    return nome.split(' - ', 1)[0].replace('-', '/')
+
+
+def criar_pastas_processo(pasta_processo):
+    pastas_necessarias = [pasta_processo / subpasta for subpasta in SUBPASTAS_PROCESSO]
+    for pasta in pastas_necessarias:
+        if not pasta.exists():
+            pasta.mkdir(parents=True)
+    return pastas_necessarias
+
+
+def caminho_documento(pasta_processo, id_processo, subfolder_name, file_description):
+    return pasta_processo / subfolder_name / f"{id_processo.replace('/', '-')} - {file_description}.docx"
+
+
+def valor_por_extenso(valor):
+    valor = valor.replace('R$', '').replace('.', '').replace(',', '.').strip()
+    valor_float = float(valor)
+    parte_inteira = int(valor_float)
+    parte_decimal = int(round((valor_float - parte_inteira) * 100))
+
+    if parte_decimal > 0:
+        valor_extenso = f"{num2words(parte_inteira, lang='pt_BR')} reais e {num2words(parte_decimal, lang='pt_BR')} centavos"
+    else:
+        valor_extenso = f"{num2words(parte_inteira, lang='pt_BR')} reais"
+
+    # Corrige "um reais" para "um real"
+    valor_extenso = valor_extenso.replace("um reais", "um real")
+
+    return valor_extenso
+
+
+def alterar_posto(posto):
+    # Define um dicionário de mapeamento de postos e suas respectivas abreviações
+    mapeamento_postos = {
+        r'Capitão[\s\-]de[\s\-]Corveta': 'CC',
+        r'Capitão[\s\-]de[\s\-]Fragata': 'CF',
+        r'Capitão[\s\-]de[\s\-]Mar[\s\-]e[\s\-]Guerra': 'CMG',
+        r'Capitão[\s\-]Tenente': 'CT',
+        r'Primeiro[\s\-]Tenente': '1ºTen',
+        r'Segundo[\s\-]Tenente': '2ºTen',
+        r'Primeiro[\s\-]Sargento': '1ºSG',
+        r'Segundo[\s\-]Sargento': '2ºSG',
+        r'Terceiro[\s\-]Sargento': '3ºSG',
+        r'Cabo': 'CB',
+        r'Sub[\s\-]oficial': 'SO',
+    }
+
+    # Itera sobre o dicionário de mapeamento e aplica a substituição
+    for padrao, substituicao in mapeamento_postos.items():
+        if re.search(padrao, posto, re.IGNORECASE):
+            return re.sub(padrao, substituicao, posto, flags=re.IGNORECASE)
+
+    # Retorna o posto original se nenhuma substituição for aplicada
+    return posto
+
+
+def formatar_responsavel(chave, data, context):
+    responsavel = data.get(chave)
+    if responsavel and isinstance(responsavel, str):
+        try:
+            nome, posto, funcao = responsavel.split('\n')
+            posto_alterado = alterar_posto(posto)
+            responsavel_dict = {
+                'nome': nome,
+                'posto': posto_alterado,
+            }
+            responsavel_extenso = f"{responsavel_dict.get('posto', '')} {responsavel_dict.get('nome', '')}"
+            context.update({f'{chave}_formatado': responsavel_extenso})
+        except ValueError:
+            context.update({f'{chave}_formatado': 'Não especificado\nNão especificado'})
+    else:
+        context.update({f'{chave}_formatado': 'Não especificado\nNão especificado'})
+
+
+def preparar_contexto(data):
+    context = {key: (str(value) if value is not None else 'Não especificado') for key, value in data.items()}
+    descricao_servico = "aquisição de" if data['material_servico'] == "Material" else "contratação de empresa especializada em"
+    descricao_servico_primeira_letra_maiuscula = descricao_servico[0].upper() + descricao_servico[1:]
+    context.update({'descricao_servico': descricao_servico})
+    context.update({'descricao_servico_primeira_letra_maiuscula': descricao_servico_primeira_letra_maiuscula})
+
+    # Processar responsável pela demanda e operador
+    formatar_responsavel('responsavel_pela_demanda', data, context)
+    formatar_responsavel('operador', data, context)
+
+    valor_total = data.get('valor_total')
+    if valor_total and isinstance(valor_total, str):
+        valor_extenso = valor_por_extenso(valor_total)
+        valor_total_e_extenso = f"{valor_total} ({valor_extenso})"
+        context.update({'valor_total_e_extenso': valor_total_e_extenso})
+    else:
+        context.update({'valor_total_e_extenso': 'Não especificado'})
+
+    # Lógica para atividade_custeio
+    if data.get('atividade_custeio') == 'Sim':
+        texto_custeio = (
+            "A presente contratação por dispensa de licitação está enquadrada como atividade de custeio, "
+            "conforme mencionado no artigo 2º da Portaria ME nº 7.828, de 30 de agosto de 2022. "
+            "Conforme previsão do art. 3º do Decreto nº 10.193, de 27 de dezembro de 2019, e as normas "
+            "infralegais de delegação de competência no âmbito da Marinha, que estabelecem limites e instâncias "
+            "de governança, essa responsabilidade é delegada ao ordenador de despesas, respeitando os valores "
+            "estipulados no decreto."
+        )
+    else:
+        texto_custeio = (
+            "A presente contratação por dispensa de licitação não se enquadra nas hipóteses de atividades de "
+            "custeio previstas no Decreto nº 10.193, de 27 de dezembro de 2019, pois o objeto contratado não se "
+            "relaciona diretamente às atividades comuns de suporte administrativo mencionadas no artigo 2º da "
+            "Portaria ME nº 7.828, de 30 de agosto de 2022."
+        )
+    context.update({'texto_custeio': texto_custeio})
+
+    # Alterar formato de data_sessao
+    data_sessao = data.get('data_sessao')
+    if data_sessao:
+        try:
+            data_obj = datetime.strptime(data_sessao, '%Y-%m-%d')
+            dia_semana = data_obj.strftime('%A')
+            data_formatada = data_obj.strftime('%d/%m/%Y') + f" ({dia_semana})"
+            context.update({'data_sessao_formatada': data_formatada})
+        except ValueError as e:
+            context.update({'data_sessao_formatada': 'Data inválida'})
+            print("Erro ao processar data da sessão:", e)
+    else:
+        context.update({'data_sessao_formatada': 'Não especificado'})
+        print("Data da sessão não especificada")
+
+    return context
@@ -0,0 +1,460 @@
+import abc
+import atexit
+import logging
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from pathlib import Path
+
+# Tempo máximo de conversão de um documento antes de o processo conversor ser reiniciado
+TIMEOUT_CONVERSAO = 120
+
+# Conversões LibreOffice em paralelo; cada vaga converte um documento por vez
+TAMANHO_POOL_LIBREOFFICE = min(4, os.cpu_count() or 1)
+
+CAMINHOS_SOFFICE = [
+    "soffice", "libreoffice",
+    "/usr/bin/soffice", "/usr/lib/libreoffice/program/soffice", "/opt/libreoffice/program/soffice",
+    r"C:\Program Files\LibreOffice\program\soffice.exe",
+]
+
+
+class ErroConversao(Exception):
+    pass
+
+
+def _pdf_de(docx_path):
+    return Path(docx_path).with_suffix('.pdf')
+
+
+def _verificar_pdf(pdf_path):
+    if not pdf_path.exists():
+        raise FileNotFoundError(f"O arquivo PDF não foi criado: {pdf_path}")
+    return pdf_path
+
+
+# Interface comum: converte um lote de .docx em PDFs gravados ao lado de cada arquivo, na mesma ordem
+class ConversorDocumentos(abc.ABC):
+    nome = None
+
+    @abc.abstractmethod
+    def converter(self, docx_paths, timeout=TIMEOUT_CONVERSAO):
+        pass
+
+    def converter_um(self, docx_path, timeout=TIMEOUT_CONVERSAO):
+        return self.converter([docx_path], timeout)[0]
+
+    def fechar(self):
+        pass
+
+
+def _pid_word(word):
+    # A Application do Word não expõe o PID; uma legenda única permite achar a janela e, por ela, o processo
+    try:
+        import win32gui
+        import win32process
+        legenda = f"conversor_dispensa_{os.getpid()}_{threading.get_ident()}"
+        word.Caption = legenda
+        hwnd = win32gui.FindWindow("OpusApp", legenda)
+        return win32process.GetWindowThreadProcessId(hwnd)[1] if hwnd else None
+    except Exception:
+        return None
+
+
+# Word via COM (Windows). O objeto COM só pode ser usado na thread que o criou, então uma thread dedicada
+# inicializa o COM, mantém a instância do Word aberta entre lotes e recebe os documentos por uma fila.
+# Um lote que estoura o prazo tem o WINWORD.EXE encerrado e a thread substituída por outra, com fila nova.
+class ConversorWord(ConversorDocumentos):
+    nome = "word"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fila = queue.Queue()
+        self.reinicios = 0
+        self._iniciar_thread()
+
+    def _iniciar_thread(self):
+        self._thread = threading.Thread(target=self._executar, args=(self._fila,), name="conversor-word", daemon=True)
+        self._thread.pid_word = None
+        self._thread.start()
+
+    def _executar(self, fila):
+        import pythoncom
+        pythoncom.CoInitialize()
+        word = None
+        try:
+            while True:
+                tarefa = fila.get()
+                if tarefa is None:
+                    break
+                docx_paths, futuro, iniciado = tarefa
+                iniciado.set()
+                if not futuro.set_running_or_notify_cancel():
+                    continue
+                try:
+                    pdfs = []
+                    for docx_path in docx_paths:
+                        word, pdf_path = self._converter_documento(word, docx_path)
+                        pdfs.append(pdf_path)
+                    futuro.set_result(pdfs)
+                except Exception as e:
+                    futuro.set_exception(e)
+        finally:
+            self._sair(word)
+            pythoncom.CoUninitialize()
+
+    @staticmethod
+    def _abrir_word():
+        import win32com.client
+        word = win32com.client.DispatchEx("Word.Application")
+        word.Visible = False
+        word.DisplayAlerts = 0
+        threading.current_thread().pid_word = _pid_word(word)
+        return word
+
+    @staticmethod
+    def _sair(word):
+        if word is not None:
+            try:
+                word.Quit()
+            except Exception:
+                pass
+
+    def _converter_documento(self, word, docx_path):
+        pdf_path = _pdf_de(docx_path)
+        caminho = str(Path(docx_path).resolve())
+        try:
+            word = word or self._abrir_word()
+            doc = word.Documents.Open(caminho, ReadOnly=True)
+        except Exception:
+            # Word fechado pelo usuário ou travado: encerra a instância antiga, abre outra e tenta de novo
+            self._sair(word)
+            word = self._abrir_word()
+            doc = word.Documents.Open(caminho, ReadOnly=True)
+        try:
+            doc.SaveAs(str(pdf_path.resolve()), FileFormat=17)
+        finally:
+            doc.Close(False)
+        return word, _verificar_pdf(pdf_path)
+
+    def converter(self, docx_paths, timeout=TIMEOUT_CONVERSAO):
+        # Os documentos do lote são convertidos em sequência na thread do COM. O prazo (timeout por documento)
+        # só começa quando o lote sai da fila, para não contar a espera por outro lote
+        docx_paths = list(docx_paths)
+        futuro, iniciado = Future(), threading.Event()
+        with self._lock:
+            self._fila.put((docx_paths, futuro, iniciado))
+        while not iniciado.wait(1):
+            if not self._thread.is_alive():
+                raise ErroConversao("A thread de conversão do Word foi encerrada")
+        with self._lock:
+            thread = self._thread
+        try:
+            return futuro.result(timeout=timeout * max(1, len(docx_paths)))
+        except TimeoutError:
+            self._reiniciar(thread)
+            raise ErroConversao(f"O Word não concluiu a conversão em {timeout} s por documento; processo encerrado") from None
+
+    def _reiniciar(self, thread):
+        with self._lock:
+            if thread is not self._thread:
+                return
+            # Lotes que esperavam na fila antiga passam para a thread nova; a antiga sai quando a chamada
+            # COM travada retornar com erro, depois que o Word for encerrado
+            antiga, self._fila = self._fila, queue.Queue()
+            while True:
+                try:
+                    self._fila.put(antiga.get_nowait())
+                except queue.Empty:
+                    break
+            antiga.put(None)
+            self._iniciar_thread()
+            self.reinicios += 1
+        if thread.pid_word:
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(thread.pid_word)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            logging.warning("PID do Word desconhecido; a instância travada não pôde ser encerrada")
+
+    def fechar(self):
+        with self._lock:
+            thread = self._thread
+            self._fila.put(None)
+        if thread.is_alive():
+            thread.join()
+
+
+def localizar_soffice():
+    for caminho in CAMINHOS_SOFFICE:
+        encontrado = shutil.which(caminho) or (caminho if Path(caminho).is_file() else None)
+        if encontrado:
+            return encontrado
+    return None
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# Uma vaga de conversão LibreOffice com perfil de usuário próprio (instâncias com o mesmo perfil se bloqueiam).
+# O soffice fica residente de uma destas formas, na ordem:
+#   uno       - módulo uno neste Python: o processo é controlado direto por UNO;
+#   unoserver - servidor unoserver residente, documentos enviados pelo cliente unoconvert;
+#   unoconv   - listener do unoconv residente, documentos enviados por unoconv --port.
+# Sem nenhum deles (modo "avulso") não há processo aquecido: cada documento abre e fecha um
+# soffice --convert-to, e o único ganho de manter a vaga é o perfil já inicializado.
+class _ProcessoLibreOffice:
+    _avisado = False
+
+    def __init__(self, soffice, indice):
+        self.soffice = soffice
+        self.indice = indice
+        self.perfil = Path(tempfile.mkdtemp(prefix=f"lo_perfil_{indice}_"))
+        self.pipe = f"conversor_dispensa_{os.getpid()}_{indice}"
+        self.processo = None
+        self.desktop = None
+        self.modo = None
+        self.porta = None
+
+    def _argumentos_base(self):
+        return [
+            self.soffice, f"-env:UserInstallation={self.perfil.as_uri()}",
+            "--headless", "--invisible", "--nologo", "--norestore", "--nodefault", "--nolockcheck",
+        ]
+
+    def iniciar(self, timeout=30):
+        try:
+            import uno
+        except ImportError:
+            self._iniciar_sem_uno(timeout)
+            return
+        self.modo = "uno"
+        self.processo = subprocess.Popen(
+            self._argumentos_base() + [f"--accept=pipe,name={self.pipe};urp;StarOffice.ComponentContext"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext("com.sun.star.bridge.UnoUrlResolver", local)
+        limite = time.monotonic() + timeout
+        while True:
+            try:
+                contexto = resolver.resolve(f"uno:pipe,name={self.pipe};urp;StarOffice.ComponentContext")
+                break
+            except Exception:
+                if self.processo.poll() is not None or time.monotonic() > limite:
+                    self.encerrar()
+                    raise ErroConversao("Não foi possível iniciar o LibreOffice headless")
+                time.sleep(0.2)
+        self.desktop = contexto.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", contexto)
+
+    def _iniciar_sem_uno(self, timeout):
+        unoserver, unoconvert, unoconv = shutil.which("unoserver"), shutil.which("unoconvert"), shutil.which("unoconv")
+        self.porta = _porta_livre()
+        if unoserver and unoconvert:
+            self.modo = "unoserver"
+            comando = [
+                unoserver, "--interface", "127.0.0.1", "--port", str(self.porta), "--uno-port", str(_porta_livre()),
+                "--executable", self.soffice, "--user-installation", self.perfil.as_uri(),
+            ]
+        elif unoconv:
+            self.modo = "unoconv"
+            comando = [unoconv, "--listener", "--port", str(self.porta), f"--user-profile={self.perfil}"]
+        else:
+            self.modo = "avulso"
+            if not _ProcessoLibreOffice._avisado:
+                _ProcessoLibreOffice._avisado = True
+                logging.warning("Módulo uno, unoserver e unoconv indisponíveis: LibreOffice sem processo residente, "
+                                "cada documento abrirá um soffice próprio")
+            return
+        self.processo = subprocess.Popen(comando, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        limite = time.monotonic() + timeout
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", self.porta), timeout=1).close()
+                return
+            except OSError:
+                if self.processo.poll() is not None or time.monotonic() > limite:
+                    break
+                time.sleep(0.2)
+        logging.warning("Não foi possível iniciar o %s; convertendo sem processo residente", self.modo)
+        self.encerrar()
+        self.modo = "avulso"
+
+    def ativo(self):
+        if self.modo == "avulso":
+            return True
+        if self.modo == "uno" and self.desktop is None:
+            return False
+        return self.processo is not None and self.processo.poll() is None
+
+    def _comando_conversao(self, docx_path, pdf_path):
+        if self.modo == "unoserver":
+            return [shutil.which("unoconvert"), "--port", str(self.porta), str(docx_path), str(pdf_path)]
+        if self.modo == "unoconv":
+            return [shutil.which("unoconv"), "--port", str(self.porta), "-f", "pdf", "-o", str(pdf_path), str(docx_path)]
+        return self._argumentos_base() + ["--convert-to", "pdf", "--outdir", str(pdf_path.parent), str(docx_path)]
+
+    def converter(self, docx_path, timeout):
+        pdf_path = _pdf_de(docx_path)
+        if self.modo != "uno":
+            resultado = subprocess.run(
+                self._comando_conversao(docx_path, pdf_path),
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout,
+            )
+            if resultado.returncode != 0:
+                raise ErroConversao(resultado.stderr.decode(errors='replace').strip())
+            return _verificar_pdf(pdf_path)
+
+        import uno
+        from com.sun.star.beans import PropertyValue
+
+        def propriedade(nome, valor):
+            prop = PropertyValue()
+            prop.Name, prop.Value = nome, valor
+            return prop
+
+        # Chamadas UNO não têm timeout: se o documento travar o processo, ele é encerrado e reiniciado
+        vigia = threading.Timer(timeout, self.encerrar)
+        vigia.start()
+        try:
+            doc = self.desktop.loadComponentFromURL(
+                uno.systemPathToFileUrl(str(Path(docx_path).resolve())), "_blank", 0,
+                (propriedade("Hidden", True), propriedade("ReadOnly", True)),
+            )
+            try:
+                doc.storeToURL(uno.systemPathToFileUrl(str(pdf_path.resolve())), (propriedade("FilterName", "writer_pdf_Export"),))
+            finally:
+                doc.close(True)
+        except Exception as e:
+            raise ErroConversao(f"Falha ao converter {docx_path}: {e}") from e
+        finally:
+            vigia.cancel()
+        return _verificar_pdf(pdf_path)
+
+    def encerrar(self):
+        self.desktop = None
+        if self.processo is not None and self.processo.poll() is None:
+            # terminate antes de kill: unoserver e unoconv só fecham o soffice filho se saírem normalmente
+            self.processo.terminate()
+            try:
+                self.processo.wait(5)
+            except subprocess.TimeoutExpired:
+                self.processo.kill()
+                self.processo.wait()
+        self.processo = None
+
+    def remover_perfil(self):
+        shutil.rmtree(self.perfil, ignore_errors=True)
+
+
+# Até tamanho_pool vagas de conversão; os documentos de um lote são distribuídos entre elas em paralelo.
+# As vagas só mantêm o LibreOffice aquecido quando há uno, unoserver ou unoconv (ver _ProcessoLibreOffice)
+class ConversorLibreOffice(ConversorDocumentos):
+    nome = "libreoffice"
+
+    def __init__(self, soffice=None, tamanho_pool=TAMANHO_POOL_LIBREOFFICE):
+        self.soffice = soffice or localizar_soffice()
+        if self.soffice is None:
+            raise ErroConversao("LibreOffice (soffice) não encontrado")
+        self.tamanho_pool = tamanho_pool
+        self._livres = queue.Queue()
+        self._todos = []
+        self._criando = 0
+        self._proximo_indice = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=tamanho_pool, thread_name_prefix="conversor")
+        self.reinicios = 0
+
+    def _obter_processo(self):
+        # Processos são criados sob demanda até o tamanho do pool. A vaga é reservada sob o lock, mas o
+        # processo é iniciado fora dele e só entra no pool se a inicialização der certo
+        try:
+            return self._livres.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            criar = len(self._todos) + self._criando < self.tamanho_pool
+            if criar:
+                self._criando += 1
+                indice = self._proximo_indice
+                self._proximo_indice += 1
+        if not criar:
+            return self._livres.get()
+        processo = _ProcessoLibreOffice(self.soffice, indice)
+        try:
+            processo.iniciar()
+        except Exception:
+            processo.encerrar()
+            processo.remover_perfil()
+            with self._lock:
+                self._criando -= 1
+            raise
+        with self._lock:
+            self._criando -= 1
+            self._todos.append(processo)
+        return processo
+
+    def _converter_um(self, docx_path, timeout):
+        processo = self._obter_processo()
+        try:
+            for tentativa in range(2):
+                if not processo.ativo():
+                    processo.encerrar()
+                    processo.iniciar()
+                    self.reinicios += 1
+                try:
+                    return processo.converter(docx_path, timeout)
+                except (ErroConversao, subprocess.TimeoutExpired):
+                    # Processo travado ou finalizado durante a conversão: reinicia e tenta uma segunda vez
+                    processo.encerrar()
+                    if tentativa == 1:
+                        raise
+        finally:
+            self._livres.put(processo)
+
+    def converter(self, docx_paths, timeout=TIMEOUT_CONVERSAO):
+        futuros = [self._executor.submit(self._converter_um, Path(docx_path), timeout) for docx_path in docx_paths]
+        return [futuro.result() for futuro in futuros]
+
+    def fechar(self):
+        self._executor.shutdown(wait=True)
+        for processo in self._todos:
+            processo.encerrar()
+            processo.remover_perfil()
+        self._todos = []
+
+
+def criar_conversor(backend=None, tamanho_pool=TAMANHO_POOL_LIBREOFFICE):
+    # backend: "word", "libreoffice" ou None (Word no Windows quando disponível, senão LibreOffice)
+    backend = backend or os.environ.get("CONVERSOR_DOCUMENTOS")
+    if backend in (None, "word") and sys.platform == "win32":
+        try:
+            import win32com.client
+            return ConversorWord()
+        except ImportError:
+            if backend == "word":
+                raise
+    return ConversorLibreOffice(tamanho_pool=tamanho_pool)
+
+
+_conversor = None
+_conversor_lock = threading.Lock()
+
+
+# Conversor compartilhado pelo processo, fechado automaticamente na saída
+def get_conversor():
+    global _conversor
+    with _conversor_lock:
+        if _conversor is None:
+            _conversor = criar_conversor()
+            atexit.register(_conversor.fechar)
+        return _conversor
@@ -7,15 +7,31 @@ from PyQt6.QtGui import *
 from PyQt6.QtCore import *
 from diretorios import *
 import fitz
-from docxtpl import DocxTemplate
 import pandas as pd
-import win32com.client
+from modules.dispensa_eletronica.document_converter import get_conversor
+from modules.dispensa_eletronica.package_builder import ConstrutorPacote
+from modules.dispensa_eletronica.pdf_render import PageRenderService, TAMANHO_BLOCO, quantizar_escala
+from modules.dispensa_eletronica.thumbnails import ThumbnailService
+from modules.dispensa_eletronica.attachment_index import get_attachment_index
+from modules.dispensa_eletronica.connection_manager import get_connection_manager
+from modules.dispensa_eletronica.process_folders import reconciliar_pastas, registrar_pasta, resolver_pasta_processo
+from modules.dispensa_eletronica.render_cache import RenderCache, renderizar_com_cache, converter_com_cache
+from modules.dispensa_eletronica.document_context import (
+    DOCUMENTO_AUTORIZACAO, DOCUMENTO_AVISO, DOCUMENTOS_CP, alterar_posto, caminho_documento, criar_pastas_processo,
+    formatar_responsavel, preparar_contexto, valor_por_extenso
+)
 import os
+import math
 import stat
-from PyPDF2 import PdfMerger
 import re
-from num2words import num2words
-from datetime import datetime
+
+# Pixels de cena por ponto do PDF. O slider de zoom (50% a 200%) é aplicado sobre essa escala: em 50% a
+# página aparece com 2,5 pixels por ponto, como antes. A página inteira é renderizada só como prévia em
+# baixa resolução; o detalhe vem em blocos, apenas para a área visível e na resolução exibida
+ESCALA_CENA = 5
+
+# Espera após o último zoom/rolagem antes de pedir os blocos da área visível
+ATRASO_BLOCOS_MS = 150
 
 class PDFAddDialog(QDialog):
 
@@ -33,7 +49,22 @@ class PDFAddDialog(QDialog):
         self.numero = df_registro_selecionado['numero'].iloc[0]
         self.objeto = df_registro_selecionado['objeto'].iloc[0]  # Supondo que 'objeto' é uma coluna no DataFrame
         self.setWindowTitle('Adicionar PDF')
+        self.document_path = None
+        self.total_paginas = None
+        self.current_page = 0
+        # Renderização das páginas em segundo plano, com cache e prefetch das páginas vizinhas
+        self.render_service = PageRenderService(self)
+        self.render_service.paginaPronta.connect(self.on_pagina_pronta)
+        self.render_service.erro.connect(self.on_erro_render)
+        # Miniaturas da primeira página dos anexos, geradas em segundo plano e guardadas em cache no disco
+        self.itens_miniatura = {}
+        self.thumbnail_service = ThumbnailService(self)
+        self.thumbnail_service.miniaturaPronta.connect(self.on_miniatura_pronta)
+        # Último PDF de cada pasta de anexo, sem varrer as pastas a cada abertura
+        self.indice_anexos = get_indice_anexos()
+        self.indice_anexos.iniciar_reconstrucao(self.pasta_base)
         self.setup_ui()
+        self.adjust_zoom(self.zoom_slider.value())
 
     def setup_ui(self):
         self.setFixedSize(1520, 780)  # Tamanho ajustado para acomodar todos os componentes
@@ -47,7 +78,7 @@ class PDFAddDialog(QDialog):
         pdf_view_layout = QVBoxLayout()
 
         # DraggableGraphicsView para visualizar o PDF
-        self.pdf_view = DraggableGraphicsView()
+        self.pdf_view = DraggableGraphicsView(self.render_service)
         self.scene = QGraphicsScene()
         self.pdf_view.setScene(self.scene)
         self.pdf_view.setFixedSize(1000, 730)  # Tamanho da visualização do PDF
@@ -108,6 +139,7 @@ class PDFAddDialog(QDialog):
                 font-size: 14px;
             }
         """)
+        self.data_view.setIconSize(QSize(30, 40))
         self.data_view.itemClicked.connect(self.display_pdf)
         tree_layout.addWidget(self.data_view)
 
@@ -125,21 +157,17 @@ class PDFAddDialog(QDialog):
         # Reseta a transformação atual e aplica o novo zoom
         self.pdf_view.resetTransform()
         self.pdf_view.scale(scale_factor, scale_factor)
+        # Os blocos na resolução do novo zoom são pedidos quando o slider parar (a prévia fica na tela)
+        self.pdf_view.agendar_blocos()
 
     def verificar_arquivo_pdf(self, pasta):
-        arquivos_pdf = []
-        if not pasta.exists():
+        anexo = self.indice_anexos.obter(pasta)
+        if anexo is None:
             print(f"Pasta não encontrada: {pasta}")
             return None
-        for arquivo in pasta.iterdir():
-            if arquivo.suffix.lower() == ".pdf":
-                arquivos_pdf.append(arquivo)
-                print(f"Arquivo PDF encontrado: {arquivo.name}")
-        if arquivos_pdf:
-            pdf_mais_recente = max(arquivos_pdf, key=lambda p: p.stat().st_mtime)
-            print(f"PDF mais recente: {pdf_mais_recente}")
-            return pdf_mais_recente
-        return None
+        if anexo.arquivo:
+            print(f"PDF mais recente: {anexo.arquivo} ({anexo.paginas} páginas)")
+        return anexo.arquivo
    
     def display_pdf(self, item, column):
         file_path = item.data(0, Qt.ItemDataRole.UserRole)
@@ -148,38 +176,47 @@ class PDFAddDialog(QDialog):
             self.load_pdf(file_path)
 
     def load_pdf(self, file_path):
-        try:
-            self.document = fitz.open(file_path)  # Abre o documento e guarda em self.document
-            self.current_page = 0  # Define a primeira página como a atual
-            self.show_page(self.current_page)  # Mostra a primeira página
-        except Exception as e:
-            print(f"Erro ao abrir o arquivo PDF: {e}")
+        self.document_path = str(file_path)
+        self.total_paginas = None
+        self.current_page = 0  # Define a primeira página como a atual
+        self.show_page(self.current_page)  # Mostra a primeira página
 
     def show_page(self, page_number):
-        if self.document:
-            page = self.document.load_page(page_number)
-            mat = fitz.Matrix(5, 5)  # Ajuste para a escala desejada, mantém alta qualidade
-            pix = page.get_pixmap(matrix=mat)
-            img = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format.Format_RGB888)
-            pixmap = QPixmap.fromImage(img)
-            self.scene.clear()
-            self.scene.addPixmap(pixmap)
-            # Aplica o fator de escala inicial de 50%
-            self.pdf_view.resetTransform()
-            self.pdf_view.scale(0.5, 0.5)
-            # Atualiza o contador de páginas
-            self.page_label.setText(f"{page_number + 1} de {self.document.page_count}")
+        if not self.document_path:
+            return
+        # Prévia da página em cache (prefetch) ou None; nesse caso chega por paginaPronta
+        pagina = self.render_service.solicitar(self.document_path, page_number, self.total_paginas)
+        if pagina is not None:
+            self.exibir_pagina(pagina)
+
+    def on_pagina_pronta(self, pagina):
+        if pagina.caminho == self.document_path and pagina.pagina == self.current_page:
+            self.exibir_pagina(pagina)
+
+    def on_erro_render(self, caminho, page_number, mensagem):
+        print(f"Erro ao abrir o arquivo PDF: {mensagem}")
+
+    def exibir_pagina(self, pagina):
+        self.pdf_view.mostrar_pagina(pagina)
+        self.total_paginas = pagina.total_paginas
+        # Atualiza o contador de páginas
+        self.page_label.setText(f"{pagina.pagina + 1} de {pagina.total_paginas}")
 
     def next_page(self):
-        if self.document and self.current_page < self.document.page_count - 1:
+        if self.document_path and self.total_paginas and self.current_page < self.total_paginas - 1:
             self.current_page += 1
             self.show_page(self.current_page)
 
     def prev_page(self):
-        if self.document and self.current_page > 0:
+        if self.document_path and self.current_page > 0:
             self.current_page -= 1
             self.show_page(self.current_page)
 
+    def done(self, result):
+        self.render_service.parar()
+        self.thumbnail_service.parar()
+        super().done(result)
+
     def select_pdf_file(self):
         selected_item = self.data_view.currentItem()
         if selected_item:
@@ -188,6 +225,7 @@ class PDFAddDialog(QDialog):
                 selected_item.setText(0, selected_item.text(0))  # Atualiza o texto sem o caminho
                 selected_item.setIcon(0, self.icon_existe)
                 selected_item.setData(0, Qt.ItemDataRole.UserRole, file_path)  # Armazena o caminho do PDF
+                self.mostrar_miniatura(selected_item, file_path)
                 self.save_file_paths()
             else:
                 selected_item.setIcon(0, self.icon_nao_existe)
@@ -209,9 +247,7 @@ class PDFAddDialog(QDialog):
         return header_widget
 
     def add_initial_items(self):
-        id_processo_modificado = self.id_processo.replace("/", "-")
-        objeto_modificado = self.objeto.replace("/", "-")
-        base_path = self.pasta_base / f'{id_processo_modificado} - {objeto_modificado}'
+        base_path = pasta_do_processo(self.pasta_base, self.id_processo, self.objeto)
 
         initial_items = {
             "DFD": [
@@ -240,19 +276,118 @@ class PDFAddDialog(QDialog):
                     print(f"PDF encontrado: {pdf_file}")
                     child_item.setIcon(0, self.icon_existe)
                     child_item.setData(0, Qt.ItemDataRole.UserRole, str(pdf_file))  # Armazena o caminho do PDF
+                    self.mostrar_miniatura(child_item, pdf_file)
                 else:
                     print("Nenhum PDF encontrado")
                     child_item.setIcon(0, self.icon_nao_existe)
 
             parent_item.setExpanded(True)
 
+    def mostrar_miniatura(self, item, pdf_file):
+        # O ícone de "existe" fica até a miniatura ser gerada (só na primeira vez para cada versão do arquivo)
+        self.itens_miniatura[str(pdf_file)] = item
+        png = self.thumbnail_service.solicitar(pdf_file)
+        if png:
+            self.on_miniatura_pronta(str(pdf_file), png)
+
+    def on_miniatura_pronta(self, pdf_file, png):
+        item = self.itens_miniatura.get(pdf_file)
+        if item is not None and item.data(0, Qt.ItemDataRole.UserRole) == pdf_file:
+            item.setIcon(0, QIcon(png))
+            item.setToolTip(0, f'<img src="{Path(png).as_posix()}">')
+
+# Visualização da página: prévia da página inteira (baixa resolução) e, por cima, blocos de
+# TAMANHO_BLOCO pixels renderizados só para a área visível na resolução do zoom atual. Zoom e rolagem
+# reiniciam um timer; os blocos são pedidos quando o movimento para, e os fora da área visível saem da cena.
 class DraggableGraphicsView(QGraphicsView):
-    def __init__(self, parent=None):
+    def __init__(self, render_service=None, parent=None):
         super().__init__(parent)
         self.setDragMode(QGraphicsView.DragMode.NoDrag)
         self._panning = False
         self._last_mouse_position = QPoint()
         self.setTransformationAnchor(QGraphicsView.ViewportAnchor.AnchorUnderMouse)  # Zoom focalizado no cursor do mouse
+        self.render_service = render_service
+        self.pagina = None
+        self.escala_blocos = None
+        self.blocos = {}
+        self._pedidos = set()
+        self._timer_blocos = QTimer(self)
+        self._timer_blocos.setSingleShot(True)
+        self._timer_blocos.setInterval(ATRASO_BLOCOS_MS)
+        self._timer_blocos.timeout.connect(self.atualizar_blocos)
+        if render_service is not None:
+            render_service.blocoPronto.connect(self.on_bloco_pronto)
+
+    def mostrar_pagina(self, pagina):
+        # A página ocupa sempre o mesmo tamanho na cena (ESCALA_CENA pixels por ponto), qualquer que seja
+        # a resolução em que foi renderizada
+        self.scene().clear()
+        self.blocos = {}
+        self.escala_blocos = None
+        self.pagina = pagina
+        item = self.scene().addPixmap(QPixmap.fromImage(pagina.imagem))
+        item.setTransformationMode(Qt.TransformationMode.SmoothTransformation)
+        item.setScale(ESCALA_CENA / pagina.escala)
+        self.scene().setSceneRect(0, 0, pagina.largura * ESCALA_CENA, pagina.altura * ESCALA_CENA)
+        self.agendar_blocos()
+
+    def agendar_blocos(self):
+        if self.pagina is not None and self.render_service is not None:
+            self._timer_blocos.start()
+
+    def _remover_bloco(self, bloco):
+        self.scene().removeItem(self.blocos.pop(bloco))
+
+    def _adicionar_bloco(self, resultado):
+        item = self.scene().addPixmap(QPixmap.fromImage(resultado.imagem))
+        item.setScale(ESCALA_CENA / resultado.escala)
+        item.setPos(resultado.origem[0] * ESCALA_CENA, resultado.origem[1] * ESCALA_CENA)
+        item.setZValue(1)
+        self.blocos[resultado.bloco] = item
+
+    def atualizar_blocos(self):
+        pagina = self.pagina
+        if pagina is None:
+            return
+        # Pixels por ponto do PDF que a visão realmente exibe: zoom da cena x zoom da visão x densidade da tela
+        escala = quantizar_escala(ESCALA_CENA * self.transform().m11() * self.devicePixelRatioF())
+        if escala != self.escala_blocos:
+            for bloco in list(self.blocos):
+                self._remover_bloco(bloco)
+            self.escala_blocos = escala
+        if escala <= pagina.escala:
+            # A prévia já tem resolução suficiente para este zoom
+            self._pedidos = set()
+            return
+
+        # Blocos que cobrem a área visível, com uma volta de margem para a rolagem
+        visivel = self.mapToScene(self.viewport().rect()).boundingRect() & self.sceneRect()
+        lado = TAMANHO_BLOCO / escala * ESCALA_CENA
+        colunas = math.ceil(pagina.largura * escala / TAMANHO_BLOCO)
+        linhas = math.ceil(pagina.altura * escala / TAMANHO_BLOCO)
+        x0, x1 = max(int(visivel.left() // lado) - 1, 0), min(int(visivel.right() // lado) + 1, colunas - 1)
+        y0, y1 = max(int(visivel.top() // lado) - 1, 0), min(int(visivel.bottom() // lado) + 1, linhas - 1)
+        self._pedidos = {(i, j) for j in range(y0, y1 + 1) for i in range(x0, x1 + 1)}
+
+        for bloco in [bloco for bloco in self.blocos if bloco not in self._pedidos]:
+            self._remover_bloco(bloco)
+        # Os blocos do centro da tela são renderizados primeiro
+        centro = visivel.center()
+        faltando = sorted((bloco for bloco in self._pedidos if bloco not in self.blocos),
+                          key=lambda bloco: abs((bloco[0] + 0.5) * lado - centro.x()) + abs((bloco[1] + 0.5) * lado - centro.y()))
+        for resultado in self.render_service.solicitar_blocos(pagina.caminho, pagina.pagina, escala, faltando):
+            self._adicionar_bloco(resultado)
+
+    def on_bloco_pronto(self, resultado):
+        pagina = self.pagina
+        if (pagina is not None and resultado.caminho == pagina.caminho and resultado.pagina == pagina.pagina
+                and resultado.escala == self.escala_blocos and resultado.bloco in self._pedidos
+                and resultado.bloco not in self.blocos):
+            self._adicionar_bloco(resultado)
+
+    def scrollContentsBy(self, dx, dy):
+        super().scrollContentsBy(dx, dy)
+        self.agendar_blocos()
 
     def mousePressEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton:
@@ -281,11 +416,23 @@ class DraggableGraphicsView(QGraphicsView):
             scale = self.transform().m11() * factor
             if scale >= 0.1:  # Garante que o fator de escala não seja menor que 0.5
                 self.scale(factor, factor)
+                self.agendar_blocos()
         else:
             super().wheelEvent(event) 
 
 CONFIG_FILE = 'config.json'
 
+def get_connection_manager_controle():
+    return get_connection_manager(Path(load_config("CONTROLE_DADOS", str(CONTROLE_DADOS))))
+
+def get_indice_anexos():
+    return get_attachment_index(get_connection_manager_controle())
+
+def pasta_do_processo(pasta_base, id_processo, objeto, criar=False):
+    # Pasta registrada no manifesto pastas_processos (ou a encontrada pelo nome, ou a padrão)
+    with get_connection_manager_controle().connection() as conn:
+        return resolver_pasta_processo(conn, pasta_base, id_processo, objeto, criar)
+
 def load_config_path_id():
     if not Path(CONFIG_FILE).exists():
         return {}
@@ -296,6 +443,31 @@ def save_config(config):
     with open(CONFIG_FILE, 'w') as file:
         json.dump(config, file)
 
+# Montagens de pacote em andamento (thread -> ConsolidarDocumentos que a iniciou). O diálogo que criou o
+# ConsolidarDocumentos pode ser fechado antes do fim: a referência aqui mantém a thread e o dono vivos
+# até o QThread.finished, quando a entrada é removida
+_pacotes_em_andamento = {}
+
+
+# Monta o pacote fora da thread da interface; concluido recebe o resultado do ConstrutorPacote ou a exceção
+class PacoteThread(QThread):
+    concluido = pyqtSignal(object)
+
+    def __init__(self, partes, context, destino, cache=None, indice_anexos=None):
+        super().__init__()
+        self.partes = partes
+        self.context = context
+        self.destino = destino
+        self.cache = cache
+        self.indice_anexos = indice_anexos
+
+    def run(self):
+        try:
+            construtor = ConstrutorPacote(indice_anexos=self.indice_anexos)
+            self.concluido.emit(construtor.construir(self.partes, self.context, self.destino, self.cache))
+        except Exception as e:
+            self.concluido.emit(e)
+
 class ConsolidarDocumentos:
     def __init__(self, df_registro_selecionado):
         self.df_registro_selecionado = df_registro_selecionado
@@ -310,6 +482,13 @@ class ConsolidarDocumentos:
             self.pasta_base = Path(new_dir)
             self.config['pasta_base'] = str(self.pasta_base)
             save_config(self.config)
+            # Processos cujas pastas foram movidas para a nova base são religados no manifesto
+            try:
+                with get_connection_manager_controle().connection() as conn:
+                    resultado = reconciliar_pastas(conn, self.pasta_base)
+                print(f"Pastas de processos religadas: {resultado['religadas']}, novas: {resultado['novas']}")
+            except OSError as e:
+                print(f"Erro ao reconciliar pastas de processos: {e}")
             QMessageBox.information(None, "Diretório Base Alterado", f"O novo diretório base foi alterado para: {self.pasta_base}")
 
     def abrir_pasta_base(self):
@@ -339,191 +518,72 @@ class ConsolidarDocumentos:
             return None
 
     def convert_to_pdf(self, docx_path):
-        docx_path = Path(docx_path) if not isinstance(docx_path, Path) else docx_path
-        pdf_path = docx_path.with_suffix('.pdf')
-        word = win32com.client.Dispatch("Word.Application")
-        doc = None
-        try:
-            doc = word.Documents.Open(str(docx_path))
-            doc.SaveAs(str(pdf_path), FileFormat=17)
-        except Exception as e:
-            raise e
-        finally:
-            if doc is not None:
-                doc.Close()
-            word.Quit()
-        if not pdf_path.exists():
-            raise FileNotFoundError(f"O arquivo PDF não foi criado: {pdf_path}")
+        # Conversor compartilhado (Word via COM no Windows, pool de LibreOffice headless nos demais)
+        pdf_path, reaproveitado = converter_com_cache(get_conversor(), docx_path, self.render_cache())
         return pdf_path
 
     def valor_por_extenso(self, valor):
-        valor = valor.replace('R$', '').replace('.', '').replace(',', '.').strip()
-        valor_float = float(valor)
-        parte_inteira = int(valor_float)
-        parte_decimal = int(round((valor_float - parte_inteira) * 100))
-
-        if parte_decimal > 0:
-            valor_extenso = f"{num2words(parte_inteira, lang='pt_BR')} reais e {num2words(parte_decimal, lang='pt_BR')} centavos"
-        else:
-            valor_extenso = f"{num2words(parte_inteira, lang='pt_BR')} reais"
-
-        # Corrige "um reais" para "um real"
-        valor_extenso = valor_extenso.replace("um reais", "um real")
-
-        return valor_extenso
+        return valor_por_extenso(valor)
 
     def alterar_posto(self, posto):
-        # Define um dicionário de mapeamento de postos e suas respectivas abreviações
-        mapeamento_postos = {
-            r'Capitão[\s\-]de[\s\-]Corveta': 'CC',
-            r'Capitão[\s\-]de[\s\-]Fragata': 'CF',
-            r'Capitão[\s\-]de[\s\-]Mar[\s\-]e[\s\-]Guerra': 'CMG',
-            r'Capitão[\s\-]Tenente': 'CT',
-            r'Primeiro[\s\-]Tenente': '1ºTen',
-            r'Segundo[\s\-]Tenente': '2ºTen',
-            r'Primeiro[\s\-]Sargento': '1ºSG',
-            r'Segundo[\s\-]Sargento': '2ºSG',
-            r'Terceiro[\s\-]Sargento': '3ºSG',
-            r'Cabo': 'CB',
-            r'Sub[\s\-]oficial': 'SO',
-        }
-
-        # Itera sobre o dicionário de mapeamento e aplica a substituição
-        for padrao, substituicao in mapeamento_postos.items():
-            if re.search(padrao, posto, re.IGNORECASE):
-                return re.sub(padrao, substituicao, posto, flags=re.IGNORECASE)
-
-        # Retorna o posto original se nenhuma substituição for aplicada
-        return posto
+        return alterar_posto(posto)
 
     def formatar_responsavel(self, chave, data, context):
-        responsavel = data.get(chave)
-        if responsavel and isinstance(responsavel, str):
-            try:
-                nome, posto, funcao = responsavel.split('\n')
-                posto_alterado = self.alterar_posto(posto)
-                responsavel_dict = {
-                    'nome': nome,
-                    'posto': posto_alterado,
-                }
-                responsavel_extenso = f"{responsavel_dict.get('posto', '')} {responsavel_dict.get('nome', '')}"
-                context.update({f'{chave}_formatado': responsavel_extenso})
-            except ValueError:
-                context.update({f'{chave}_formatado': 'Não especificado\nNão especificado'})
-        else:
-            context.update({f'{chave}_formatado': 'Não especificado\nNão especificado'})
+        formatar_responsavel(chave, data, context)
 
     def prepare_context(self, data):
-        context = {key: (str(value) if value is not None else 'Não especificado') for key, value in data.items()}
-        descricao_servico = "aquisição de" if data['material_servico'] == "Material" else "contratação de empresa especializada em"
-        descricao_servico_primeira_letra_maiuscula = descricao_servico[0].upper() + descricao_servico[1:]
-        context.update({'descricao_servico': descricao_servico})
-        context.update({'descricao_servico_primeira_letra_maiuscula': descricao_servico_primeira_letra_maiuscula})
-
-        # Processar responsável pela demanda e operador
-        self.formatar_responsavel('responsavel_pela_demanda', data, context)
-        self.formatar_responsavel('operador', data, context)
-
-        valor_total = data.get('valor_total')
-        if valor_total and isinstance(valor_total, str):
-            valor_extenso = self.valor_por_extenso(valor_total)
-            valor_total_e_extenso = f"{valor_total} ({valor_extenso})"
-            context.update({'valor_total_e_extenso': valor_total_e_extenso})
-        else:
-            context.update({'valor_total_e_extenso': 'Não especificado'})
-
-        # Lógica para atividade_custeio
-        if data.get('atividade_custeio') == 'Sim':
-            texto_custeio = (
-                "A presente contratação por dispensa de licitação está enquadrada como atividade de custeio, "
-                "conforme mencionado no artigo 2º da Portaria ME nº 7.828, de 30 de agosto de 2022. "
-                "Conforme previsão do art. 3º do Decreto nº 10.193, de 27 de dezembro de 2019, e as normas "
-                "infralegais de delegação de competência no âmbito da Marinha, que estabelecem limites e instâncias "
-                "de governança, essa responsabilidade é delegada ao ordenador de despesas, respeitando os valores "
-                "estipulados no decreto."
-            )
-        else:
-            texto_custeio = (
-                "A presente contratação por dispensa de licitação não se enquadra nas hipóteses de atividades de "
-                "custeio previstas no Decreto nº 10.193, de 27 de dezembro de 2019, pois o objeto contratado não se "
-                "relaciona diretamente às atividades comuns de suporte administrativo mencionadas no artigo 2º da "
-                "Portaria ME nº 7.828, de 30 de agosto de 2022."
-            )
-        context.update({'texto_custeio': texto_custeio})
-
-        # Alterar formato de data_sessao
-        data_sessao = data.get('data_sessao')
-        if data_sessao:
-            try:
-                data_obj = datetime.strptime(data_sessao, '%Y-%m-%d')
-                dia_semana = data_obj.strftime('%A')
-                data_formatada = data_obj.strftime('%d/%m/%Y') + f" ({dia_semana})"
-                context.update({'data_sessao_formatada': data_formatada})
-            except ValueError as e:
-                context.update({'data_sessao_formatada': 'Data inválida'})
-                print("Erro ao processar data da sessão:", e)
-        else:
-            context.update({'data_sessao_formatada': 'Não especificado'})
-            print("Data da sessão não especificada")
-
-        return context
+        return preparar_contexto(data)
 
-    def gerarDocumento(self, template_type, subfolder_name, file_description):
+    def preparar_documento(self, template_type, subfolder_name, file_description):
+        # Valida o registro e o template e cria as pastas; retorna (template_path, save_path) ou None
         if self.df_registro_selecionado.empty:
             QMessageBox.warning(None, "Seleção Necessária", "Por favor, selecione um registro na tabela antes de gerar um documento.")
-            return
+            return None
 
         template_filename = f"template_{template_type}.docx"
         template_path, save_path = self.setup_document_paths(template_filename, subfolder_name, file_description)
 
-        self.verificar_e_criar_pastas(self.pasta_base / self.nome_pasta)
+        self.verificar_e_criar_pastas(self.pasta_processo)
 
         if not template_path.exists():
             QMessageBox.warning(None, "Erro de Template", f"O arquivo de template não foi encontrado: {template_path}")
-            return
+            return None
+        return template_path, save_path
 
-        with open(str(template_path), 'rb') as template_file:
-            doc = DocxTemplate(template_file)
-            context = self.df_registro_selecionado.to_dict('records')[0]
-            context = self.prepare_context(context)
-            doc.render(context)
-            doc.save(str(save_path))
+    def gerarDocumento(self, template_type, subfolder_name, file_description):
+        caminhos = self.preparar_documento(template_type, subfolder_name, file_description)
+        if caminhos is None:
+            return
+        template_path, save_path = caminhos
+
+        context = self.df_registro_selecionado.to_dict('records')[0]
+        context = self.prepare_context(context)
+        # Template e variáveis usadas iguais aos da última geração: o .docx existente é reaproveitado
+        save_path, reaproveitado = renderizar_com_cache(template_path, save_path, context, self.render_cache())
+        if reaproveitado:
+            print(f"Documento sem alterações, reaproveitado: {save_path}")
         return save_path
 
+    def render_cache(self):
+        # Manifesto na pasta do processo (a mesma usada por setup_document_paths)
+        return RenderCache(self.pasta_processo)
+
     def setup_document_paths(self, template_filename, subfolder_name, file_description):
         template_path = TEMPLATE_DISPENSA_DIR / template_filename
-        id_processo = self.df_registro_selecionado['id_processo'].iloc[0].replace('/', '-')
+        id_processo = self.df_registro_selecionado['id_processo'].iloc[0]
         objeto = self.df_registro_selecionado['objeto'].iloc[0]
-        self.nome_pasta = f"{id_processo} - {objeto}"
         if 'pasta_base' not in self.config:
             self.alterar_diretorio_base()
-        pasta_base = Path(self.config['pasta_base']) / self.nome_pasta / subfolder_name
-        pasta_base.mkdir(parents=True, exist_ok=True)
-        save_path = pasta_base / f"{id_processo} - {file_description}.docx"
+        self.pasta_processo = pasta_do_processo(self.config['pasta_base'], id_processo, objeto, criar=True)
+        save_path = caminho_documento(self.pasta_processo, id_processo, subfolder_name, file_description)
+        save_path.parent.mkdir(parents=True, exist_ok=True)
         return template_path, save_path
-    
-    def verificar_e_criar_pastas(self, pasta_base):
-        id_processo_modificado = self.id_processo.replace("/", "-")
-        objeto_modificado = self.objeto.replace("/", "-")
-        base_path = pasta_base / f'{id_processo_modificado} - {objeto_modificado}'
-
-        pastas_necessarias = [
-            pasta_base / '1. Autorizacao',
-            pasta_base / '2. CP e anexos',
-            pasta_base / '3. Aviso',
-            pasta_base / '2. CP e anexos' / 'DFD',
-            pasta_base / '2. CP e anexos' / 'DFD' / 'Anexo A - Relatorio Safin',
-            pasta_base / '2. CP e anexos' / 'DFD' / 'Anexo B - Especificações e Quantidade',
-            pasta_base / '2. CP e anexos' / 'TR',
-            pasta_base / '2. CP e anexos' / 'TR' / 'Pesquisa de Preços',
-            pasta_base / '2. CP e anexos' / 'Declaracao de Adequação Orçamentária',
-            pasta_base / '2. CP e anexos' / 'Declaracao de Adequação Orçamentária' / 'Relatório do PDM-Catser',
-            pasta_base / '2. CP e anexos' / 'Justificativas Relevantes',
-        ]
-        for pasta in pastas_necessarias:
-            if not pasta.exists():
-                pasta.mkdir(parents=True)
-        return pastas_necessarias
+
+    def verificar_e_criar_pastas(self, pasta_processo):
+        pastas = criar_pastas_processo(pasta_processo)
+        with get_connection_manager_controle().connection() as conn:
+            registrar_pasta(conn, self.id_processo, pasta_processo)
+        return pastas
 
     def gerar_e_abrir_documento(self, template_type, subfolder_name, file_description):
         docx_path = self.gerarDocumento(template_type, subfolder_name, file_description)
@@ -531,71 +591,61 @@ class ConsolidarDocumentos:
             self.abrirDocumento(docx_path)
 
     def gerar_autorizacao(self):
-        self.gerar_e_abrir_documento("autorizacao_dispensa", "1. Autorizacao", "Autorizacao para abertura de Processo Administrativo")
+        self.gerar_e_abrir_documento(*DOCUMENTO_AUTORIZACAO)
 
     def gerar_comunicacao_padronizada(self):
-        documentos = [
-            {"template": "cp", "subfolder": "2. CP e anexos", "desc": "Comunicacao Padronizada"},
-            {"template": "dfd", "subfolder": "2. CP e anexos/DFD", "desc": "Documento de Formalizacao de Demanda", "cover": "dfd.pdf"},
-            {"subfolder": "2. CP e anexos/DFD/Anexo A - Relatorio Safin", "cover": "anexo-a-dfd.pdf"},
-            {"subfolder": "2. CP e anexos/DFD/Anexo B - Especificações e Quantidade", "cover": "anexo-b-dfd.pdf"},
-            {"template": "tr", "subfolder": "2. CP e anexos/TR", "desc": "Termo de Referencia", "cover": "tr.pdf"},
-            {"subfolder": "2. CP e anexos/TR/Pesquisa de Preços", "cover": "anexo-tr.pdf"},
-            {"template": "dec_adeq", "subfolder": "2. CP e anexos/Declaracao de Adequação Orçamentária", "desc": "Declaracao de Adequação Orçamentária", "cover": "dec_adeq.pdf"},
-            {"subfolder": "2. CP e anexos/Declaracao de Adequação Orçamentária/Relatório do PDM-Catser", "cover": "anexo-dec-adeq.pdf"},
-            {"template": "justificativas", "subfolder": "2. CP e anexos/Justificativas Relevantes", "desc": "Justificativas Relevantes", "cover": "justificativas.pdf"},
-        ]
-
-        pdf_paths = []
+        documentos = DOCUMENTOS_CP
 
+        # Caminhos e pastas são preparados aqui (podem abrir diálogos); renderização, conversão, busca
+        # dos anexos e junção rodam em segundo plano no ConstrutorPacote
+        partes = []
         for doc in documentos:
             if "template" in doc:
-                docx_path = self.gerarDocumento(doc["template"], doc["subfolder"], doc["desc"])
-                if docx_path:
-                    pdf_path = self.salvarPDF(docx_path)
-                    if pdf_path:
-                        pdf_info = {"pdf_path": pdf_path}
-                        if "cover" in doc:
-                            pdf_info["cover_path"] = TEMPLATE_DISPENSA_DIR / doc["cover"]
-                        pdf_paths.append(pdf_info)
+                caminhos = self.preparar_documento(doc["template"], doc["subfolder"], doc["desc"])
+                if caminhos is None:
+                    continue
+                parte = {"template_path": caminhos[0], "save_path": caminhos[1]}
             else:
-                pdf_path = self.get_latest_pdf(self.pasta_base / self.nome_pasta / doc["subfolder"])
-                if pdf_path:
-                    pdf_paths.append({"pdf_path": pdf_path, "cover_path": TEMPLATE_DISPENSA_DIR / doc["cover"]})
-                else:
-                    QMessageBox.warning(None, "Erro", f"Arquivo PDF não encontrado: {doc['subfolder']}")
+                parte = {"pasta": self.pasta_processo / doc["subfolder"]}
+            if "cover" in doc:
+                parte["cover_path"] = TEMPLATE_DISPENSA_DIR / doc["cover"]
+            partes.append(parte)
+        if not partes:
+            return
 
-        self.concatenar_e_abrir_pdfs(pdf_paths)
-           
-    def concatenar_e_abrir_pdfs(self, pdf_paths):
-        if not pdf_paths:
+        context = self.prepare_context(self.df_registro_selecionado.to_dict('records')[0])
+        output_pdf_path = self.pasta_processo / "2. CP e anexos" / "CP_e_anexos.pdf"
+        thread = PacoteThread(partes, context, output_pdf_path, self.render_cache(), get_indice_anexos())
+        _pacotes_em_andamento[thread] = self
+        thread.concluido.connect(self.handle_pacote_finished)
+        thread.finished.connect(lambda: _pacotes_em_andamento.pop(thread, None))
+        thread.finished.connect(thread.deleteLater)
+        thread.start()
+
+    def handle_pacote_finished(self, resultado):
+        if isinstance(resultado, Exception):
+            print(f"Erro ao gerar a Comunicação Padronizada: {resultado}")
+            QMessageBox.warning(None, "Erro", f"Erro ao gerar a Comunicação Padronizada: {resultado}")
+            return
+        for pasta in resultado['faltando']:
+            QMessageBox.warning(None, "Erro", f"Arquivo PDF não encontrado: {pasta}")
+        if resultado['erros']:
+            QMessageBox.warning(None, "Erro", "Erro ao converter os documentos:\n" + "\n".join(resultado['erros']))
+            return
+        if resultado['destino'] is None:
             QMessageBox.warning(None, "Erro", "Nenhum PDF foi gerado para concatenar.")
             return
-
-        output_pdf_path = self.pasta_base / self.nome_pasta / "2. CP e anexos" / "CP_e_anexos.pdf"
-        merger = PdfMerger()
-
+        # Slot da interface: uma exceção aqui derrubaria o aplicativo
         try:
-            for pdf in pdf_paths:
-                if "cover_path" in pdf:
-                    merger.append(str(pdf["cover_path"]))
-                merger.append(str(pdf["pdf_path"]))
-
-            merger.write(str(output_pdf_path))
-            merger.close()
-
-            os.startfile(output_pdf_path)
-            print(f"PDF concatenado salvo e aberto: {output_pdf_path}")
+            if not QDesktopServices.openUrl(QUrl.fromLocalFile(str(resultado['destino']))):
+                raise OSError("nenhum aplicativo associado a arquivos PDF")
+            print(f"PDF concatenado salvo e aberto: {resultado['destino']}")
         except Exception as e:
-            print(f"Erro ao concatenar os PDFs: {e}")
-            QMessageBox.warning(None, "Erro", f"Erro ao concatenar os PDFs: {e}")
+            print(f"Erro ao abrir o PDF concatenado: {e}")
+            QMessageBox.warning(None, "Erro", f"O PDF foi salvo em {resultado['destino']}, mas não pôde ser aberto: {e}")
 
     def get_latest_pdf(self, directory):
-        pdf_files = list(directory.glob("*.pdf"))
-        if not pdf_files:
-            return None
-        latest_pdf = max(pdf_files, key=os.path.getmtime)
-        return latest_pdf
+        return get_indice_anexos().ultimo_pdf(directory)
 
 
     def gerar_documento_de_formalizacao_de_demanda(self):
@@ -608,4 +658,4 @@ class ConsolidarDocumentos:
         self.gerarDocumento("tr", "2. CP e anexos/TR", "Termo de Referencia")
 
     def gerar_aviso_dispensa(self):
-        self.gerar_e_abrir_documento("aviso_dispensa", "3. Aviso", "Aviso de Dispensa")
\ No newline at end of file
+        self.gerar_e_abrir_documento(*DOCUMENTO_AVISO)
\ No newline at end of file
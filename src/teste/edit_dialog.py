@@ -2,7 +2,12 @@ from PyQt6.QtWidgets import *
 from PyQt6.QtGui import *
 from PyQt6.QtCore import *
 from modules.planejamento.utilidades_planejamento import DatabaseManager, carregar_dados_pregao
-from modules.dispensa_eletronica.configuracao_dispensa_eletronica import ConfiguracoesDispensaDialog
+from modules.dispensa_eletronica.configuracao_dispensa_eletronica import ConfiguracoesDispensaDialog, AgentesListModel
+from modules.dispensa_eletronica.connection_manager import get_connection_manager
+from modules.dispensa_eletronica.attachment_index import get_attachment_index
+from modules.dispensa_eletronica.process_folders import resolver_pasta_processo
+from modules.dispensa_eletronica.document_context import criar_pastas_processo
+from modules.dispensa_eletronica.reference_data import OMRegistry, AgentesRegistry, PARTICAO_DEMAIS
 from modules.dispensa_eletronica.documentos_cp_dfd_tr import PDFAddDialog, ConsolidarDocumentos, load_config_path_id
 from diretorios import *
 import pandas as pd
@@ -11,7 +16,6 @@ from docxtpl import DocxTemplate
 import os
 import subprocess
 from pathlib import Path
-import win32com.client
 from openpyxl import Workbook, load_workbook
 from openpyxl.styles import Font, Border, Side, PatternFill, Alignment
 from openpyxl.utils import get_column_letter
@@ -58,8 +62,11 @@ class EditDataDialog(QDialog):
         self.ICONS_DIR = Path(icons_dir)
         self.database_path = Path(load_config("CONTROLE_DADOS", str(CONTROLE_DADOS)))
         self.database_manager = DatabaseManager(self.database_path)
+        self.connection_manager = get_connection_manager(self.database_path)
         self.config = load_config_path_id()
         self.pasta_base = Path(self.config.get('pasta_base', str(Path.home() / 'Desktop')))
+        self.indice_anexos = get_attachment_index(self.connection_manager)
+        self.indice_anexos.iniciar_reconstrucao(self.pasta_base)
 
         self.setWindowTitle("Editar Dados do Processo")
         self.setObjectName("EditarDadosDialog")
@@ -437,18 +444,17 @@ class EditDataDialog(QDialog):
 
         def atualizar_anexo(section_title, anexo, label):
             pasta_anexo = None
-            id_processo_modificado = self.id_processo.replace("/", "-")
-            objeto_modificado = self.objeto.replace("/", "-")
+            pasta_processo = self.pasta_processo()
 
             if section_title == "Documento de Formalização de Demanda (DFD)":
                 if "Anexo A" in anexo:
-                    pasta_anexo = self.pasta_base / f'{id_processo_modificado} - {objeto_modificado}' / '2. CP e anexos' / 'DFD' / 'Anexo A - Relatorio Safin'
+                    pasta_anexo = pasta_processo / '2. CP e anexos' / 'DFD' / 'Anexo A - Relatorio Safin'
                 elif "Anexo B" in anexo:
-                    pasta_anexo = self.pasta_base / f'{id_processo_modificado} - {objeto_modificado}' / '2. CP e anexos' / 'DFD' / 'Anexo B - Especificações e Quantidade'
+                    pasta_anexo = pasta_processo / '2. CP e anexos' / 'DFD' / 'Anexo B - Especificações e Quantidade'
             elif section_title == "Termo de Referência (TR)":
-                pasta_anexo = self.pasta_base / f'{id_processo_modificado} - {objeto_modificado}' / '2. CP e anexos' / 'TR' / 'Pesquisa de Preços'
+                pasta_anexo = pasta_processo / '2. CP e anexos' / 'TR' / 'Pesquisa de Preços'
             elif section_title == "Declaração de Adequação Orçamentária":
-                pasta_anexo = self.pasta_base / f'{id_processo_modificado} - {objeto_modificado}' / '2. CP e anexos' / 'Declaracao de Adequação Orçamentária' / 'Relatório do PDM-Catser'
+                pasta_anexo = pasta_processo / '2. CP e anexos' / 'Declaracao de Adequação Orçamentária' / 'Relatório do PDM-Catser'
 
             if pasta_anexo:
                 print(f"Verificando pasta: {pasta_anexo}")
@@ -560,21 +566,20 @@ class EditDataDialog(QDialog):
                 # Definindo a pasta correta com base no anexo
                 pasta_anexo = None
                 tooltip_text = "Abrir pasta"
-                id_processo_modificado = self.id_processo.replace("/", "-")
-                objeto_modificado = self.objeto.replace("/", "-")
+                pasta_processo = self.pasta_processo()
 
                 if section_title == "Documento de Formalização de Demanda (DFD)":
                     if "Anexo A" in anexo:
-                        pasta_anexo = self.pasta_base / f'{id_processo_modificado} - {objeto_modificado}' / '2. CP e anexos' / 'DFD' / 'Anexo A - Relatorio Safin'
+                        pasta_anexo = pasta_processo / '2. CP e anexos' / 'DFD' / 'Anexo A - Relatorio Safin'
                         tooltip_text = "Abrir pasta Anexo A - Relatório do Safin"
                     elif "Anexo B" in anexo:
-                        pasta_anexo = self.pasta_base / f'{id_processo_modificado} - {objeto_modificado}' / '2. CP e anexos' / 'DFD' / 'Anexo B - Especificações e Quantidade'
+                        pasta_anexo = pasta_processo / '2. CP e anexos' / 'DFD' / 'Anexo B - Especificações e Quantidade'
                         tooltip_text = "Abrir pasta Anexo B - Especificações e Quantidade"
                 elif section_title == "Termo de Referência (TR)":
-                    pasta_anexo = self.pasta_base / f'{id_processo_modificado} - {objeto_modificado}' / '2. CP e anexos' / 'TR' / 'Pesquisa de Preços'
+                    pasta_anexo = pasta_processo / '2. CP e anexos' / 'TR' / 'Pesquisa de Preços'
                     tooltip_text = "Abrir pasta Pesquisa de Preços"
                 elif section_title == "Declaração de Adequação Orçamentária":
-                    pasta_anexo = self.pasta_base / f'{id_processo_modificado} - {objeto_modificado}' / '2. CP e anexos' / 'Declaracao de Adequação Orçamentária' / 'Relatório do PDM-Catser'
+                    pasta_anexo = pasta_processo / '2. CP e anexos' / 'Declaracao de Adequação Orçamentária' / 'Relatório do PDM-Catser'
                     tooltip_text = "Abrir pasta Relatório do PDM-Catser"
 
                 btnabrirpasta = self.create_button(
@@ -671,51 +676,25 @@ class EditDataDialog(QDialog):
     def abrir_pasta(self, pasta):
         QDesktopServices.openUrl(QUrl.fromLocalFile(str(pasta)))
 
+    def pasta_processo(self, pasta_base=None, criar=False):
+        # Pasta do processo pelo manifesto pastas_processos: continua a mesma se o objeto for editado
+        with self.connection_manager.connection() as conn:
+            return resolver_pasta_processo(conn, pasta_base or self.pasta_base, self.id_processo, self.objeto, criar)
+
     def verificar_subpasta(self):
-        id_processo_modificado = self.id_processo.replace("/", "-")
-        objeto_modificado = self.objeto.replace("/", "-")
-        pastas_encontradas = []
-        for subpasta in self.pasta_base.iterdir():
-            if subpasta.is_dir() and id_processo_modificado in subpasta.name and objeto_modificado in subpasta.name:
-                pastas_encontradas.append(subpasta.name)
-                print(f"Pasta encontrada: {subpasta.name}")
-        return pastas_encontradas
+        pasta = self.pasta_processo()
+        if pasta.is_dir():
+            print(f"Pasta encontrada: {pasta.name}")
+            return [pasta.name]
+        return []
 
     def verificar_arquivo_pdf(self, pasta):
-        arquivos_pdf = []
-        if not pasta.exists():
-            print(f"Pasta não encontrada: {pasta}")
-            return None
-        for arquivo in pasta.iterdir():
-            if arquivo.suffix.lower() == ".pdf":
-                arquivos_pdf.append(arquivo)
-                # print(f"Arquivo PDF encontrado: {arquivo.name}")
-        if arquivos_pdf:
-            return max(arquivos_pdf, key=lambda p: p.stat().st_mtime)  # Retorna o PDF mais recente
-        return None
+        # Retorna o PDF mais recente da pasta (índice de anexos, atualizado pelo watcher)
+        return self.indice_anexos.ultimo_pdf(pasta)
     
     def verificar_e_criar_pastas(self, pasta_base):
-        id_processo_modificado = self.id_processo.replace("/", "-")
-        objeto_modificado = self.objeto.replace("/", "-")
-        base_path = pasta_base / f'{id_processo_modificado} - {objeto_modificado}'
-
-        pastas_necessarias = [
-            pasta_base / '1. Autorizacao',
-            pasta_base / '2. CP e anexos',
-            pasta_base / '3. Aviso',
-            pasta_base / '2. CP e anexos' / 'DFD',
-            pasta_base / '2. CP e anexos' / 'DFD' / 'Anexo A - Relatorio Safin',
-            pasta_base / '2. CP e anexos' / 'DFD' / 'Anexo B - Especificações e Quantidade',
-            pasta_base / '2. CP e anexos' / 'TR',
-            pasta_base / '2. CP e anexos' / 'TR' / 'Pesquisa de Preços',
-            pasta_base / '2. CP e anexos' / 'Declaracao de Adequação Orçamentária',
-            pasta_base / '2. CP e anexos' / 'Declaracao de Adequação Orçamentária' / 'Relatório do PDM-Catser',
-            pasta_base / '2. CP e anexos' / 'Justificativas Relevantes',
-        ]
-        for pasta in pastas_necessarias:
-            if not pasta.exists():
-                pasta.mkdir(parents=True)
-        return pastas_necessarias
+        pasta_processo = self.pasta_processo(pasta_base, criar=True)
+        return criar_pastas_processo(pasta_processo)
 
     def abrirPasta(self):
         print("Abrir pasta")
@@ -1255,15 +1234,14 @@ class EditDataDialog(QDialog):
 
 
     def update_database(self, data):
-        with self.database_manager as connection:
+        with self.connection_manager.connection() as connection:
             cursor = connection.cursor()
             set_part = ', '.join([f"{key} = ?" for key in data.keys()])
             valores = list(data.values())
             valores.append(self.df_registro_selecionado['id_processo'].iloc[0])
             query = f"UPDATE controle_dispensas SET {set_part} WHERE id_processo = ?"
             cursor.execute(query, valores)
-            connection.commit()
-            QMessageBox.information(self, "Atualização", "As alterações foram salvas com sucesso.")
+        QMessageBox.information(self, "Atualização", "As alterações foram salvas com sucesso.")
 
     def update_title_label(self):
         data = self.extract_registro_data()
@@ -1369,28 +1347,23 @@ class EditDataDialog(QDialog):
 
     def carregarAgentesResponsaveis(self):
         try:
-            print("Tentando conectar ao banco de dados...")
-            with sqlite3.connect(self.database_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='controle_agentes_responsaveis'")
-                if cursor.fetchone() is None:
-                    raise Exception("A tabela 'controle_agentes_responsaveis' não existe no banco de dados. Configure os Ordenadores de Despesa no Módulo 'Configurações'.")
-
-                print("Tabela 'controle_agentes_responsaveis' encontrada. Carregando dados...")
-                self.carregarDadosCombo(conn, cursor, "Ordenador de Despesa%", self.ordenador_combo)
-                self.carregarDadosCombo(conn, cursor, "Agente Fiscal%", self.agente_fiscal_combo)
-                self.carregarDadosCombo(conn, cursor, "Gerente de Crédito%", self.gerente_credito_combo)
-                self.carregarDadosCombo(conn, cursor, "Operador%", self.operador_dispensa_combo)
-                self.carregarDadosCombo(conn, cursor, "NOT LIKE", self.responsavel_demanda_combo)
-
-                print("Valores carregados no ComboBox:", self.ordenador_combo.count(), "itens")
-                print("Valores carregados no ComboBox:", self.agente_fiscal_combo.count(), "itens")
-                print("Valores carregados no ComboBox:", self.gerente_credito_combo.count(), "itens")
-                print("Valores carregados no ComboBox:", self.operador_dispensa_combo.count(), "itens")
-                print("Valores carregados no ComboBox:", self.responsavel_demanda_combo.count(), "itens")
-
-                # Preencher comboboxes com os valores de df_registro_selecionado se disponíveis
-                self.preencher_campos()
+            # Uma única leitura da controle_agentes_responsaveis, compartilhada e separada por função
+            registry = AgentesRegistry.instance(self.connection_manager)
+            combos = {
+                'ordenador_despesas': self.ordenador_combo,
+                'agente_fiscal': self.agente_fiscal_combo,
+                'gerente_de_credito': self.gerente_credito_combo,
+                'operador': self.operador_dispensa_combo,
+                PARTICAO_DEMAIS: self.responsavel_demanda_combo,
+            }
+            for particao, combo in combos.items():
+                if not isinstance(combo.model(), AgentesListModel):
+                    combo.setModel(AgentesListModel(parent=combo))
+                combo.model().set_agentes(registry.particao(particao))
+            print("Agentes carregados:", {particao: combo.count() for particao, combo in combos.items()})
+
+            # Preencher comboboxes com os valores de df_registro_selecionado se disponíveis
+            self.preencher_campos()
 
         except Exception as e:
             print(f"Erro ao carregar Ordenadores de Despesas: {e}")
@@ -1402,35 +1375,13 @@ class EditDataDialog(QDialog):
             if index != -1:
                 combo_widget.setCurrentIndex(index)
                 
-    def carregarDadosCombo(self, conn, cursor, funcao_like, combo_widget):
-        if "NOT LIKE" in funcao_like:
-            sql_query = """
-                SELECT nome, posto, funcao FROM controle_agentes_responsaveis
-                WHERE funcao NOT LIKE 'Ordenador de Despesa%' AND
-                    funcao NOT LIKE 'Agente Fiscal%' AND
-                    funcao NOT LIKE 'Gerente de Crédito%' AND
-                    funcao NOT LIKE 'Operador%'
-            """
-        else:
-            sql_query = f"SELECT nome, posto, funcao FROM controle_agentes_responsaveis WHERE funcao LIKE '{funcao_like}'"
-        
-        agentes_df = pd.read_sql_query(sql_query, conn)
-        combo_widget.clear()
-        for index, row in agentes_df.iterrows():
-            texto_display = f"{row['nome']}\n{row['posto']}\n{row['funcao']}"
-            combo_widget.addItem(texto_display, userData=row.to_dict())
-            print(f"Valores carregados no ComboBox: {combo_widget.count()} itens")
-
     def load_sigla_om(self, sigla_om):
         try:
-            with sqlite3.connect(self.database_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT DISTINCT sigla_om FROM controle_om ORDER BY sigla_om")
-                items = [row[0] for row in cursor.fetchall()]
-                self.om_combo.addItems(items)
-                self.om_combo.setCurrentText(sigla_om)  # Define o texto atual do combobox
-                self.om_combo.currentTextChanged.connect(self.on_om_changed)
-                print(f"Loaded sigla_om items: {items}")
+            items = OMRegistry.instance(self.connection_manager).siglas()
+            self.om_combo.addItems(items)
+            self.om_combo.setCurrentText(sigla_om)  # Define o texto atual do combobox
+            self.om_combo.currentTextChanged.connect(self.on_om_changed)
+            print(f"Loaded sigla_om items: {items}")
         except Exception as e:
             QMessageBox.warning(self, "Erro", f"Erro ao carregar OM: {e}")
             print(f"Error loading sigla_om: {e}")
@@ -1438,17 +1389,15 @@ class EditDataDialog(QDialog):
     def on_om_changed(self):
         selected_om = self.om_combo.currentText()
         print(f"OM changed to: {selected_om}")
-        with sqlite3.connect(self.database_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT uasg, orgao_responsavel FROM controle_om WHERE sigla_om = ?", (selected_om,))
-            result = cursor.fetchone()
-            if result:
-                uasg, orgao_responsavel = result
-                index = self.df_registro_selecionado.index[0]
-                self.df_registro_selecionado.loc[index, 'uasg'] = uasg
-                self.df_registro_selecionado.loc[index, 'orgao_responsavel'] = orgao_responsavel
-                print(f"Updated DataFrame: uasg={uasg}, orgao_responsavel={orgao_responsavel}")
-                self.title_updated.emit(f"{orgao_responsavel} (UASG: {uasg})")
+        # Consulta ao cache em memória, sem acesso ao banco a cada troca no combobox
+        result = OMRegistry.instance(self.connection_manager).por_sigla(selected_om)
+        if result:
+            uasg, orgao_responsavel = result['uasg'], result['orgao_responsavel']
+            index = self.df_registro_selecionado.index[0]
+            self.df_registro_selecionado.loc[index, 'uasg'] = uasg
+            self.df_registro_selecionado.loc[index, 'orgao_responsavel'] = orgao_responsavel
+            print(f"Updated DataFrame: uasg={uasg}, orgao_responsavel={orgao_responsavel}")
+            self.title_updated.emit(f"{orgao_responsavel} (UASG: {uasg})")
 
     def apply_dark_red_style(self, button):
         button.setStyleSheet("""
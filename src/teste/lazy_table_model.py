@@ -0,0 +1,340 @@
+from PyQt6.QtCore import *
+from collections import OrderedDict
+from bisect import bisect_left
+
+# Tipos de alteração transportados pelo sinal dataUpdated ({id_processo: tipo})
+ALTERACAO_INSERCAO = 'insert'
+ALTERACAO_ATUALIZACAO = 'update'
+ALTERACAO_EXCLUSAO = 'delete'
+
+# Acima deste número de inserções/exclusões é mais barato recarregar a janela inteira
+LIMITE_ALTERACOES_ESTRUTURAIS = 200
+
+
+class LazySqlTableModel(QAbstractTableModel):
+    # Modelo paginado por keyset: só as páginas visíveis ficam em memória.
+    # As linhas seguem o rowid (a mesma ordem do QSqlTableModel sem ordenação usado antes) e cada
+    # página é lida com "WHERE rowid >= <primeiro rowid da página> ORDER BY rowid LIMIT n".
+    # Um QSortFilterProxyModel sobre este modelo só enxergaria as linhas já carregadas: a visão não
+    # habilita ordenação por coluna e o proxy fica na ordem da origem (rowid, ou o ranking da busca).
+    def __init__(self, connection_manager, table_name, key_column='id_processo', page_size=256, max_cached_pages=32, non_editable_columns=None, parent=None):
+        super().__init__(parent)
+        self.connection_manager = connection_manager
+        self.table_name = table_name
+        self.key_column = key_column
+        self.page_size = page_size
+        self.max_cached_pages = max_cached_pages
+        self.non_editable_columns = non_editable_columns if non_editable_columns is not None else []
+        self._columns = self._load_columns()
+        self._key_index = self._columns.index(key_column)
+        # Cada linha em memória guarda o rowid depois das colunas da tabela
+        self._rowid_index = len(self._columns)
+        self._select = f"SELECT {', '.join(self._columns)}, rowid FROM {self.table_name}"
+        self._headers = {}
+        self._total = 0
+        self._loaded = 0
+        self._boundaries = []  # primeiro rowid de cada página já percorrida
+        self._pages = OrderedDict()  # cache LRU: número da página -> linhas
+        self._key_filter = None  # lista ordenada de chaves (resultado de busca) ou None para a tabela toda
+        self._pending_changes = {}
+        self._flush_scheduled = False
+
+    def _load_columns(self):
+        rows = self.connection_manager.execute(f"PRAGMA table_info({self.table_name})")
+        return [row[1] for row in rows]
+
+    def select(self):
+        self.beginResetModel()
+        if self._key_filter is not None:
+            self._total = len(self._key_filter)
+        else:
+            self._total = self.connection_manager.execute(f"SELECT COUNT(*) FROM {self.table_name}")[0][0]
+        self._loaded = 0
+        self._boundaries = []
+        self._pages.clear()
+        self.endResetModel()
+        # Carrega a primeira janela para a visão não abrir vazia
+        if self.canFetchMore(QModelIndex()):
+            self.fetchMore(QModelIndex())
+        return True
+
+    def set_key_filter(self, keys):
+        # Restringe o modelo às chaves informadas, na ordem recebida (ex.: ranking da busca)
+        self._key_filter = list(keys) if keys is not None else None
+        self.select()
+
+    def key_filter(self):
+        return list(self._key_filter) if self._key_filter is not None else None
+
+    def fieldIndex(self, field_name):
+        return self._columns.index(field_name) if field_name in self._columns else -1
+
+    def columnName(self, column):
+        return self._columns[column]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._loaded
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._columns)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._loaded < self._total
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        restante = min(self.page_size, self._total - self._loaded)
+        if restante <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + restante - 1)
+        self._loaded += restante
+        self.endInsertRows()
+
+    def _boundary(self, page_number):
+        # Páginas lidas em sequência já deixam a fronteira seguinte registrada (_keyset_page). Num salto,
+        # os rowids entre a última fronteira conhecida e a página pedida são lidos em uma única consulta,
+        # só o rowid, e guardados um a cada page_size; nada é percorrido de novo nos saltos seguintes
+        if not self._boundaries:
+            first = self.connection_manager.execute(f"SELECT MIN(rowid) FROM {self.table_name}")[0][0]
+            if first is None:
+                return None
+            self._boundaries.append(first)
+        faltantes = page_number + 1 - len(self._boundaries)
+        if faltantes > 0:
+            rows = self.connection_manager.execute(
+                f"SELECT rowid FROM {self.table_name} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (self._boundaries[-1], faltantes * self.page_size)
+            )
+            self._boundaries.extend(row[0] for row in rows[self.page_size - 1::self.page_size])
+            if len(self._boundaries) <= page_number:
+                return None
+        return self._boundaries[page_number]
+
+    def _page(self, page_number):
+        if page_number in self._pages:
+            self._pages.move_to_end(page_number)
+            return self._pages[page_number]
+
+        if self._key_filter is not None:
+            page = self._filtered_page(page_number)
+        else:
+            page = self._keyset_page(page_number)
+
+        self._pages[page_number] = page
+        while len(self._pages) > self.max_cached_pages:
+            self._pages.popitem(last=False)
+        return page
+
+    def _filtered_page(self, page_number):
+        keys = self._key_filter[page_number * self.page_size:(page_number + 1) * self.page_size]
+        if not keys:
+            return []
+        rows = self.connection_manager.execute(
+            f"{self._select} WHERE {self.key_column} IN ({', '.join('?' for _ in keys)})",
+            keys
+        )
+        by_key = {row[self._key_index]: list(row) for row in rows}
+        # Chaves removidas desde a busca aparecem vazias em vez de deslocar as demais linhas
+        return [by_key.get(key, [None] * (len(self._columns) + 1)) for key in keys]
+
+    def _keyset_page(self, page_number):
+        inicio = self._boundary(page_number)
+        if inicio is None:
+            return []
+        rows = self.connection_manager.execute(
+            f"{self._select} WHERE rowid >= ? ORDER BY rowid LIMIT ?",
+            (inicio, self.page_size + 1)
+        )
+        if len(rows) > self.page_size and len(self._boundaries) == page_number + 1:
+            self._boundaries.append(rows[self.page_size][self._rowid_index])
+        return [list(row) for row in rows[:self.page_size]]
+
+    def _row(self, row):
+        page = self._page(row // self.page_size)
+        offset = row % self.page_size
+        return page[offset] if offset < len(page) else None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= self._loaded:
+            return None
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole, Qt.ItemDataRole.UserRole):
+            row = self._row(index.row())
+            return row[index.column()] if row is not None else None
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self._headers.get(section, self._columns[section])
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Vertical:
+            return section + 1
+        return None
+
+    def setHeaderData(self, section, orientation, value, role=Qt.ItemDataRole.EditRole):
+        if orientation != Qt.Orientation.Horizontal or not 0 <= section < len(self._columns):
+            return False
+        self._headers[section] = value
+        self.headerDataChanged.emit(orientation, section, section)
+        return True
+
+    def flags(self, index):
+        flags = Qt.ItemFlag.ItemIsSelectable | Qt.ItemFlag.ItemIsEnabled
+        if index.column() not in self.non_editable_columns:
+            flags |= Qt.ItemFlag.ItemIsEditable
+        return flags
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        if role != Qt.ItemDataRole.EditRole or not index.isValid():
+            return False
+        row = self._row(index.row())
+        if row is None:
+            return False
+        column = self._columns[index.column()]
+        with self.connection_manager.connection() as conn:
+            conn.execute(f"UPDATE {self.table_name} SET {column} = ? WHERE {self.key_column} = ?", (value, row[self._key_index]))
+        # A ordem é a do rowid: alterar a chave não move a linha
+        if index.column() == self._key_index and self._key_filter is not None:
+            self._key_filter[index.row()] = value
+        row[index.column()] = value
+        self.dataChanged.emit(index, index, [Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole])
+        return True
+
+    def apply_changes(self, changes):
+        # Acumula as alterações e aplica todas de uma vez na próxima volta do laço de eventos
+        for key, tipo in changes.items():
+            anterior = self._pending_changes.get(key)
+            if anterior == ALTERACAO_INSERCAO and tipo == ALTERACAO_EXCLUSAO:
+                del self._pending_changes[key]
+            elif anterior == ALTERACAO_INSERCAO:
+                continue
+            elif anterior == ALTERACAO_EXCLUSAO and tipo == ALTERACAO_INSERCAO:
+                self._pending_changes[key] = ALTERACAO_ATUALIZACAO
+            else:
+                self._pending_changes[key] = tipo
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            QTimer.singleShot(0, self._flush_changes)
+
+    def _flush_changes(self):
+        self._flush_scheduled = False
+        changes, self._pending_changes = self._pending_changes, {}
+        if not changes:
+            return
+        inserts = [k for k, t in changes.items() if t == ALTERACAO_INSERCAO]
+        deletes = [k for k, t in changes.items() if t == ALTERACAO_EXCLUSAO]
+        updates = [k for k, t in changes.items() if t == ALTERACAO_ATUALIZACAO]
+
+        if len(inserts) + len(deletes) > LIMITE_ALTERACOES_ESTRUTURAIS:
+            self.select()
+            return
+
+        if self._key_filter is not None:
+            self._apply_filtered_changes(deletes)
+        else:
+            # As posições são calculadas pelo rowid. O de uma linha excluída só é conhecido se ela está em
+            # uma página no cache (o caso comum: excluída a partir da tela); senão a janela é recarregada
+            cached_rowids = self._cached_rowids()
+            if any(key not in cached_rowids for key in deletes):
+                self.select()
+                return
+            self._apply_keyset_changes(self._rowids(inserts), sorted(cached_rowids[key] for key in deletes))
+        self._apply_updates(updates)
+
+    def _cached_rowids(self):
+        return {row[self._key_index]: row[self._rowid_index] for page in self._pages.values() for row in page}
+
+    def _rowids(self, keys):
+        if not keys:
+            return []
+        rows = self.connection_manager.execute(
+            f"SELECT rowid FROM {self.table_name} WHERE {self.key_column} IN ({', '.join('?' for _ in keys)})",
+            keys
+        )
+        return sorted(row[0] for row in rows)
+
+    def _position(self, rowid, slack=0):
+        # Posição do rowid na tabela, contando no máximo até pouco além das linhas carregadas
+        limit = self._loaded + slack + 1
+        count = self.connection_manager.execute(
+            f"SELECT COUNT(*) FROM (SELECT 1 FROM {self.table_name} WHERE rowid < ? LIMIT ?)",
+            (rowid, limit)
+        )[0][0]
+        return count if count < limit else None
+
+    def _invalidate_from(self, row):
+        # Linhas deslocadas: descarta as páginas a partir da alteração e as fronteiras que deixaram de valer
+        page_number = min(row, self._loaded) // self.page_size
+        del self._boundaries[page_number:]
+        for cached in [p for p in self._pages if p >= page_number]:
+            del self._pages[cached]
+
+    def _apply_keyset_changes(self, inserts, deletes):
+        # inserts e deletes são rowids em ordem crescente. A tabela já está no estado final; exclusões (em
+        # ordem decrescente) são posicionadas compensando as exclusões e inserções ainda não aplicadas
+        for key in reversed(deletes):
+            position = self._position(key, slack=len(inserts))
+            self._total -= 1
+            if position is None:
+                self._invalidate_from(self._loaded)
+                continue
+            row = position + bisect_left(deletes, key) - bisect_left(inserts, key)
+            self._invalidate_from(row)
+            if row >= self._loaded:
+                continue
+            self.beginRemoveRows(QModelIndex(), row, row)
+            self._loaded -= 1
+            self.endRemoveRows()
+
+        # Inserções em ordem crescente: a contagem na tabela final já é a posição correta
+        for key in inserts:
+            row = self._position(key)
+            self._total += 1
+            if row is None:
+                self._invalidate_from(self._loaded)
+                continue
+            self._invalidate_from(row)
+            if row >= self._loaded:
+                continue
+            self.beginInsertRows(QModelIndex(), row, row)
+            self._loaded += 1
+            self.endInsertRows()
+
+    def _apply_filtered_changes(self, deletes):
+        # Durante uma busca, novas linhas não entram no resultado; exclusões saem dele
+        for key in deletes:
+            if key not in self._key_filter:
+                continue
+            row = self._key_filter.index(key)
+            self._key_filter.pop(row)
+            self._total -= 1
+            self._invalidate_from(row)
+            if row >= self._loaded:
+                continue
+            self.beginRemoveRows(QModelIndex(), row, row)
+            self._loaded -= 1
+            self.endRemoveRows()
+
+    def _apply_updates(self, updates):
+        if not updates:
+            return
+        # Só linhas em páginas no cache podem estar na tela; as demais serão lidas atualizadas depois
+        cached_rows = {}
+        for page_number, page in self._pages.items():
+            for offset, row in enumerate(page):
+                cached_rows[row[self._key_index]] = (page_number * self.page_size + offset, row)
+        keys = [key for key in updates if key in cached_rows]
+        if not keys:
+            return
+        rows = self.connection_manager.execute(
+            f"{self._select} WHERE {self.key_column} IN ({', '.join('?' for _ in keys)})",
+            keys
+        )
+        changed = []
+        for new_row in rows:
+            position, row = cached_rows[new_row[self._key_index]]
+            row[:] = list(new_row)
+            changed.append(position)
+        if not changed:
+            return
+        last_column = len(self._columns) - 1
+        self.dataChanged.emit(self.index(min(changed), 0), self.index(max(changed), last_column))
@@ -0,0 +1,148 @@
+import atexit
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from modules.dispensa_eletronica.pdf_merge import concatenar_pdfs
+
+# Processos que renderizam os .docx; cada um mantém o próprio cache de templates entre os pacotes
+TAMANHO_POOL_RENDERIZACAO = min(4, os.cpu_count() or 1)
+
+
+def _ms(inicio, fim=None):
+    return round(((fim or time.perf_counter()) - inicio) * 1000, 1)
+
+
+# Executado nos processos do pool: precisa ser uma função de módulo e receber só dados serializáveis
+def renderizar_documento(template_path, save_path, context):
+    from modules.dispensa_eletronica.template_cache import obter_template
+    inicio = time.perf_counter()
+    doc = obter_template(template_path)
+    doc.render(context)
+    doc.save(str(save_path))
+    return str(save_path), _ms(inicio)
+
+
+_pool_renderizacao = None
+_pool_lock = threading.Lock()
+
+
+def get_pool_renderizacao():
+    global _pool_renderizacao
+    with _pool_lock:
+        if _pool_renderizacao is None:
+            _pool_renderizacao = ProcessPoolExecutor(max_workers=TAMANHO_POOL_RENDERIZACAO)
+            atexit.register(_pool_renderizacao.shutdown, wait=False, cancel_futures=True)
+        return _pool_renderizacao
+
+
+# Monta um pacote de documentos (ex.: CP e anexos). Cada parte é um dict com:
+#   template_path + save_path: documento gerado do template (renderizado e convertido para PDF)
+#   pasta: anexo já existente (último PDF da pasta, consultado no índice de anexos)
+#   cover_path (opcional): capa inserida antes da parte
+# As renderizações rodam em paralelo no pool de processos e cada .docx pronto segue direto para o
+# conversor; as buscas de anexos rodam em threads ao mesmo tempo. A junção só começa com tudo pronto.
+# Com um RenderCache, partes cujo template e variáveis não mudaram reaproveitam o .docx/PDF já gerado,
+# e o PDF final só é remontado se alguma das entradas mudou.
+# indice_anexos: AttachmentIndex do aplicativo ou, fora dele, um IndiceAnexosSomenteLeitura
+class ConstrutorPacote:
+    def __init__(self, conversor=None, pool=None, indice_anexos=None):
+        from modules.dispensa_eletronica.attachment_index import IndiceAnexosSomenteLeitura
+        self.conversor = conversor
+        self.pool = pool
+        self.indice_anexos = indice_anexos or IndiceAnexosSomenteLeitura()
+
+    def construir(self, partes, context, destino, cache=None):
+        from modules.dispensa_eletronica.document_converter import get_conversor
+        from modules.dispensa_eletronica.render_cache import chave_render, chave_arquivos
+        conversor = self.conversor or get_conversor()
+        inicio = time.perf_counter()
+        tempos = {'partes': {}}
+        fim = {}
+        lock = threading.Lock()
+
+        def marcar(etapa):
+            with lock:
+                fim[etapa] = time.perf_counter()
+
+        def converter(indice, parte, chave, futuro_render):
+            tempos_parte = tempos['partes'][indice]
+            if futuro_render is not None:
+                docx_path, tempos_parte['renderizacao_ms'] = futuro_render.result()
+                marcar('renderizacao')
+                if cache is not None:
+                    cache.registrar(docx_path, chave)
+            else:
+                docx_path = parte["save_path"]
+                pdf_path = cache.pdf_valido(docx_path)
+                if pdf_path is not None:
+                    tempos_parte['reutilizado'] = 'pdf'
+                    return pdf_path
+            conversao = time.perf_counter()
+            pdf_path = conversor.converter_um(Path(docx_path))
+            marcar('conversao')
+            tempos_parte['conversao_ms'] = _ms(conversao)
+            if cache is not None:
+                cache.registrar_pdf(docx_path, pdf_path)
+            return pdf_path
+
+        def procurar(pasta):
+            pdf_path = self.indice_anexos.ultimo_pdf(pasta)
+            marcar('anexos')
+            return pdf_path
+
+        with ThreadPoolExecutor(max_workers=max(len(partes), 1), thread_name_prefix="pacote") as threads:
+            # Anexos primeiro: as buscas não esperam o cálculo das chaves de render
+            futuros = {
+                indice: threads.submit(procurar, parte["pasta"])
+                for indice, parte in enumerate(partes) if "template_path" not in parte
+            }
+            for indice, parte in enumerate(partes):
+                if "template_path" not in parte:
+                    continue
+                tempos['partes'][indice] = {'reutilizado': None}
+                chave = chave_render(parte["template_path"], context) if cache is not None else None
+                futuro_render = None
+                if cache is None or not cache.valido(parte["save_path"], chave):
+                    pool = self.pool or get_pool_renderizacao()
+                    futuro_render = pool.submit(renderizar_documento, str(parte["template_path"]), str(parte["save_path"]), context)
+                else:
+                    tempos['partes'][indice]['reutilizado'] = 'docx'
+                futuros[indice] = threads.submit(converter, indice, parte, chave, futuro_render)
+            wait(list(futuros.values()))
+
+        pdfs, faltando, erros = [], [], []
+        for indice, parte in enumerate(partes):
+            try:
+                pdf_path = futuros[indice].result()
+            except Exception as e:
+                erros.append(f"{parte.get('save_path') or parte.get('pasta')}: {e}")
+                continue
+            if pdf_path is None:
+                faltando.append(parte["pasta"])
+                continue
+            pdfs.append({"pdf_path": pdf_path, "cover_path": parte.get("cover_path")})
+
+        for etapa in ('renderizacao', 'conversao', 'anexos'):
+            if etapa in fim:
+                tempos[f'{etapa}_ms'] = _ms(inicio, fim[etapa])
+        resultado = {'pdfs': pdfs, 'faltando': faltando, 'erros': erros, 'destino': None, 'tempos': tempos}
+        if pdfs and not erros:
+            juncao = time.perf_counter()
+            entradas = [caminho for pdf in pdfs for caminho in (pdf["cover_path"], pdf["pdf_path"]) if caminho]
+            chave_pacote = chave_arquivos(entradas) if cache is not None else None
+            if cache is not None and cache.valido(destino, chave_pacote):
+                tempos['juncao_reutilizada'] = True
+                resultado['destino'] = Path(destino)
+            else:
+                resultado['destino'] = concatenar_pdfs(pdfs, destino)
+                if cache is not None:
+                    cache.registrar(destino, chave_pacote)
+            tempos['juncao_ms'] = _ms(juncao)
+        if cache is not None:
+            cache.salvar()
+        tempos['total_ms'] = _ms(inicio)
+        print(f"Pacote '{destino}': {tempos}")
+        return resultado
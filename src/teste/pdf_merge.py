@@ -0,0 +1,64 @@
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import fitz
+
+# Capas (PDFs estáticos de TEMPLATE_DISPENSA_DIR) mantidas abertas entre as junções
+TAMANHO_CACHE_CAPAS = 32
+
+
+# Documentos PyMuPDF já interpretados, revalidados por mtime/tamanho a cada uso
+class CacheCapas:
+    def __init__(self, tamanho=TAMANHO_CACHE_CAPAS):
+        self.tamanho = tamanho
+        self._documentos = OrderedDict()
+
+    def obter(self, caminho):
+        chave = str(Path(caminho).resolve())
+        info = os.stat(chave)
+        assinatura = (info.st_mtime_ns, info.st_size)
+        entrada = self._documentos.get(chave)
+        if entrada is not None and entrada[0] == assinatura:
+            self._documentos.move_to_end(chave)
+            return entrada[1]
+        if entrada is not None:
+            entrada[1].close()
+        documento = fitz.open(chave)
+        self._documentos[chave] = (assinatura, documento)
+        self._documentos.move_to_end(chave)
+        while len(self._documentos) > self.tamanho:
+            self._documentos.popitem(last=False)[1][1].close()
+        return documento
+
+    def limpar(self):
+        for assinatura, documento in self._documentos.values():
+            documento.close()
+        self._documentos.clear()
+
+
+_capas = CacheCapas()
+# Um documento PyMuPDF não pode ser usado por duas threads ao mesmo tempo: as junções são serializadas
+_merge_lock = threading.Lock()
+
+
+# Junta as partes em um único PDF. partes: dicts com pdf_path e, opcionalmente, cover_path (capa
+# inserida antes do documento). As páginas são copiadas com insert_pdf; na gravação, garbage=4 remove
+# objetos sem uso e unifica os repetidos (fontes e imagens das capas) e deflate comprime os streams.
+def concatenar_pdfs(partes, destino):
+    destino = Path(destino)
+    temporario = destino.with_name(destino.name + ".tmp")
+    with _merge_lock:
+        saida = fitz.open()
+        try:
+            for parte in partes:
+                if parte.get("cover_path"):
+                    saida.insert_pdf(_capas.obter(parte["cover_path"]))
+                with fitz.open(str(parte["pdf_path"])) as documento:
+                    saida.insert_pdf(documento)
+            saida.save(str(temporario), garbage=4, deflate=True)
+        finally:
+            saida.close()
+    os.replace(temporario, destino)
+    return destino
@@ -0,0 +1,286 @@
+import itertools
+import math
+import mmap
+import os
+import queue
+import threading
+from collections import OrderedDict
+
+import fitz
+from PyQt6.QtCore import *
+from PyQt6.QtGui import *
+
+# Memória máxima ocupada pelas páginas renderizadas mantidas em cache
+ORCAMENTO_CACHE_PAGINAS = 256 * 1024 * 1024
+
+# Páginas vizinhas renderizadas antecipadamente (antes e depois da página exibida)
+PAGINAS_PREFETCH = 2
+
+# Documentos mantidos abertos pela thread de renderização
+DOCUMENTOS_ABERTOS = 4
+
+# PDFs a partir deste tamanho são abertos por mmap: o PyMuPDF lê direto do mapeamento (memoryview, sem
+# cópia) e as páginas do arquivo ficam no cache do sistema, que pode descartá-las sob pressão de memória
+LIMITE_MMAP = 16 * 1024 * 1024
+
+# Escalas são arredondadas para cima em passos de 1/PASSOS_ESCALA, para reaproveitar o cache entre zooms próximos
+PASSOS_ESCALA = 4
+
+# Prévia da página inteira (escala None): lado maior com LADO_PREVIA pixels, no máximo ESCALA_MAXIMA_PREVIA
+LADO_PREVIA = 1200
+ESCALA_MAXIMA_PREVIA = 2.0
+
+# Lado, em pixels, dos blocos renderizados sobre a prévia quando o zoom pede mais resolução
+TAMANHO_BLOCO = 512
+
+PRIORIDADE_ATUAL = 0
+PRIORIDADE_BLOCO = 1
+PRIORIDADE_PREFETCH = 2
+
+
+def quantizar_escala(escala):
+    return max(math.ceil(escala * PASSOS_ESCALA) / PASSOS_ESCALA, 1 / PASSOS_ESCALA)
+
+
+def escala_previa(largura, altura):
+    return min(LADO_PREVIA / max(largura, altura, 1), ESCALA_MAXIMA_PREVIA)
+
+
+# Página inteira ou um bloco dela. largura/altura: tamanho da página em pontos; origem: canto do bloco
+# em pontos, relativo à página. A imagem usa o buffer do pixmap sem copiar: o pixmap é guardado junto e
+# só é liberado quando a PaginaRenderizada sai do cache e da tela (use a imagem só enquanto a tiver)
+class PaginaRenderizada:
+    def __init__(self, caminho, pagina, total_paginas, escala, pixmap, largura, altura, bloco=None, origem=(0, 0)):
+        self.caminho = caminho
+        self.pagina = pagina
+        self.total_paginas = total_paginas
+        self.escala = escala
+        self._pixmap = pixmap
+        self.imagem = QImage(pixmap.samples_mv, pixmap.width, pixmap.height, pixmap.stride, QImage.Format.Format_RGB888)
+        self.largura = largura
+        self.altura = altura
+        self.bloco = bloco
+        self.origem = origem
+
+
+# Páginas renderizadas (QImage) por (caminho, página, escala), com descarte LRU pelo total de bytes
+class CachePaginas:
+    def __init__(self, orcamento=ORCAMENTO_CACHE_PAGINAS):
+        self.orcamento = orcamento
+        self.ocupado = 0
+        self._paginas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            pagina = self._paginas.get(chave)
+            if pagina is not None:
+                self._paginas.move_to_end(chave)
+            return pagina
+
+    def guardar(self, chave, pagina):
+        tamanho = pagina.imagem.sizeInBytes()
+        with self._lock:
+            anterior = self._paginas.pop(chave, None)
+            if anterior is not None:
+                self.ocupado -= anterior.imagem.sizeInBytes()
+            self._paginas[chave] = pagina
+            self.ocupado += tamanho
+            while self.ocupado > self.orcamento and len(self._paginas) > 1:
+                chave_antiga, antiga = self._paginas.popitem(last=False)
+                self.ocupado -= antiga.imagem.sizeInBytes()
+
+    def remover_documento(self, caminho):
+        with self._lock:
+            for chave in [chave for chave in self._paginas if chave[0] == caminho]:
+                self.ocupado -= self._paginas.pop(chave).imagem.sizeInBytes()
+
+
+class _DocumentoAberto:
+    def __init__(self, documento, assinatura, visao=None, mapa=None):
+        self.documento = documento
+        self.assinatura = assinatura
+        self.visao = visao
+        self.mapa = mapa
+
+    def fechar(self):
+        self.documento.close()
+        if self.visao is not None:
+            self.visao.release()
+            self.mapa.close()
+        # O store do MuPDF (imagens e fontes decodificadas, até 256 MB) não é esvaziado ao fechar o
+        # documento; sem isso a memória de anexos já fechados continuaria ocupada
+        fitz.TOOLS.store_shrink(100)
+
+
+# Documentos fitz abertos, no máximo `tamanho`, fechando o menos usado. Cada obter() confere tamanho e
+# mtime do arquivo e reabre se ele mudou. Não é thread-safe: pertence à thread de renderização.
+class PoolDocumentos:
+    def __init__(self, tamanho=DOCUMENTOS_ABERTOS, limite_mmap=LIMITE_MMAP):
+        self.tamanho = tamanho
+        self.limite_mmap = limite_mmap
+        self._abertos = OrderedDict()
+
+    def _abrir(self, caminho, tamanho_arquivo):
+        if tamanho_arquivo < self.limite_mmap:
+            return fitz.open(caminho), None, None
+        with open(caminho, 'rb') as arquivo:
+            mapa = mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+        visao = memoryview(mapa)
+        try:
+            return fitz.open(stream=visao, filetype="pdf"), visao, mapa
+        except Exception:
+            visao.release()
+            mapa.close()
+            raise
+
+    def obter(self, caminho):
+        info = os.stat(caminho)
+        assinatura = (info.st_size, info.st_mtime_ns)
+        aberto = self._abertos.get(caminho)
+        if aberto is not None and aberto.assinatura != assinatura:
+            self.fechar(caminho)
+            aberto = None
+        if aberto is None:
+            documento, visao, mapa = self._abrir(caminho, info.st_size)
+            aberto = _DocumentoAberto(documento, assinatura, visao, mapa)
+            self._abertos[caminho] = aberto
+            while len(self._abertos) > self.tamanho:
+                self._abertos.popitem(last=False)[1].fechar()
+        self._abertos.move_to_end(caminho)
+        return aberto.documento
+
+    def fechar(self, caminho):
+        aberto = self._abertos.pop(caminho, None)
+        if aberto is not None:
+            aberto.fechar()
+
+    def fechar_todos(self):
+        while self._abertos:
+            self._abertos.popitem(last=False)[1].fechar()
+
+
+# Thread única dona dos documentos fitz: abre, renderiza e converte em QImage fora da thread da interface.
+# Pedidos de prefetch de gerações antigas (o usuário já mudou de página ou de documento) são descartados.
+class _RenderWorker(QThread):
+    renderizada = pyqtSignal(object)
+    falhou = pyqtSignal(str, int, str)
+
+    def __init__(self, cache, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.fila = queue.PriorityQueue()
+        self.geracao = 0
+        self.geracao_blocos = 0
+        self._sequencia = itertools.count()
+        self.documentos = PoolDocumentos()
+
+    def enfileirar(self, prioridade, caminho, pagina, escala, geracao, bloco=None):
+        self.fila.put((prioridade, next(self._sequencia), (caminho, pagina, escala, bloco, geracao)))
+
+    def parar(self):
+        self.requestInterruption()
+        self.fila.put((-1, next(self._sequencia), None))
+        self.wait()
+
+    def _renderizar(self, caminho, pagina, escala, bloco):
+        documento = self.documentos.obter(caminho)
+        page = documento.load_page(pagina)
+        area = page.rect
+        if escala is None:
+            escala = escala_previa(area.width, area.height)
+        origem, recorte = (0, 0), None
+        if bloco is not None:
+            # Só o retângulo do bloco é rasterizado: o custo não depende do tamanho da folha (ex.: A0)
+            lado = TAMANHO_BLOCO / escala
+            origem = (bloco[0] * lado, bloco[1] * lado)
+            recorte = fitz.Rect(area.x0 + origem[0], area.y0 + origem[1],
+                                area.x0 + origem[0] + lado, area.y0 + origem[1] + lado) & area
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(escala, escala), clip=recorte, alpha=False)
+        return PaginaRenderizada(caminho, pagina, documento.page_count, escala, pixmap,
+                                 area.width, area.height, bloco, origem)
+
+    def run(self):
+        try:
+            while not self.isInterruptionRequested():
+                prioridade, sequencia, pedido = self.fila.get()
+                if pedido is None:
+                    break
+                caminho, pagina, escala, bloco, geracao = pedido
+                if prioridade == PRIORIDADE_PREFETCH and geracao != self.geracao:
+                    continue
+                if prioridade == PRIORIDADE_BLOCO and geracao != self.geracao_blocos:
+                    continue
+                chave = (caminho, pagina, escala, bloco)
+                resultado = self.cache.obter(chave)
+                if resultado is None:
+                    try:
+                        resultado = self._renderizar(caminho, pagina, escala, bloco)
+                    except Exception as e:
+                        if prioridade == PRIORIDADE_ATUAL:
+                            self.falhou.emit(caminho, pagina, str(e))
+                        continue
+                    self.cache.guardar(chave, resultado)
+                if prioridade != PRIORIDADE_PREFETCH:
+                    self.renderizada.emit(resultado)
+        finally:
+            self.documentos.fechar_todos()
+
+
+# Serviço usado pelo PDFAddDialog. solicitar() devolve a prévia da página (inteira, em baixa resolução)
+# do cache na hora ou a renderiza em segundo plano (paginaPronta), e já prepara as prévias das páginas
+# vizinhas. solicitar_blocos() faz o mesmo para os blocos visíveis em alta resolução (blocoPronto).
+class PageRenderService(QObject):
+    paginaPronta = pyqtSignal(object)
+    blocoPronto = pyqtSignal(object)
+    erro = pyqtSignal(str, int, str)
+
+    def __init__(self, parent=None, orcamento=ORCAMENTO_CACHE_PAGINAS):
+        super().__init__(parent)
+        self.cache = CachePaginas(orcamento)
+        self._worker = _RenderWorker(self.cache)
+        self._worker.renderizada.connect(self._distribuir)
+        self._worker.falhou.connect(self.erro)
+        self._worker.start()
+
+    def _distribuir(self, resultado):
+        if resultado.bloco is None:
+            self.paginaPronta.emit(resultado)
+        else:
+            self.blocoPronto.emit(resultado)
+
+    def solicitar(self, caminho, pagina, total_paginas=None):
+        # Retorna a prévia se já estiver em cache; senão agenda e retorna None
+        caminho = str(caminho)
+        self._worker.geracao += 1
+        geracao = self._worker.geracao
+        resultado = self.cache.obter((caminho, pagina, None, None))
+        if resultado is None:
+            self._worker.enfileirar(PRIORIDADE_ATUAL, caminho, pagina, None, geracao)
+        total_paginas = resultado.total_paginas if resultado is not None else total_paginas
+        for distancia in range(1, PAGINAS_PREFETCH + 1):
+            for vizinha in (pagina + distancia, pagina - distancia):
+                if vizinha >= 0 and (total_paginas is None or vizinha < total_paginas):
+                    self._worker.enfileirar(PRIORIDADE_PREFETCH, caminho, vizinha, None, geracao)
+        return resultado
+
+    def solicitar_blocos(self, caminho, pagina, escala, blocos):
+        # Retorna os blocos já em cache; os demais chegam por blocoPronto. Um novo pedido cancela os
+        # blocos ainda não renderizados do pedido anterior (zoom ou rolagem mudaram)
+        caminho = str(caminho)
+        self._worker.geracao_blocos += 1
+        geracao = self._worker.geracao_blocos
+        prontos = []
+        for bloco in blocos:
+            resultado = self.cache.obter((caminho, pagina, escala, bloco))
+            if resultado is None:
+                self._worker.enfileirar(PRIORIDADE_BLOCO, caminho, pagina, escala, geracao, bloco)
+            else:
+                prontos.append(resultado)
+        return prontos
+
+    def descartar(self, caminho):
+        self.cache.remover_documento(str(caminho))
+
+    def parar(self):
+        self._worker.parar()
@@ -0,0 +1,115 @@
+import os
+import sys
+from pathlib import Path
+
+from modules.dispensa_eletronica.document_context import id_da_pasta_processo, nome_pasta_processo
+
+# Manifesto id_processo -> pasta do processo. O nome da pasta inclui o objeto; com o manifesto, editar o
+# objeto (ou renomear a pasta) não separa o processo da pasta já criada
+TABELA_PASTAS = "pastas_processos"
+
+
+def garantir_tabela_pastas(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABELA_PASTAS} (
+            id_processo TEXT PRIMARY KEY,
+            pasta TEXT NOT NULL
+        )
+    """)
+
+
+def registrar_pasta(conn, id_processo, pasta):
+    garantir_tabela_pastas(conn)
+    conn.execute(f"INSERT OR REPLACE INTO {TABELA_PASTAS} (id_processo, pasta) VALUES (?, ?)", (id_processo, str(pasta)))
+
+
+def pasta_registrada(conn, id_processo):
+    garantir_tabela_pastas(conn)
+    linha = conn.execute(f"SELECT pasta FROM {TABELA_PASTAS} WHERE id_processo = ?", (id_processo,)).fetchone()
+    return Path(linha[0]) if linha else None
+
+
+def localizar_pasta_por_nome(pasta_base, id_processo):
+    # Pasta em pasta_base cujo nome começa pelo id_processo ("DE 15-2024 - ..."), qualquer que seja o objeto;
+    # com mais de uma, fica a modificada por último
+    try:
+        with os.scandir(pasta_base) as entradas:
+            candidatas = [
+                entrada for entrada in entradas
+                if entrada.is_dir() and ' - ' in entrada.name and id_da_pasta_processo(entrada.name) == id_processo
+            ]
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if not candidatas:
+        return None
+    return Path(max(candidatas, key=lambda entrada: entrada.stat().st_mtime).path)
+
+
+def resolver_pasta_processo(conn, pasta_base, id_processo, objeto, criar=False):
+    # Pasta registrada, se ainda existir; senão a pasta do processo encontrada pelo nome em pasta_base, que
+    # passa a ser a registrada. Sem nenhuma pasta existente, o manifesto só é alterado por quem vai criar a
+    # pasta (criar=True): uma consulta não troca a entrada registrada (ex.: compartilhamento de rede fora do
+    # ar) pela pasta padrão
+    registrada = pasta_registrada(conn, id_processo)
+    if registrada is not None and registrada.is_dir():
+        return registrada
+    encontrada = localizar_pasta_por_nome(pasta_base, id_processo)
+    if encontrada is not None:
+        registrar_pasta(conn, id_processo, encontrada)
+        return encontrada
+    if registrada is not None and not criar:
+        return registrada
+    pasta = Path(pasta_base) / nome_pasta_processo(id_processo, objeto)
+    if criar:
+        registrar_pasta(conn, id_processo, pasta)
+    return pasta
+
+
+# Religa em lote as entradas do manifesto cuja pasta não existe mais (movida, renomeada, pasta_base
+# trocada) e registra as pastas de processos ainda sem entrada. Uma passada de os.scandir por pasta_base;
+# a pasta é reconhecida pelo id_processo no início do nome ("DE 15-2024 - ...").
+def reconciliar_pastas(conn, pasta_base):
+    encontradas = {}
+    with os.scandir(pasta_base) as entradas:
+        for entrada in entradas:
+            if entrada.is_dir() and ' - ' in entrada.name:
+                id_processo = id_da_pasta_processo(entrada.name)
+                # Mais de uma pasta para o mesmo processo: fica a modificada por último
+                mtime = entrada.stat().st_mtime
+                if id_processo not in encontradas or mtime > encontradas[id_processo][1]:
+                    encontradas[id_processo] = (entrada.path, mtime)
+
+    garantir_tabela_pastas(conn)
+    registradas = dict(conn.execute(f"SELECT id_processo, pasta FROM {TABELA_PASTAS}").fetchall())
+    alteracoes = []
+    sem_pasta = []
+    for id_processo, pasta in registradas.items():
+        if os.path.isdir(pasta):
+            continue
+        if id_processo in encontradas:
+            alteracoes.append((id_processo, encontradas[id_processo][0]))
+        else:
+            sem_pasta.append(id_processo)
+    religadas = len(alteracoes)
+    novas = [(id_processo, pasta) for id_processo, (pasta, mtime) in encontradas.items() if id_processo not in registradas]
+    alteracoes.extend(novas)
+    conn.executemany(f"INSERT OR REPLACE INTO {TABELA_PASTAS} (id_processo, pasta) VALUES (?, ?)", alteracoes)
+    return {'religadas': religadas, 'novas': len(novas), 'sem_pasta': sorted(sem_pasta)}
+
+
+# Uso: python -m modules.dispensa_eletronica.process_folders banco.db pasta_base
+def main():
+    import sqlite3
+    if len(sys.argv) != 3:
+        print("Uso: python -m modules.dispensa_eletronica.process_folders banco.db pasta_base")
+        return 2
+    with sqlite3.connect(sys.argv[1]) as conn:
+        resultado = reconciliar_pastas(conn, sys.argv[2])
+    print(f"Pastas religadas: {resultado['religadas']}, novas: {resultado['novas']}, sem pasta: {len(resultado['sem_pasta'])}")
+    for id_processo in resultado['sem_pasta']:
+        print(f"  {id_processo}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
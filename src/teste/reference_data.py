@@ -0,0 +1,239 @@
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+
+COLUNAS_OM = ['uasg', 'sigla_om', 'orgao_responsavel']
+
+SCHEMA_CONTROLE_OM = """
+    CREATE TABLE IF NOT EXISTS controle_om (
+        uasg TEXT PRIMARY KEY,
+        sigla_om TEXT,
+        orgao_responsavel TEXT
+    )
+"""
+
+# UASG gravada como número pelo antigo to_sql (787000 ou 787000.0) vira o texto '787000'
+UASG_NORMALIZADA_SQL = "CASE WHEN typeof(uasg) IN ('integer', 'real') THEN CAST(CAST(uasg AS INTEGER) AS TEXT) ELSE trim(uasg) END"
+
+
+def normalizar_uasg(serie):
+    # Planilhas trazem a UASG como int, float (787000.0) ou texto com espaços; o banco guarda texto
+    serie = pd.Series(serie, copy=False).astype('string').str.strip()
+    return serie.str.replace(r'\.0+$', '', regex=True).replace('', pd.NA)
+
+
+def garantir_tabela_om(conn):
+    # Cria a controle_om com uasg como chave primária; tabelas antigas (sem índice, recriadas pelo
+    # to_sql a cada importação) são migradas uma única vez
+    conn.execute(SCHEMA_CONTROLE_OM)
+    chave_primaria = [row[1] for row in conn.execute("PRAGMA table_info(controle_om)") if row[5]]
+    if chave_primaria == ['uasg']:
+        return
+    print("Migrando 'controle_om' para tabela indexada por uasg...")
+    conn.execute("DROP TABLE IF EXISTS controle_om_nova")
+    conn.execute(SCHEMA_CONTROLE_OM.replace("controle_om", "controle_om_nova"))
+    conn.execute(f"""
+        INSERT OR IGNORE INTO controle_om_nova (uasg, sigla_om, orgao_responsavel)
+        SELECT {UASG_NORMALIZADA_SQL}, sigla_om, orgao_responsavel FROM controle_om
+        WHERE uasg IS NOT NULL ORDER BY rowid
+    """)
+    conn.execute("DROP TABLE controle_om")
+    conn.execute("ALTER TABLE controle_om_nova RENAME TO controle_om")
+
+
+def ler_controle_om(conn):
+    df = pd.read_sql_query(f"SELECT {', '.join(COLUNAS_OM)} FROM controle_om", conn)
+    df['uasg'] = normalizar_uasg(df['uasg'])
+    df = df.dropna(subset=['uasg']).drop_duplicates(subset='uasg', keep='first')
+    df['sigla_om'] = df['sigla_om'].fillna('').astype(str)
+    df['orgao_responsavel'] = df['orgao_responsavel'].fillna('').astype(str)
+    return df.set_index('uasg')
+
+
+# Cópia em memória de uma tabela de referência, uma por banco. Cada alteração da tabela incrementa a
+# versão; a próxima leitura recarrega tudo com uma única consulta (_ler).
+class RegistroVersionado:
+    _instances = None
+    _instances_lock = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._instances = {}
+        cls._instances_lock = threading.Lock()
+
+    def __init__(self, connection_manager):
+        self.connection_manager = connection_manager
+        self.versao = 0
+        self._versao_carregada = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def instance(cls, connection_manager):
+        key = str(connection_manager.database_path)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(connection_manager)
+            return cls._instances[key]
+
+    @classmethod
+    def invalidar_todos(cls, connection_manager=None):
+        with cls._instances_lock:
+            registros = list(cls._instances.values())
+        for registro in registros:
+            if connection_manager is None or registro.connection_manager is connection_manager:
+                registro.invalidar()
+
+    def _carregar(self):
+        with self._lock:
+            if self._versao_carregada == self.versao:
+                return
+            with self.connection_manager.connection() as conn:
+                self._ler(conn)
+            self._versao_carregada = self.versao
+
+    def _ler(self, conn):
+        raise NotImplementedError
+
+    def invalidar(self):
+        with self._lock:
+            self.versao += 1
+
+
+# controle_om indexada por sigla_om e por uasg, mais o DataFrame tipado usado no enriquecimento
+class OMRegistry(RegistroVersionado):
+    def __init__(self, connection_manager):
+        super().__init__(connection_manager)
+        self._siglas = []
+        self._por_sigla = {}
+        self._por_uasg = {}
+        self._frame = None
+
+    def _ler(self, conn):
+        garantir_tabela_om(conn)
+        linhas = conn.execute(
+            "SELECT sigla_om, orgao_responsavel, uasg FROM controle_om ORDER BY sigla_om, rowid"
+        ).fetchall()
+        self._frame = ler_controle_om(conn)
+        self._por_sigla, self._por_uasg = {}, {}
+        for sigla, orgao, uasg in linhas:
+            detalhes = {'sigla_om': sigla, 'orgao_responsavel': orgao, 'uasg': uasg}
+            self._por_sigla.setdefault(sigla, detalhes)
+            self._por_uasg[uasg] = detalhes
+        self._siglas = list(self._por_sigla)
+
+    def siglas(self):
+        self._carregar()
+        return list(self._siglas)
+
+    def por_sigla(self, sigla):
+        self._carregar()
+        return self._por_sigla.get(sigla)
+
+    def por_uasg(self, uasg):
+        self._carregar()
+        return self._por_uasg.get(uasg)
+
+    def frame(self):
+        self._carregar()
+        return self._frame
+
+
+def carregar_controle_om(connection_manager):
+    return OMRegistry.instance(connection_manager).frame()
+
+
+def invalidar_controle_om(connection_manager=None):
+    OMRegistry.invalidar_todos(connection_manager)
+
+
+# Partições da controle_agentes_responsaveis pelo início da função, na ordem dos combos do EditDataDialog.
+# Quem não se encaixa em nenhuma vai para PARTICAO_DEMAIS (Responsável pela Demanda).
+FUNCOES_AGENTES = {
+    'ordenador_despesas': 'Ordenador de Despesa',
+    'agente_fiscal': 'Agente Fiscal',
+    'gerente_de_credito': 'Gerente de Crédito',
+    'operador': 'Operador',
+}
+PARTICAO_DEMAIS = 'responsavel_pela_demanda'
+
+
+def particao_agente(funcao):
+    funcao = (funcao or '').casefold()
+    for particao, prefixo in FUNCOES_AGENTES.items():
+        if funcao.startswith(prefixo.casefold()):
+            return particao
+    return PARTICAO_DEMAIS
+
+
+def texto_agente(agente):
+    return f"{agente['nome']}\n{agente['posto']}\n{agente['funcao']}"
+
+
+# controle_agentes_responsaveis lida uma vez e separada por categoria de função
+class AgentesRegistry(RegistroVersionado):
+    def __init__(self, connection_manager):
+        super().__init__(connection_manager)
+        self._particoes = {}
+
+    def _ler(self, conn):
+        existe = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='controle_agentes_responsaveis'"
+        ).fetchone()
+        if existe is None:
+            raise Exception("A tabela 'controle_agentes_responsaveis' não existe no banco de dados. Configure os Ordenadores de Despesa no Módulo 'Configurações'.")
+        self._particoes = {particao: [] for particao in [*FUNCOES_AGENTES, PARTICAO_DEMAIS]}
+        for nome, posto, funcao in conn.execute("SELECT nome, posto, funcao FROM controle_agentes_responsaveis ORDER BY rowid"):
+            agente = {'nome': nome, 'posto': posto, 'funcao': funcao}
+            self._particoes[particao_agente(funcao)].append(agente)
+
+    def particao(self, nome):
+        self._carregar()
+        return list(self._particoes.get(nome, []))
+
+
+def invalidar_agentes(connection_manager=None):
+    AgentesRegistry.invalidar_todos(connection_manager)
+
+
+# Substitui o conteúdo da controle_om pelo DataFrame (uasg, sigla_om, orgao_responsavel) gravando só a
+# diferença: remove as UASGs que saíram, insere as novas e atualiza as alteradas, em uma transação.
+def importar_controle_om(connection_manager, df):
+    from modules.dispensa_eletronica.bulk_upsert import bulk_upsert
+    df = df.reindex(columns=COLUNAS_OM).copy()
+    df['uasg'] = normalizar_uasg(df['uasg'])
+    df = df.dropna(subset=['uasg']).drop_duplicates(subset='uasg', keep='last')
+    with connection_manager.connection() as conn:
+        garantir_tabela_om(conn)
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        removidos = conn.execute(
+            "DELETE FROM controle_om WHERE uasg NOT IN (SELECT value FROM json_each(?))",
+            (json.dumps(df['uasg'].tolist()),)
+        ).rowcount
+        # bulk_upsert reaproveita a transação aberta; o commit do conjunto fica com connection()
+        resultado = bulk_upsert(conn, df, tabela="controle_om", colunas=COLUNAS_OM)
+    resultado['removidos'] = removidos
+    if removidos or resultado['inseridos'] or resultado['atualizados']:
+        invalidar_controle_om(connection_manager)
+    print(f"controle_om: {len(resultado['inseridos'])} inseridas, {len(resultado['atualizados'])} atualizadas, {removidos} removidas")
+    return resultado
+
+
+# Preenche sigla_om e orgao_responsavel com um único hash join contra a controle_om.
+# A planilha tem poucas UASGs distintas: normaliza e procura só os valores únicos (factorize) e
+# espalha o resultado pelos códigos. Altera o DataFrame no lugar e retorna as UASGs sem correspondência.
+def enriquecer_om(df, om):
+    codigos, unicos = pd.factorize(df['uasg'])
+    unicos = normalizar_uasg(pd.Series(unicos, dtype=object))
+    posicoes_unicos = om.index.get_indexer(unicos.fillna(''))
+    # Código -1 (UASG vazia) cai na posição extra, que nunca encontra OM
+    posicoes = np.append(posicoes_unicos, -1)[codigos]
+    # take() sobre os arrays do pandas evita materializar um objeto Python por linha
+    df['uasg'] = unicos.array.take(codigos, allow_fill=True)
+    for coluna in ('sigla_om', 'orgao_responsavel'):
+        valores = pd.concat([om[coluna], pd.Series([''], dtype=om[coluna].dtype)], ignore_index=True)
+        df[coluna] = valores.array.take(posicoes)
+    nao_encontradas = unicos[(posicoes_unicos < 0) & unicos.notna().to_numpy()]
+    return sorted(nao_encontradas.unique())
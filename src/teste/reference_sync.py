@@ -0,0 +1,105 @@
+import re
+import time
+
+import pandas as pd
+
+# Estrutura usada quando a tabela de referência ainda não existe no banco
+SCHEMA_AGENTES_RESPONSAVEIS = "CREATE TABLE controle_agentes_responsaveis (nome TEXT, posto TEXT, funcao TEXT)"
+
+# Colunas da planilha -> colunas da tabela, e largura de cada coluna na planilha exportada
+COLUNAS_PLANILHA_AGENTES = {"Nome": "nome", "Posto": "posto", "Função": "funcao"}
+LARGURAS_PLANILHA_AGENTES = [45, 30, 35]
+
+
+def _ms(inicio):
+    return round((time.perf_counter() - inicio) * 1000, 1)
+
+
+def _definicoes(conn, tabela):
+    # SQL de criação da tabela e dos seus índices, para recriá-los na tabela sombra
+    criacao = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (tabela,)).fetchone()
+    indices = [row[0] for row in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL", (tabela,))]
+    return (criacao[0] if criacao else None), indices
+
+
+# Carrega as linhas em uma tabela sombra com a mesma estrutura e troca pela original na mesma transação:
+# quem lê o banco vê a tabela antiga ou a nova, nunca uma tabela vazia ou pela metade.
+# A troca precisa de uma transação própria (BEGIN IMMEDIATE): não pode ser chamada com uma transação já
+# aberta na conexão da thread, que seria confirmada junto.
+def substituir_tabela(connection_manager, tabela, colunas, linhas, schema_padrao=None):
+    sombra = f"{tabela}_sombra"
+    tempos = {}
+    inicio = time.perf_counter()
+    if connection_manager.get_connection().in_transaction:
+        raise RuntimeError(f"Há uma transação aberta nesta thread; a tabela '{tabela}' não foi substituída.")
+    with connection_manager.connection(imediata=True) as conn:
+        criacao, indices = _definicoes(conn, tabela)
+        criacao = criacao or schema_padrao
+        if criacao is None:
+            raise ValueError(f"A tabela '{tabela}' não existe e não há estrutura padrão para criá-la.")
+        conn.execute(f"DROP TABLE IF EXISTS {sombra}")
+        conn.execute(re.sub(rf'\b{tabela}\b', sombra, criacao, count=1))
+        placeholders = ', '.join('?' for _ in colunas)
+        conn.executemany(f"INSERT INTO {sombra} ({', '.join(colunas)}) VALUES ({placeholders})", linhas)
+        tempos['carga_ms'] = _ms(inicio)
+        troca = time.perf_counter()
+        conn.execute(f"DROP TABLE IF EXISTS {tabela}")
+        conn.execute(f"ALTER TABLE {sombra} RENAME TO {tabela}")
+        for indice in indices:
+            conn.execute(indice)
+        tempos['troca_ms'] = _ms(troca)
+    tempos['total_ms'] = _ms(inicio)
+    tempos['linhas'] = len(linhas)
+    print(f"Tabela '{tabela}' substituída: {tempos}")
+    return tempos
+
+
+# Planilha gerada em uma única passada (openpyxl write-only), já com cabeçalho em negrito e larguras
+def exportar_planilha(caminho, cabecalhos, linhas, larguras=None):
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    from openpyxl.utils import get_column_letter
+
+    inicio = time.perf_counter()
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    # No modo write-only as larguras precisam ser definidas antes da primeira linha
+    for i, largura in enumerate(larguras or [], start=1):
+        sheet.column_dimensions[get_column_letter(i)].width = largura
+    negrito = Font(bold=True)
+    cabecalho = []
+    for texto in cabecalhos:
+        celula = WriteOnlyCell(sheet, value=texto)
+        celula.font = negrito
+        cabecalho.append(celula)
+    sheet.append(cabecalho)
+    total = 0
+    for linha in linhas:
+        sheet.append(list(linha))
+        total += 1
+    workbook.save(caminho)
+    tempos = {'linhas': total, 'total_ms': _ms(inicio)}
+    print(f"Planilha '{caminho}' exportada: {tempos}")
+    return tempos
+
+
+def importar_agentes(connection_manager, caminho):
+    inicio = time.perf_counter()
+    df = pd.read_excel(caminho, dtype=str)
+    leitura_ms = _ms(inicio)
+    if not all(column in df.columns for column in COLUNAS_PLANILHA_AGENTES):
+        raise Exception("O arquivo Excel deve conter as colunas: Nome, Posto, Função")
+    df = df[list(COLUNAS_PLANILHA_AGENTES)]
+    linhas = list(df.astype(object).where(pd.notna(df), None).itertuples(index=False, name=None))
+    tempos = substituir_tabela(connection_manager, "controle_agentes_responsaveis",
+                               list(COLUNAS_PLANILHA_AGENTES.values()), linhas, SCHEMA_AGENTES_RESPONSAVEIS)
+    tempos['leitura_ms'] = leitura_ms
+    return tempos
+
+
+def exportar_agentes(connection_manager, caminho):
+    with connection_manager.connection() as conn:
+        linhas = conn.execute("SELECT nome, posto, funcao FROM controle_agentes_responsaveis ORDER BY rowid").fetchall()
+    return exportar_planilha(caminho, list(COLUNAS_PLANILHA_AGENTES), linhas, LARGURAS_PLANILHA_AGENTES)
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+# Manifesto gravado na pasta do processo, ao lado dos documentos gerados
+NOME_MANIFESTO = ".render_cache.json"
+
+
+# Chave do documento gerado: sha256 do arquivo de template + valores das variáveis que o template usa.
+# Alterar um campo que o template não referencia não muda a chave.
+def chave_render(template_path, context):
+    from modules.dispensa_eletronica.template_cache import get_template_cache
+    sha256_template, variaveis = get_template_cache().assinatura(template_path)
+    usados = {nome: context.get(nome) for nome in sorted(variaveis)}
+    conteudo = json.dumps([sha256_template, usados], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+
+# Chave de um arquivo montado a partir de outros (ex.: PDF do pacote): caminho, tamanho e mtime das entradas
+def chave_arquivos(caminhos):
+    assinaturas = []
+    for caminho in caminhos:
+        info = os.stat(caminho)
+        assinaturas.append([str(caminho), info.st_size, info.st_mtime_ns])
+    return hashlib.sha256(json.dumps(assinaturas).encode('utf-8')).hexdigest()
+
+
+def _assinatura(caminho):
+    try:
+        info = os.stat(caminho)
+    except FileNotFoundError:
+        return None
+    return [info.st_size, info.st_mtime_ns]
+
+
+# Manifesto dos arquivos gerados em uma pasta de processo. Cada entrada (caminho relativo do .docx ou do
+# arquivo montado) guarda a chave usada na geração e tamanho/mtime das saídas; se o usuário alterar ou
+# apagar uma saída, a assinatura deixa de bater e o arquivo é gerado de novo.
+class RenderCache:
+    def __init__(self, pasta):
+        self.pasta = Path(pasta)
+        self.caminho = self.pasta / NOME_MANIFESTO
+        self._lock = threading.Lock()
+        self._alterado = False
+        try:
+            with open(self.caminho, 'r', encoding='utf-8') as arquivo:
+                self._entradas = json.load(arquivo)
+        except (FileNotFoundError, ValueError):
+            self._entradas = {}
+
+    def _relativo(self, caminho):
+        caminho = Path(caminho)
+        try:
+            return caminho.relative_to(self.pasta).as_posix()
+        except ValueError:
+            return str(caminho)
+
+    def valido(self, caminho, chave):
+        # True se o arquivo foi gerado com essa chave e não mudou desde então
+        with self._lock:
+            entrada = self._entradas.get(self._relativo(caminho))
+        return entrada is not None and entrada['chave'] == chave and entrada['arquivo'] == _assinatura(caminho)
+
+    def pdf_valido(self, docx_path):
+        # PDF convertido a partir do .docx atual (só vale se o .docx também não mudou)
+        with self._lock:
+            entrada = self._entradas.get(self._relativo(docx_path))
+        if entrada is None or entrada.get('pdf') is None or entrada['arquivo'] != _assinatura(docx_path):
+            return None
+        pdf_path = Path(docx_path).with_suffix('.pdf')
+        return pdf_path if entrada['pdf'] == _assinatura(pdf_path) else None
+
+    def registrar(self, caminho, chave):
+        with self._lock:
+            self._entradas[self._relativo(caminho)] = {'chave': chave, 'arquivo': _assinatura(caminho), 'pdf': None}
+            self._alterado = True
+
+    def registrar_pdf(self, docx_path, pdf_path):
+        with self._lock:
+            entrada = self._entradas.get(self._relativo(docx_path))
+            if entrada is not None:
+                entrada['pdf'] = _assinatura(pdf_path)
+                self._alterado = True
+
+    def salvar(self):
+        with self._lock:
+            if not self._alterado:
+                return
+            temporario = self.caminho.with_name(NOME_MANIFESTO + ".tmp")
+            with open(temporario, 'w', encoding='utf-8') as arquivo:
+                json.dump(self._entradas, arquivo, ensure_ascii=False, indent=1)
+            os.replace(temporario, self.caminho)
+            self._alterado = False
+
+
+# Gera o .docx a partir do template, ou reaproveita o existente se a chave não mudou.
+# Retorna (save_path, reaproveitado)
+def renderizar_com_cache(template_path, save_path, context, cache):
+    from modules.dispensa_eletronica.template_cache import obter_template
+    chave = chave_render(template_path, context)
+    if cache.valido(save_path, chave):
+        return Path(save_path), True
+    # Cópia do template já interpretado e compilado, mantido em cache enquanto o arquivo não mudar
+    doc = obter_template(template_path)
+    doc.render(context)
+    doc.save(str(save_path))
+    cache.registrar(save_path, chave)
+    cache.salvar()
+    return Path(save_path), False
+
+
+# Converte o .docx para PDF, ou reaproveita o PDF já convertido a partir do .docx atual
+def converter_com_cache(conversor, docx_path, cache):
+    pdf_path = cache.pdf_valido(docx_path)
+    if pdf_path is not None:
+        return pdf_path, True
+    pdf_path = conversor.converter_um(Path(docx_path))
+    cache.registrar_pdf(docx_path, pdf_path)
+    cache.salvar()
+    return pdf_path, False
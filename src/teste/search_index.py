@@ -0,0 +1,127 @@
+import logging
+import re
+import sqlite3
+
+TABELA_BUSCA = "controle_dispensas_fts"
+COLUNAS_BUSCA = ['objeto', 'nup', 'id_processo', 'sigla_om', 'setor_responsavel', 'justificativa', 'comentarios']
+
+# remove_diacritics 2: "licitacao" encontra "licitação" e vice-versa
+TOKENIZER = "unicode61 remove_diacritics 2"
+
+# Gravada em PRAGMA user_version; mudar colunas, tokenizer ou gatilhos exige incrementar para forçar a recriação
+VERSAO_INDICE = 2
+TABELA_ESTADO = f"{TABELA_BUSCA}_estado"
+GATILHOS = [f"{TABELA_BUSCA}_ai", f"{TABELA_BUSCA}_ad", f"{TABELA_BUSCA}_au"]
+
+
+def ensure_search_index(conn, tabela="controle_dispensas"):
+    # Índice FTS5 de conteúdo externo, mantido em sincronia com a tabela por gatilhos. A tabela tem chave
+    # VARCHAR, então o rowid usado como content_rowid não é estável: VACUUM e a migração da chave primária
+    # (ensure_id_processo_primary_key) podem renumerá-lo. Em vez do 'integrity-check' completo (O(N), ~1 s
+    # com 200 mil linhas) a abertura só compara um carimbo (linhas, maior rowid), mantido pelos próprios
+    # gatilhos, com a tabela. Gatilhos ausentes indicam que a tabela foi recriada (DROP TABLE os apaga junto).
+    existe = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (TABELA_BUSCA,)).fetchone()
+    gatilhos = conn.execute(
+        f"SELECT count(*) FROM sqlite_master WHERE type='trigger' AND name IN ({', '.join('?' for _ in GATILHOS)})",
+        GATILHOS,
+    ).fetchone()[0]
+    versao = conn.execute("PRAGMA user_version").fetchone()[0]
+    if existe and versao != VERSAO_INDICE:
+        logging.info("Estrutura do índice de busca mudou (versão %s -> %s); recriando", versao, VERSAO_INDICE)
+        for gatilho in GATILHOS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {gatilho}")
+        conn.execute(f"DROP TABLE IF EXISTS {TABELA_BUSCA}")
+        existe = None
+    colunas = ', '.join(COLUNAS_BUSCA)
+    novos = ', '.join(f"new.{col}" for col in COLUNAS_BUSCA)
+    antigos = ', '.join(f"old.{col}" for col in COLUNAS_BUSCA)
+
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {TABELA_BUSCA} USING fts5(
+            {colunas}, content='{tabela}', content_rowid='rowid',
+            tokenize='{TOKENIZER}', prefix='2 3'
+        )
+    """)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABELA_ESTADO} (
+            id INTEGER PRIMARY KEY CHECK (id = 1), linhas INTEGER NOT NULL, ultimo_rowid INTEGER NOT NULL
+        )
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {TABELA_BUSCA}_ai AFTER INSERT ON {tabela} BEGIN
+            INSERT INTO {TABELA_BUSCA}(rowid, {colunas}) VALUES (new.rowid, {novos});
+            UPDATE {TABELA_ESTADO} SET linhas = linhas + 1, ultimo_rowid = max(ultimo_rowid, new.rowid);
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {TABELA_BUSCA}_ad AFTER DELETE ON {tabela} BEGIN
+            INSERT INTO {TABELA_BUSCA}({TABELA_BUSCA}, rowid, {colunas}) VALUES ('delete', old.rowid, {antigos});
+            UPDATE {TABELA_ESTADO} SET linhas = linhas - 1,
+                ultimo_rowid = (SELECT coalesce(max(rowid), 0) FROM {tabela});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {TABELA_BUSCA}_au AFTER UPDATE ON {tabela} BEGIN
+            INSERT INTO {TABELA_BUSCA}({TABELA_BUSCA}, rowid, {colunas}) VALUES ('delete', old.rowid, {antigos});
+            INSERT INTO {TABELA_BUSCA}(rowid, {colunas}) VALUES (new.rowid, {novos});
+        END
+    """)
+    if not existe:
+        logging.info("Criando índice de busca '%s'", TABELA_BUSCA)
+        rebuild_search_index(conn, tabela)
+        conn.execute(f"PRAGMA user_version = {VERSAO_INDICE}")
+    elif gatilhos < len(GATILHOS):
+        logging.warning("Gatilhos do índice de busca ausentes; '%s' foi recriada, reconstruindo", tabela)
+        rebuild_search_index(conn, tabela)
+    elif not carimbo_confere(conn, tabela):
+        logging.warning("Índice de busca '%s' fora de sincronia com '%s'; reconstruindo", TABELA_BUSCA, tabela)
+        rebuild_search_index(conn, tabela)
+
+
+def _carimbo_atual(conn, tabela):
+    return tuple(conn.execute(f"SELECT count(*), coalesce(max(rowid), 0) FROM {tabela}").fetchone())
+
+
+def carimbo_confere(conn, tabela="controle_dispensas"):
+    # count(*) percorre só as páginas da tabela e max(rowid) é uma descida na árvore: milissegundos
+    carimbo = conn.execute(f"SELECT linhas, ultimo_rowid FROM {TABELA_ESTADO} WHERE id = 1").fetchone()
+    return carimbo is not None and tuple(carimbo) == _carimbo_atual(conn, tabela)
+
+
+def search_index_ok(conn):
+    # Conferência completa, O(N): 'integrity-check' com rank 1 compara o índice com o conteúdo atual da
+    # tabela externa. Não roda na abertura; fica para diagnóstico ou para uma verificação em segundo plano.
+    try:
+        conn.execute(f"INSERT INTO {TABELA_BUSCA}({TABELA_BUSCA}, rank) VALUES ('integrity-check', 1)")
+        return True
+    except sqlite3.DatabaseError:
+        return False
+
+
+def rebuild_search_index(conn, tabela="controle_dispensas"):
+    conn.execute(f"INSERT INTO {TABELA_BUSCA}({TABELA_BUSCA}) VALUES ('rebuild')")
+    conn.execute(f"INSERT OR REPLACE INTO {TABELA_ESTADO} (id, linhas, ultimo_rowid) VALUES (1, ?, ?)",
+                 _carimbo_atual(conn, tabela))
+
+
+def build_match_expression(texto):
+    # Cada palavra digitada vira um prefixo entre aspas; o FTS5 combina os termos com AND
+    termos = re.findall(r"\w+", texto)
+    return ' '.join(f'"{termo}"*' for termo in termos)
+
+
+def search_ids(conn, texto, tabela="controle_dispensas", limite=None):
+    expressao = build_match_expression(texto)
+    if not expressao:
+        return []
+    sql = f"""
+        SELECT d.id_processo FROM {TABELA_BUSCA} f
+        JOIN {tabela} d ON d.rowid = f.rowid
+        WHERE {TABELA_BUSCA} MATCH ?
+        ORDER BY f.rank
+    """
+    params = [expressao]
+    if limite:
+        sql += " LIMIT ?"
+        params.append(limite)
+    return [row[0] for row in conn.execute(sql, params)]
@@ -4,6 +4,10 @@ from PyQt6.QtCore import *
 from PyQt6.QtSql import QSqlDatabase, QSqlTableModel, QSqlQuery
 from modules.planejamento.utilidades_planejamento import carregar_dados_dispensa
 from modules.dispensa_eletronica.edit_dialog import EditDataDialog
+from modules.dispensa_eletronica.connection_manager import get_connection_manager
+from modules.dispensa_eletronica.lazy_table_model import LazySqlTableModel
+from modules.dispensa_eletronica.search_index import ensure_search_index
+from modules.dispensa_eletronica.lazy_table_model import ALTERACAO_ATUALIZACAO
 from functools import partial
 
 class CustomTableView(QTableView):
@@ -27,6 +31,7 @@ class TableMenu(QMenu):
         self.index = index
         self.model = model
         self.config_manager = config_manager
+        self.id_processo = None
         self.setup_menu_style()
         self.add_menu_actions()
 
@@ -68,6 +73,7 @@ class TableMenu(QMenu):
             source_index = self.model.mapToSource(self.index)
             # Assumindo que a chave primária é a primeira coluna do modelo
             id_processo = self.model.data(self.model.index(source_index.row(), 0))  
+            self.id_processo = id_processo
             df_registro_selecionado = carregar_dados_dispensa(id_processo, str(self.main_app.database_path))
             if not df_registro_selecionado.empty:
                 self.perform_action(actionText, df_registro_selecionado)
@@ -85,7 +91,8 @@ class TableMenu(QMenu):
 
     def atualizar_interface(self):
         print("Interface atualizada com os novos dados.")
-        self.main_app.refresh_model() 
+        # Atualiza apenas a linha editada em vez de reler a tabela inteira
+        self.main_app.dataUpdated.emit({self.id_processo: ALTERACAO_ATUALIZACAO} if self.id_processo else {})
 
     def editar_dados(self, df_registro_selecionado):
         dialog = EditDataDialog(df_registro_selecionado, self.main_app.icons_dir)
@@ -116,15 +123,15 @@ class SqlModel:
         self.init_database()
 
     def init_database(self):
-        if QSqlDatabase.contains("my_conn"):
-            QSqlDatabase.removeDatabase("my_conn")
-        self.db = QSqlDatabase.addDatabase('QSQLITE', "my_conn")
-        self.db.setDatabaseName(str(self.database_manager.db_path))
-        if not self.db.open():
+        # Reaproveita a conexão Qt já aberta pelo gerenciador em vez de recriar "my_conn" a cada modelo
+        self.db = get_connection_manager(self.database_manager.db_path).qt_database()
+        if not self.db.isOpen():
             print("Não foi possível abrir a conexão com o banco de dados.")
         else:
             print("Conexão com o banco de dados aberta com sucesso.")
             self.adjust_table_structure()
+            with get_connection_manager(self.database_manager.db_path).connection() as conn:
+                ensure_search_index(conn)
 
     def adjust_table_structure(self):
         query = QSqlQuery(self.db)
@@ -213,10 +220,12 @@ class SqlModel:
 
 
     def setup_model(self, table_name, editable=False):
-        self.model = CustomSqlTableModel(parent=self.parent, db=self.db, non_editable_columns=[4, 8, 10, 13])
-        self.model.setTable(table_name)
-        if editable:
-            self.model.setEditStrategy(QSqlTableModel.EditStrategy.OnFieldChange)
+        # Modelo paginado: carrega apenas as janelas de linhas exibidas em vez da tabela inteira
+        non_editable_columns = [4, 8, 10, 13]
+        connection_manager = get_connection_manager(self.database_manager.db_path)
+        self.model = LazySqlTableModel(connection_manager, table_name, parent=self.parent, non_editable_columns=non_editable_columns)
+        if not editable:
+            self.model.non_editable_columns = list(range(self.model.columnCount()))
         self.model.select()
         return self.model
 
@@ -0,0 +1,219 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.package import Unmarshaller
+from docx.opc.part import Part, PartFactory, XmlPart
+from docx.opc.pkgreader import PackageReader
+from docx.oxml.parser import parse_xml
+from docx.package import Package
+from docxtpl import DocxTemplate
+from jinja2 import Environment, meta
+
+# Tipo das partes de notas de rodapé, também renderizadas pelo DocxTemplate
+TIPO_NOTAS_RODAPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.footnotes+xml"
+
+# Templates mantidos em memória; o menos usado recentemente sai quando o limite é atingido
+TAMANHO_CACHE_TEMPLATES = 16
+
+
+# XmlPart cujo XML só é interpretado no primeiro acesso; até lá blob devolve os bytes lidos do .docx.
+# Partes que o render não toca (estilos, numeração, tema, configurações...) são gravadas sem nunca
+# passar pelo parser, e são elas que dominam o custo de abrir um template.
+class _ParteAdiada:
+    def __init__(self, partname, content_type, blob, package):
+        Part.__init__(self, partname, content_type, package=package)
+        self._bytes = blob
+        self._elemento = None
+
+    @property
+    def _element(self):
+        if self._elemento is None:
+            self._elemento = parse_xml(self._bytes)
+        return self._elemento
+
+    @_element.setter
+    def _element(self, elemento):
+        self._elemento = elemento
+
+    @property
+    def blob(self):
+        if self._elemento is None:
+            return self._bytes
+        return super().blob
+
+
+_classes_adiadas = {}
+
+
+def _fabrica_adiada(partname, content_type, reltype, blob, package):
+    classe = PartFactory._part_cls_for(content_type)
+    if reltype == RT.IMAGE or not issubclass(classe, XmlPart):
+        return PartFactory(partname, content_type, reltype, blob, package)
+    adiada = _classes_adiadas.get(classe)
+    if adiada is None:
+        adiada = _classes_adiadas[classe] = type(f"{classe.__name__}Adiada", (_ParteAdiada, classe), {})
+    return adiada(partname, content_type, blob, package)
+
+
+def _abrir_documento(leitor, fabrica=PartFactory):
+    # Equivale a docx.Document(), mas a partir das partes já lidas do zip
+    package = Package()
+    Unmarshaller.unmarshal(leitor, package, fabrica)
+    return package.main_document_part.document
+
+
+# Ambiente Jinja que compila cada XML uma única vez: as cópias de um mesmo template mandam sempre o
+# mesmo texto, então a compilação (a etapa mais cara do render) só acontece na primeira geração
+class _AmbienteCompilado(Environment):
+    def __init__(self):
+        super().__init__()
+        self._compilados = {}
+
+    def from_string(self, source, globals=None, template_class=None):
+        if globals is not None or template_class is not None:
+            return super().from_string(source, globals, template_class)
+        template = self._compilados.get(source)
+        if template is None:
+            template = self._compilados[source] = super().from_string(source)
+        return template
+
+
+# DocxTemplate que guarda o XML já tratado pelo patch_xml de cada parte (corpo, cabeçalhos e rodapés)
+# e reaproveita os templates Jinja compilados. As cópias compartilham esses caches com o mestre.
+class TemplateCompilado(DocxTemplate):
+    def __init__(self, template_file, fontes=None, ambiente=None):
+        super().__init__(template_file)
+        self._fontes = {} if fontes is None else fontes
+        self._ambiente = _AmbienteCompilado() if ambiente is None else ambiente
+        self.sha256 = None
+        self._variaveis = None
+        self._leitor = None
+
+    def _fonte(self, parte, gerar):
+        chave = str(parte.partname)
+        fonte = self._fontes.get(chave)
+        if fonte is None:
+            fonte = self._fontes[chave] = gerar()
+        return fonte
+
+    def _fonte_corpo(self):
+        return self._fonte(self.docx._part, lambda: self.patch_xml(self.get_xml()))
+
+    def _fonte_cabecalho_rodape(self, part):
+        def gerar():
+            xml = self.get_part_xml(part)
+            return self.get_headers_footers_encoding(xml), self.patch_xml(xml)
+        return self._fonte(part, gerar)
+
+    def build_xml(self, context, jinja_env=None):
+        return self.render_xml_part(self._fonte_corpo(), self.docx._part, context, jinja_env)
+
+    def build_headers_footers_xml(self, context, uri, jinja_env=None):
+        for relKey, part in self.get_headers_footers(uri):
+            encoding, xml = self._fonte_cabecalho_rodape(part)
+            xml = self.render_xml_part(xml, part, context, jinja_env)
+            yield relKey, xml.encode(encoding)
+
+    def render(self, context, jinja_env=None, autoescape=False):
+        # autoescape altera o ambiente recebido; nesse caso segue o caminho normal, sem o cache
+        if jinja_env is None and not autoescape:
+            jinja_env = self._ambiente
+        super().render(context, jinja_env, autoescape)
+
+    def variaveis(self):
+        # Variáveis do contexto usadas pelo template (corpo, cabeçalhos, rodapés, notas e propriedades).
+        # Chamado só no mestre, que nunca é renderizado
+        if self._variaveis is None:
+            fontes = [self._fonte_corpo()]
+            for uri in (self.HEADER_URI, self.FOOTER_URI):
+                for relKey, part in self.get_headers_footers(uri):
+                    fontes.append(self._fonte_cabecalho_rodape(part)[1])
+            for part in self.docx.part.package.parts:
+                if part.content_type == TIPO_NOTAS_RODAPE:
+                    blob = part.blob
+                    fontes.append(self.patch_xml(blob.decode('utf-8') if isinstance(blob, bytes) else blob))
+            propriedades = self.docx.core_properties
+            for nome in ('author', 'comments', 'identifier', 'language', 'subject', 'title'):
+                fontes.append(getattr(propriedades, nome) or '')
+            variaveis = set()
+            for fonte in fontes:
+                variaveis |= meta.find_undeclared_variables(self._ambiente.parse(fonte))
+            self._variaveis = frozenset(variaveis)
+        return self._variaveis
+
+    def copia(self):
+        # Documento novo montado a partir das partes já extraídas do zip, com parse adiado: só o corpo,
+        # cabeçalhos, rodapés e propriedades, que o render lê, são interpretados
+        nova = TemplateCompilado(self.template_file, self._fontes, self._ambiente)
+        nova.docx = _abrir_documento(self._leitor, _fabrica_adiada)
+        return nova
+
+
+class TemplateCache:
+    def __init__(self, tamanho=TAMANHO_CACHE_TEMPLATES):
+        self.tamanho = tamanho
+        self._mestres = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+
+    def _mestre(self, caminho):
+        chave = str(Path(caminho).resolve())
+        info = os.stat(chave)
+        assinatura = (info.st_mtime_ns, info.st_size)
+        with self._lock:
+            entrada = self._mestres.get(chave)
+            if entrada is not None and entrada[0] == assinatura:
+                self._mestres.move_to_end(chave)
+                self.acertos += 1
+                return entrada[1]
+        # Template novo ou alterado no disco: carrega fora do lock e substitui a versão antiga
+        with open(chave, 'rb') as arquivo:
+            conteudo = arquivo.read()
+        mestre = TemplateCompilado(chave)
+        mestre._leitor = PackageReader.from_file(io.BytesIO(conteudo))
+        mestre.docx = _abrir_documento(mestre._leitor)
+        mestre.sha256 = hashlib.sha256(conteudo).hexdigest()
+        with self._lock:
+            self.faltas += 1
+            self._mestres[chave] = (assinatura, mestre)
+            self._mestres.move_to_end(chave)
+            while len(self._mestres) > self.tamanho:
+                self._mestres.popitem(last=False)
+        return mestre
+
+    def obter(self, caminho):
+        # Cada chamada recebe uma cópia própria para renderizar; o mestre nunca é alterado
+        return self._mestre(caminho).copia()
+
+    def assinatura(self, caminho):
+        # (sha256 do arquivo, variáveis usadas) do template atual, sem gerar cópia
+        mestre = self._mestre(caminho)
+        return mestre.sha256, mestre.variaveis()
+
+    def invalidar(self, caminho=None):
+        with self._lock:
+            if caminho is None:
+                self._mestres.clear()
+            else:
+                self._mestres.pop(str(Path(caminho).resolve()), None)
+
+    def stats(self):
+        with self._lock:
+            return {'templates': len(self._mestres), 'acertos': self.acertos, 'faltas': self.faltas}
+
+
+_template_cache = TemplateCache()
+
+
+def obter_template(caminho):
+    return _template_cache.obter(caminho)
+
+
+def get_template_cache():
+    return _template_cache
@@ -0,0 +1,111 @@
+import atexit
+import hashlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import fitz
+from PyQt6.QtCore import *
+
+# Lado maior, em pixels, da miniatura da primeira página
+LADO_MINIATURA = 160
+
+TAMANHO_POOL_MINIATURAS = min(2, os.cpu_count() or 1)
+
+
+def pasta_cache_miniaturas():
+    pasta = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.CacheLocation)
+    return Path(pasta or Path.home() / ".cache") / "miniaturas"
+
+
+# Chave da miniatura: caminho, tamanho e mtime do PDF (e o lado pedido). Se o arquivo for substituído
+# ou alterado, a chave muda e a miniatura antiga simplesmente deixa de ser usada
+def chave_miniatura(pdf_path, lado=LADO_MINIATURA):
+    info = os.stat(pdf_path)
+    conteudo = f"{Path(pdf_path).resolve()}|{info.st_size}|{info.st_mtime_ns}|{lado}"
+    return hashlib.sha1(conteudo.encode('utf-8')).hexdigest()
+
+
+def caminho_miniatura(pasta_cache, chave):
+    return Path(pasta_cache) / chave[:2] / f"{chave}.png"
+
+
+# Executado nos processos do pool: renderiza a primeira página e grava o PNG no cache
+def gerar_miniatura(pdf_path, destino, lado=LADO_MINIATURA):
+    with fitz.open(pdf_path) as documento:
+        page = documento.load_page(0)
+        escala = lado / max(page.rect.width, page.rect.height, 1)
+        png = page.get_pixmap(matrix=fitz.Matrix(escala, escala), alpha=False).tobytes("png")
+    destino = Path(destino)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    temporario = destino.with_name(f"{destino.name}.{os.getpid()}.tmp")
+    with open(temporario, 'wb') as arquivo:
+        arquivo.write(png)
+    os.replace(temporario, destino)
+    return str(destino)
+
+
+_pool_miniaturas = None
+_pool_lock = threading.Lock()
+
+
+def get_pool_miniaturas():
+    global _pool_miniaturas
+    with _pool_lock:
+        if _pool_miniaturas is None:
+            _pool_miniaturas = ProcessPoolExecutor(max_workers=TAMANHO_POOL_MINIATURAS)
+            atexit.register(_pool_miniaturas.shutdown, wait=False, cancel_futures=True)
+        return _pool_miniaturas
+
+
+# Miniaturas dos anexos para a árvore do PDFAddDialog. solicitar() devolve o PNG do cache em disco na
+# hora ou agenda a geração no pool e avisa por miniaturaPronta(pdf, png) quando ficar pronta.
+class ThumbnailService(QObject):
+    miniaturaPronta = pyqtSignal(str, str)
+
+    def __init__(self, parent=None, pasta_cache=None, lado=LADO_MINIATURA, pool=None):
+        super().__init__(parent)
+        self.pasta_cache = Path(pasta_cache) if pasta_cache else pasta_cache_miniaturas()
+        self.lado = lado
+        self.pool = pool
+        self._pendentes = {}
+        self._lock = threading.Lock()
+        self._ativo = True
+
+    def solicitar(self, pdf_path):
+        pdf_path = str(pdf_path)
+        try:
+            chave = chave_miniatura(pdf_path, self.lado)
+        except OSError as e:
+            print(f"Erro ao gerar miniatura de {pdf_path}: {e}")
+            return None
+        destino = caminho_miniatura(self.pasta_cache, chave)
+        if destino.exists():
+            return str(destino)
+        with self._lock:
+            if chave in self._pendentes:
+                return None
+            pool = self.pool or get_pool_miniaturas()
+            futuro = pool.submit(gerar_miniatura, pdf_path, str(destino), self.lado)
+            self._pendentes[chave] = futuro
+        futuro.add_done_callback(lambda futuro: self._concluida(chave, pdf_path, futuro))
+        return None
+
+    def _concluida(self, chave, pdf_path, futuro):
+        # Chamado na thread do pool; o sinal é entregue na thread da interface
+        if futuro.cancelled():
+            return
+        erro = futuro.exception()
+        if erro is not None:
+            print(f"Erro ao gerar miniatura de {pdf_path}: {erro}")
+        with self._lock:
+            self._pendentes.pop(chave, None)
+            if self._ativo and erro is None:
+                self.miniaturaPronta.emit(pdf_path, futuro.result())
+
+    def parar(self):
+        with self._lock:
+            self._ativo = False
+            for futuro in self._pendentes.values():
+                futuro.cancel()
@@ -1,28 +1,235 @@
 from PyQt6.QtWidgets import *
 from PyQt6.QtGui import *
 from PyQt6.QtCore import *
+from pathlib import Path
 import pandas as pd
+import csv
+import json
+from modules.dispensa_eletronica.bulk_upsert import bulk_upsert
+from modules.dispensa_eletronica.reference_data import carregar_controle_om, enriquecer_om
 
+# Formatos colunares lidos pelo front-end em Rust
+FORMATOS_COLUNARES = ('.parquet', '.arrow', '.feather')
+
+# Linhas lidas do banco e gravadas no arquivo a cada iteração
+TAMANHO_LOTE_EXPORTACAO = 1000
+
+# Linhas da planilha validadas e gravadas por transação durante a importação
+TAMANHO_LOTE_IMPORTACAO = 2000
+
+COLUNAS_OBRIGATORIAS = {'ID Processo': 'id_processo', 'NUP': 'nup', 'Objeto': 'objeto', 'UASG': 'uasg'}
+
+# Exporta a tabela direto do banco (snapshot somente leitura), sem tocar no modelo da interface.
+# colunas: nomes das colunas do banco na ordem desejada (None = todas)
+# cabecalhos: títulos correspondentes no arquivo (None = nomes das colunas)
+# chaves: lista de id_processo a exportar, na ordem da visão (None = tabela inteira)
 class ExportThread(QThread):
     finished = pyqtSignal(str)
+    progress = pyqtSignal(int, int)  # linhas gravadas, total
 
-    def __init__(self, model, filepath):
+    def __init__(self, connection_manager, filepath, colunas=None, cabecalhos=None, chaves=None,
+                 tabela="controle_dispensas", chave="id_processo", tamanho_lote=TAMANHO_LOTE_EXPORTACAO):
         super().__init__()
-        self.model = model
-        self.filepath = filepath
+        self.connection_manager = connection_manager
+        self.filepath = Path(filepath)
+        self.colunas = colunas
+        self.cabecalhos = cabecalhos
+        self.chaves = chaves
+        self.tabela = tabela
+        self.chave = chave
+        self.tamanho_lote = tamanho_lote
 
     def run(self):
         try:
-            df = self.model_to_dataframe(self.model)
-            df.to_excel(self.filepath, index=False)
-            self.finished.emit('Completed successfully!')
+            with self.connection_manager.snapshot() as conn:
+                if self.filepath.suffix.lower() in FORMATOS_COLUNARES:
+                    gravadas = self.gravar_colunar(conn)
+                else:
+                    gravadas = self.gravar_planilha(conn)
+            if gravadas is None:
+                self.finished.emit("Cancelled: exportação interrompida pelo usuário.")
+            else:
+                self.finished.emit(f"Completed successfully! {gravadas} linhas exportadas.")
         except Exception as e:
             self.finished.emit(f"Failed: {str(e)}")
 
-    def model_to_dataframe(self, model):
-        headers = [model.headerData(i, Qt.Orientation.Horizontal) for i in range(model.columnCount())]
-        data = [
-            [model.data(model.index(row, col)) for col in range(model.columnCount())]
-            for row in range(model.rowCount())
-        ]
-        return pd.DataFrame(data, columns=headers)
\ No newline at end of file
+    def consultar(self, conn, colunas):
+        lista_colunas = ', '.join(f"t.{col}" for col in colunas)
+        if self.chaves is None:
+            total = conn.execute(f"SELECT COUNT(*) FROM {self.tabela}").fetchone()[0]
+            cursor = conn.execute(f"SELECT {lista_colunas} FROM {self.tabela} t ORDER BY t.{self.chave}")
+        else:
+            # json_each mantém a ordem da lista recebida (ex.: ranking da busca)
+            total = len(self.chaves)
+            cursor = conn.execute(f"""
+                SELECT {lista_colunas} FROM json_each(?) j
+                JOIN {self.tabela} t ON t.{self.chave} = j.value
+                ORDER BY j.key
+            """, (json.dumps(self.chaves),))
+        return cursor, total
+
+    def lotes(self, cursor):
+        while not self.isInterruptionRequested():
+            linhas = cursor.fetchmany(self.tamanho_lote)
+            if not linhas:
+                return
+            yield linhas
+
+    # Os métodos gravar_* retornam o número de linhas gravadas, ou None se a exportação foi cancelada
+    def gravar_planilha(self, conn):
+        colunas = self.colunas or [row[1] for row in conn.execute(f"PRAGMA table_info({self.tabela})")]
+        cabecalhos = self.cabecalhos or colunas
+        cursor, total = self.consultar(conn, colunas)
+        gravadas = 0
+        if self.filepath.suffix.lower() == '.csv':
+            with open(self.filepath, 'w', newline='', encoding='utf-8-sig') as arquivo:
+                writer = csv.writer(arquivo, delimiter=';')
+                writer.writerow(cabecalhos)
+                for linhas in self.lotes(cursor):
+                    writer.writerows(linhas)
+                    gravadas += len(linhas)
+                    self.progress.emit(gravadas, total)
+            # O CSV é gravado aos poucos: cancelado no meio, o arquivo parcial é apagado
+            if self.isInterruptionRequested():
+                self.filepath.unlink(missing_ok=True)
+                return None
+        else:
+            from openpyxl import Workbook
+            # Modo write-only: as linhas vão direto para o arquivo, sem manter a planilha em memória
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet("Dispensa Eletrônica")
+            sheet.append(cabecalhos)
+            for linhas in self.lotes(cursor):
+                for linha in linhas:
+                    sheet.append(linha)
+                gravadas += len(linhas)
+                self.progress.emit(gravadas, total)
+            # Cancelamento só é conferido antes de salvar: um arquivo já salvo não é descartado
+            if self.isInterruptionRequested():
+                return None
+            workbook.save(self.filepath)
+        return gravadas
+
+    def gravar_colunar(self, conn):
+        from modules.dispensa_eletronica.columnar_export import (
+            ler_esquema, ler_dicionarios, consultar_colunar, escrever_parquet, escrever_arrow
+        )
+        # Arquivo de intercâmbio com o app em Rust: sempre a tabela inteira, com os nomes originais das colunas
+        esquema = ler_esquema(conn, self.tabela)
+        total = conn.execute(f"SELECT COUNT(*) FROM {self.tabela}").fetchone()[0]
+        lotes = self.lotes(consultar_colunar(conn, self.tabela, esquema, self.chave))
+        progresso = lambda gravadas: self.progress.emit(gravadas, total)
+        if self.filepath.suffix.lower() == '.parquet':
+            return escrever_parquet(self.filepath, esquema, lotes, progresso, self.isInterruptionRequested)
+        dicionarios = ler_dicionarios(conn, self.tabela, esquema)
+        return escrever_arrow(self.filepath, esquema, lotes, dicionarios, progresso, self.isInterruptionRequested)
+
+
+def _texto(valor):
+    # Células numéricas do Excel (ex.: UASG 787000.0) voltam como texto sem a parte decimal
+    if valor is None:
+        return None
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+def _contar_linhas_csv(filepath):
+    with open(filepath, 'rb') as arquivo:
+        return max(sum(1 for _ in arquivo) - 1, 0)
+
+
+# Lê a planilha em blocos de linhas; gera (DataFrame do bloco, total de linhas ou 0 se desconhecido)
+def ler_planilha_em_lotes(filepath, tamanho_lote=TAMANHO_LOTE_IMPORTACAO):
+    filepath = Path(filepath)
+    sufixo = filepath.suffix.lower()
+    if sufixo == '.csv':
+        total = _contar_linhas_csv(filepath)
+        for df in pd.read_csv(filepath, sep=None, engine='python', dtype=str, encoding='utf-8-sig', chunksize=tamanho_lote):
+            yield df, total
+    elif sufixo == '.xlsx':
+        from openpyxl import load_workbook
+        # Modo read-only: as linhas são lidas do arquivo sob demanda, sem carregar a planilha inteira
+        workbook = load_workbook(filepath, read_only=True, data_only=True)
+        try:
+            sheet = workbook.worksheets[0]
+            linhas = sheet.iter_rows(values_only=True)
+            cabecalho = [_texto(valor) for valor in next(linhas, ())]
+            total = max((sheet.max_row or 1) - 1, 0)
+            lote = []
+            for linha in linhas:
+                if any(valor is not None for valor in linha):
+                    lote.append([_texto(valor) for valor in linha])
+                if len(lote) >= tamanho_lote:
+                    yield pd.DataFrame(lote, columns=cabecalho), total
+                    lote = []
+            if lote:
+                yield pd.DataFrame(lote, columns=cabecalho), total
+        finally:
+            workbook.close()
+    else:
+        # .xls e .ods não têm leitor em streaming: carrega uma vez e entrega em fatias
+        df = pd.read_excel(filepath, dtype=str)
+        for inicio in range(0, len(df), tamanho_lote):
+            yield df.iloc[inicio:inicio + tamanho_lote].copy(), len(df)
+
+
+def desmembramento_id_processo(df):
+    df[['tipo', 'numero', 'ano']] = df['id_processo'].str.extract(r'(\D+)(\d+)/(\d+)')
+    df['tipo'] = df['tipo'].map({'DE ': 'Dispensa Eletrônica'}).fillna('Tipo Desconhecido')
+
+
+# Retorna as UASGs da planilha que não constam da controle_om
+def validate_and_process_data(df, om):
+    if not all(col in df.columns for col in COLUNAS_OBRIGATORIAS):
+        missing_columns = [col for col in COLUNAS_OBRIGATORIAS if col not in df.columns]
+        raise ValueError(f"Faltando: {', '.join(missing_columns)}")
+    df.rename(columns=COLUNAS_OBRIGATORIAS, inplace=True)
+    df.dropna(subset=['id_processo'], inplace=True)
+    desmembramento_id_processo(df)
+    df['situacao'] = 'Planejamento'
+    return enriquecer_om(df, om)
+
+
+# Importa a planilha em blocos fora da thread da interface. Cada bloco é validado, enriquecido e gravado
+# em uma transação própria; o cancelamento só é atendido entre blocos, então o banco nunca fica com um
+# bloco pela metade.
+class ImportThread(QThread):
+    finished = pyqtSignal(str)
+    progress = pyqtSignal(int, int)  # linhas lidas, total (0 = desconhecido)
+
+    def __init__(self, connection_manager, filepath, tamanho_lote=TAMANHO_LOTE_IMPORTACAO):
+        super().__init__()
+        self.connection_manager = connection_manager
+        self.filepath = filepath
+        self.tamanho_lote = tamanho_lote
+        self.resultado = {'inseridos': [], 'atualizados': [], 'inalterados': 0, 'lotes': 0, 'uasg_sem_om': []}
+
+    def run(self):
+        lidas = 0
+        try:
+            conn = self.connection_manager.get_connection()
+            om = carregar_controle_om(self.connection_manager)
+            uasg_sem_om = set()
+            for df, total in ler_planilha_em_lotes(self.filepath, self.tamanho_lote):
+                if self.isInterruptionRequested():
+                    break
+                lidas += len(df)
+                uasg_sem_om.update(validate_and_process_data(df, om))
+                resultado_lote = bulk_upsert(conn, df)
+                self.resultado['inseridos'] += resultado_lote['inseridos']
+                self.resultado['atualizados'] += resultado_lote['atualizados']
+                self.resultado['inalterados'] += resultado_lote['inalterados']
+                self.resultado['lotes'] += 1
+                self.progress.emit(lidas, max(total, lidas))
+            self.resultado['uasg_sem_om'] = sorted(uasg_sem_om)
+            if uasg_sem_om:
+                print(f"UASGs sem correspondência na controle_om ({len(uasg_sem_om)}): {', '.join(sorted(uasg_sem_om))}")
+            if self.isInterruptionRequested():
+                self.finished.emit(f"Cancelled: importação interrompida após {lidas} linhas.")
+            else:
+                self.finished.emit(f"Completed successfully! {lidas} linhas importadas.")
+        except Exception as e:
+            self.finished.emit(f"Failed: {str(e)}")
+        finally:
+            self.connection_manager.release_thread()